@@ -4,7 +4,7 @@
 modname = 'snapview'
 distname = 'cubicweb-snapview'
 
-numversion = (0, 1, 0)
+numversion = (0, 2, 0)
 version = '.'.join(str(num) for num in numversion)
 
 license = 'LGPL'
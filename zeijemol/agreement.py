@@ -0,0 +1,309 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Inter-rater agreement statistics of a wave.
+
+The answers of a wave are stored as a sparse (snapset x rater) matrix in
+coordinate format, and the Fleiss' kappa, the pairwise Cohen's kappas and
+the per-snapset disagreements are computed with NumPy array operations.
+"""
+
+# System import
+from __future__ import division
+import numpy
+
+# Zeijemol import
+from cubes.zeijemol.columnar import Dictionary
+from cubes.zeijemol.queries import iter_by_eid
+
+
+class AnswerMatrix(object):
+    """ A sparse (snapset x rater) matrix of answer codes.
+
+    Attributes
+    ----------
+    snapsets, raters, answers: array of int
+        the snapset, rater and answer codes of each score.
+    snapset_labels, rater_labels, answer_labels: list
+        the values indexed by code.
+    """
+    def __init__(self, snapsets, raters, answers, snapset_labels,
+                 rater_labels, answer_labels):
+        """ Initialize the matrix from the scores codes.
+        """
+        self.snapsets = numpy.asarray(snapsets, dtype=numpy.intp)
+        self.raters = numpy.asarray(raters, dtype=numpy.intp)
+        self.answers = numpy.asarray(answers, dtype=numpy.intp)
+        self.snapset_labels = snapset_labels
+        self.rater_labels = rater_labels
+        self.answer_labels = answer_labels
+
+    @classmethod
+    def from_scores(cls, scores, answer_labels=None):
+        """ Build the matrix from the scores.
+
+        Parameters
+        ----------
+        scores: iterable of 3-uplet
+            the snapset, the rater and the answer of each score.
+        answer_labels: list (optional, default None)
+            the expected answers, the other answers are appended in order of
+            first appearance.
+
+        Returns
+        -------
+        matrix: AnswerMatrix
+            the answer matrix.
+        """
+        dictionaries = [Dictionary(), Dictionary(), Dictionary()]
+        for answer in answer_labels or []:
+            dictionaries[2].encode(answer)
+        codes = [[], [], []]
+        for score in scores:
+            for index, value in enumerate(score):
+                codes[index].append(dictionaries[index].encode(value))
+        return cls(*(codes + [dictionary.values
+                              for dictionary in dictionaries]))
+
+    @property
+    def shape(self):
+        """ The number of snapsets, raters and answers.
+        """
+        return (len(self.snapset_labels), len(self.rater_labels),
+                len(self.answer_labels))
+
+    def counts(self):
+        """ Count the answers of each snapset.
+
+        Returns
+        -------
+        counts: array (nb_snapsets, nb_answers)
+            the number of raters that gave each answer to each snapset.
+        """
+        nb_snapsets, _, nb_answers = self.shape
+        return numpy.bincount(
+            self.snapsets * nb_answers + self.answers,
+            minlength=nb_snapsets * nb_answers).reshape(
+                nb_snapsets, nb_answers)
+
+    def disagreement(self, counts=None):
+        """ Compute the disagreement of each snapset: the fraction of the
+        pairs of raters that gave different answers.
+
+        Parameters
+        ----------
+        counts: array (optional, default None)
+            the precomputed answer counts.
+
+        Returns
+        -------
+        disagreement: array (nb_snapsets, )
+            the snapsets disagreement, NaN for the snapsets with less than
+            two scores.
+        """
+        if counts is None:
+            counts = self.counts()
+        nb_scores = counts.sum(axis=1)
+        pairs = nb_scores * (nb_scores - 1)
+        agreeing = (counts * (counts - 1)).sum(axis=1)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            disagreement = 1. - agreeing / pairs
+        disagreement[nb_scores < 2] = numpy.nan
+        return disagreement
+
+    def fleiss_kappa(self, counts=None):
+        """ Compute the Fleiss' kappa of the snapsets rated at least twice,
+        generalized to a variable number of raters per snapset.
+
+        Parameters
+        ----------
+        counts: array (optional, default None)
+            the precomputed answer counts.
+
+        Returns
+        -------
+        kappa: float
+            the Fleiss' kappa, NaN if undefined.
+        """
+        if counts is None:
+            counts = self.counts()
+        nb_scores = counts.sum(axis=1)
+        counts = counts[nb_scores >= 2]
+        nb_scores = nb_scores[nb_scores >= 2]
+        if len(nb_scores) == 0:
+            return numpy.nan
+        observed = numpy.mean(
+            (counts * (counts - 1)).sum(axis=1) /
+            (nb_scores * (nb_scores - 1)))
+        proportions = counts.sum(axis=0) / nb_scores.sum()
+        expected = numpy.sum(proportions ** 2)
+        if expected == 1:
+            return numpy.nan
+        return (observed - expected) / (1. - expected)
+
+    def cohen_kappa(self, chunk_size=10000):
+        """ Compute the Cohen's kappa of each pair of raters on the
+        snapsets they both rated.
+
+        The confusion matrices of all the pairs of raters are obtained as
+        the product of the one-hot encoded answers, accumulated over chunks
+        of snapsets to bound the memory usage.
+
+        Parameters
+        ----------
+        chunk_size: int (optional, default 10000)
+            the number of snapsets one-hot encoded together.
+
+        Returns
+        -------
+        kappa: array (nb_raters, nb_raters)
+            the pairwise Cohen's kappas, NaN if undefined.
+        nb_common: array (nb_raters, nb_raters)
+            the number of snapsets rated by each pair of raters.
+        """
+        nb_snapsets, nb_raters, nb_answers = self.shape
+        order = numpy.argsort(self.snapsets, kind="mergesort")
+        snapsets = self.snapsets[order]
+        columns = (self.raters * nb_answers + self.answers)[order]
+        bounds = numpy.searchsorted(
+            snapsets, numpy.arange(0, nb_snapsets + chunk_size, chunk_size))
+        confusion = numpy.zeros((nb_raters * nb_answers, ) * 2)
+        for start, stop, offset in zip(bounds[:-1], bounds[1:],
+                                       range(0, nb_snapsets, chunk_size)):
+            one_hot = numpy.zeros((chunk_size, nb_raters * nb_answers),
+                                  dtype=numpy.float32)
+            one_hot[snapsets[start: stop] - offset,
+                    columns[start: stop]] = 1
+            confusion += numpy.dot(one_hot.T, one_hot)
+        confusion = confusion.reshape(
+            nb_raters, nb_answers, nb_raters, nb_answers).transpose(0, 2, 1, 3)
+        nb_common = confusion.sum(axis=(2, 3))
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            observed = numpy.einsum("abii->ab", confusion) / nb_common
+            expected = numpy.einsum(
+                "abi,abi->ab", confusion.sum(axis=3),
+                confusion.sum(axis=2)) / nb_common ** 2
+            kappa = (observed - expected) / (1. - expected)
+        kappa[nb_common == 0] = numpy.nan
+        return kappa, nb_common.astype(numpy.int64)
+
+
+def load_answer_matrix(cnx, wave_eid, answer_labels=None, chunk_size=10000):
+    """ Load the answer matrix of a wave in a single pass over its scores,
+    loaded by chunks ordered by eid.
+
+    Parameters
+    ----------
+    cnx: Connection or request
+        used to execute the queries.
+    wave_eid: int
+        the wave eid.
+    answer_labels: list (optional, default None)
+        the expected answers.
+    chunk_size: int (optional, default 10000)
+        the number of scores loaded by each query.
+
+    Returns
+    -------
+    matrix: AnswerMatrix
+        the wave answer matrix, the snapsets and the raters are identified
+        by their eids.
+    """
+    rows = iter_by_eid(
+        cnx, "S, U, SC, R",
+        "R is Score, R snapset S, W snapsets S, W eid %(w)s, R scored_by U, "
+        "R score SC", {"w": wave_eid}, chunk_size=chunk_size)
+    scores = ((snapset_eid, rater_eid, answer)
+              for snapset_eid, rater_eid, answer, _ in rows)
+    return AnswerMatrix.from_scores(scores, answer_labels)
+
+
+def wave_agreement(cnx, metadata, nb_disagreements=50, min_common=10):
+    """ Compute the agreement statistics of a wave.
+
+    Parameters
+    ----------
+    cnx: Connection or request
+        used to execute the queries.
+    metadata: WaveMetadata
+        the wave metadata.
+    nb_disagreements: int (optional, default 50)
+        the number of most disagreed snapsets returned.
+    min_common: int (optional, default 10)
+        the minimum number of snapsets rated by a pair of raters for their
+        Cohen's kappa to be taken into account in the raters mean kappa.
+
+    Returns
+    -------
+    agreement: dict
+        the 'fleiss_kappa' of the wave, the number of snapsets rated at
+        least twice 'nb_multi_rated', the 'raters', 'pairs' and
+        'disagreements' tables records.
+    """
+    matrix = load_answer_matrix(
+        cnx, metadata.eid, answer_labels=metadata.score_definitions)
+    counts = matrix.counts()
+    nb_scores = counts.sum(axis=1)
+    kappa, nb_common = matrix.cohen_kappa()
+    nb_snapsets, nb_raters, _ = matrix.shape
+
+    # Identify the raters and the most disagreed snapsets by name
+    logins = dict(cnx.execute(
+        "Any U, L Where U is CWUser, U login L, S rated_by U, "
+        "W snapsets S, W eid %(w)s", {"w": metadata.eid}))
+    disagreement = matrix.disagreement(counts)
+    order = numpy.argsort(-numpy.nan_to_num(disagreement),
+                          kind="mergesort")[:nb_disagreements]
+    order = order[disagreement[order] > 0]
+    names = {}
+    if len(order) > 0:
+        names = dict(cnx.execute(
+            "Any S, N Where S is SnapSet, S name N, S eid IN ({0})".format(
+                ",".join(str(int(matrix.snapset_labels[index]))
+                         for index in order))))
+
+    # Build the tables records
+    rater_records = []
+    pair_records = []
+    for rater in range(nb_raters):
+        others = numpy.arange(nb_raters) != rater
+        valid = others & (nb_common[rater] >= min_common)
+        rater_records.append([
+            logins.get(matrix.rater_labels[rater], u""),
+            int(nb_common[rater, rater]),
+            int(valid.sum()),
+            format_kappa(numpy.mean(kappa[rater, valid])
+                         if valid.any() else numpy.nan)])
+        for other in range(rater + 1, nb_raters):
+            if nb_common[rater, other] > 0:
+                pair_records.append([
+                    logins.get(matrix.rater_labels[rater], u""),
+                    logins.get(matrix.rater_labels[other], u""),
+                    int(nb_common[rater, other]),
+                    format_kappa(kappa[rater, other])])
+    disagreement_records = [
+        [names.get(matrix.snapset_labels[index], u""),
+         int(nb_scores[index]),
+         "{0:.2f}".format(disagreement[index])] +
+        counts[index].tolist() for index in order]
+    return {
+        "fleiss_kappa": format_kappa(matrix.fleiss_kappa(counts)),
+        "nb_multi_rated": int((nb_scores >= 2).sum()),
+        "nb_snapsets": nb_snapsets,
+        "answer_labels": matrix.answer_labels,
+        "raters": rater_records,
+        "pairs": pair_records,
+        "disagreements": disagreement_records}
+
+
+def format_kappa(kappa):
+    """ Format a kappa value, '-' if undefined.
+    """
+    if numpy.isnan(kappa):
+        return "-"
+    return "{0:.3f}".format(kappa)
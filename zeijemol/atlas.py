@@ -0,0 +1,109 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Sprite sheets of the 'TRIPLANAR-STACK' slices.
+
+The slices of an orientation are packed in a single image, the atlas,
+as a grid of equally sized tiles filled row by row. The tile offsets are
+described by a small index stored with the snap, so that the viewer
+fetches and decodes one image per orientation.
+"""
+
+# System import
+from __future__ import division
+import math
+
+# Third party import
+from PIL import Image
+
+
+def atlas_layout(nb_slices):
+    """ Get the number of columns and rows of the atlas grid: the grid is
+    as square as possible.
+
+    Parameters
+    ----------
+    nb_slices: int
+        the number of slices.
+
+    Returns
+    -------
+    nb_columns, nb_rows: int
+        the atlas grid shape.
+    """
+    nb_columns = max(int(math.ceil(math.sqrt(nb_slices))), 1)
+    nb_rows = max(int(math.ceil(nb_slices / nb_columns)), 1)
+    return nb_columns, nb_rows
+
+
+def tile_offset(index, atlas_index):
+    """ Get the offset of a slice tile in its atlas.
+
+    Parameters
+    ----------
+    index: int
+        the slice index.
+    atlas_index: dict
+        the atlas index as returned by 'pack_atlas'.
+
+    Returns
+    -------
+    x, y: int
+        the top left corner of the tile in pixels.
+    """
+    width, height = atlas_index["tile"]
+    nb_columns = atlas_index["columns"]
+    return (index % nb_columns) * width, (index // nb_columns) * height
+
+
+def pack_atlas(paths, atlas_path):
+    """ Pack a stack of slices in an atlas image.
+
+    Parameters
+    ----------
+    paths: list of str
+        the ordered slice files, all of the same size.
+    atlas_path: str
+        the atlas destination file, its format is deduced from its
+        extension.
+
+    Returns
+    -------
+    atlas_index: dict
+        the 'tile' size of the slices, the number of 'columns' of the
+        atlas grid and the number of slices 'nb_slices'.
+    """
+    if len(paths) == 0:
+        raise ValueError("Can't pack an empty stack.")
+    nb_columns, nb_rows = atlas_layout(len(paths))
+    atlas = None
+    atlas_index = None
+    for index, path in enumerate(paths):
+        with Image.open(path) as open_image:
+            if atlas is None:
+                tile = open_image.size
+                # > slices with a palette or an exotic mode are converted
+                mode = open_image.mode
+                if mode not in ("L", "LA", "RGB", "RGBA"):
+                    mode = "RGBA"
+                atlas = Image.new(
+                    mode, (tile[0] * nb_columns, tile[1] * nb_rows))
+                atlas_index = {
+                    "tile": list(tile),
+                    "columns": nb_columns,
+                    "nb_slices": len(paths)}
+            elif open_image.size != tuple(atlas_index["tile"]):
+                raise ValueError(
+                    "'{0}' size {1} differs from the stack size {2}.".format(
+                        path, open_image.size, tuple(atlas_index["tile"])))
+            slice_image = open_image
+            if open_image.mode != atlas.mode:
+                slice_image = open_image.convert(atlas.mode)
+            atlas.paste(slice_image, tile_offset(index, atlas_index))
+    atlas.save(atlas_path)
+    return atlas_index
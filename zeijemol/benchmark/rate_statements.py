@@ -0,0 +1,132 @@
+#! /usr/bin/env python
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Count the RQL and SQL statements issued to store one rating with the
+legacy write path of the rate controller and with the current one.
+
+Both write paths are measured on the same instance, thus with the same
+hooks. The legacy 'SnapSet.scores' relation is removed by the 0.2.0
+migration: its write is emulated by the write of the 'SnapSet.rated_by'
+relation, another non inlined relation of the rated snapset, before the
+hooks write it at commit time.
+
+The ratings are committed, hooks included, and deleted at the end of the
+benchmark: use a test instance.
+"""
+
+# System import
+from __future__ import print_function
+import time
+import json
+import hashlib
+import argparse
+
+# Cubicweb import
+from cubicweb.utils import admincnx
+
+# Zeijemol import
+from cubes.zeijemol.views.controllers import store_score
+
+
+class StatementCounter(object):
+    """ Count the RQL statements and the SQL statements sent to the system
+    source by a connection.
+    """
+    def __init__(self, cnx):
+        self.cnx = cnx
+        self.source = cnx.repo.system_source
+        self.nb_rql = 0
+        self.nb_sql = 0
+
+    def __enter__(self):
+        execute = self.cnx.execute
+        doexec = self.source.doexec
+
+        def counted_execute(*args, **kwargs):
+            self.nb_rql += 1
+            return execute(*args, **kwargs)
+
+        def counted_doexec(*args, **kwargs):
+            self.nb_sql += 1
+            return doexec(*args, **kwargs)
+
+        self.cnx.execute = counted_execute
+        self.source.doexec = counted_doexec
+        return self
+
+    def __exit__(self, *args):
+        del self.cnx.execute
+        del self.source.doexec
+
+
+def legacy_store_score(cnx, eid, rate, extra_answers):
+    """ The rate controller write path before the single statement insert:
+    the statements of the 0.1 rate controller, ie. the rater eid lookup,
+    the score creation and the redundant snapset relation write.
+    """
+    login = unicode(cnx.user.login)
+    m = hashlib.md5()
+    m.update(login + eid)
+    identifier = unicode(m.hexdigest())
+    user_eid = cnx.execute(
+        "Any X Where X is CWUser, X login '{0}'".format(login))[0][0]
+    cnx.create_entity(
+        "Score",
+        identifier=identifier,
+        uid=login,
+        score=unicode(rate),
+        extra_scores=unicode(json.dumps(extra_answers)),
+        snapset=unicode(eid),
+        scored_by=unicode(user_eid))
+    cnx.execute("SET S rated_by U  WHERE S eid '{0}', U eid "
+                "'{1}'".format(eid, user_eid))
+
+
+def benchmark(cnx, write_path, snapset_eids):
+    """ Store one rating per snapset, one transaction per rating.
+    """
+    counter = StatementCounter(cnx)
+    start = time.time()
+    with counter:
+        for eid in snapset_eids:
+            write_path(cnx, str(eid), u"Good", [])
+            cnx.commit()
+    duration = time.time() - start
+    cnx.execute("DELETE Score R Where R scored_by U, U eid %(u)s, "
+                "R snapset S, S eid IN ({0})".format(
+                    ",".join([str(eid) for eid in snapset_eids])),
+                {"u": cnx.user.eid})
+    cnx.commit()
+    nb_ratings = float(len(snapset_eids))
+    return (counter.nb_rql / nb_ratings, counter.nb_sql / nb_ratings,
+            duration / nb_ratings * 1000.)
+
+
+# Parse the command line
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("instance", help="the cubicweb instance name.")
+parser.add_argument("-n", "--nb-ratings", type=int, default=50,
+                    help="the number of ratings per write path.")
+args = parser.parse_args()
+
+# Rate snapsets not yet rated by the admin user with both write paths
+with admincnx(args.instance) as cnx:
+    snapset_eids = [row[0] for row in cnx.execute(
+        "Any S LIMIT {0} Where S is SnapSet, NOT EXISTS(R snapset S, "
+        "R scored_by U, U eid %(u)s)".format(args.nb_ratings),
+        {"u": cnx.user.eid})]
+    if len(snapset_eids) == 0:
+        parser.exit(1, "No snapset left to rate by '{0}'.\n".format(
+            cnx.user.login))
+    print("{0:<10} {1:>12} {2:>12} {3:>12}".format(
+        "path", "RQL/rating", "SQL/rating", "ms/rating"))
+    for name, write_path in (("legacy", legacy_store_score),
+                             ("current", store_score)):
+        print("{0:<10} {1:>12.1f} {2:>12.1f} {3:>12.2f}".format(
+            name, *benchmark(cnx, write_path, snapset_eids)))
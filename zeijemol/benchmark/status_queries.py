@@ -0,0 +1,179 @@
+#! /usr/bin/env python
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Compare the time needed to compute the Status tables with the legacy
+Python-side counting, the grouped RQL queries and the materialized rating
+statistics, on a synthetic database of increasing size.
+
+Synthetic waves, snapsets, raters and scores prefixed by 'benchmark-' are
+inserted in the instance with the hooks disabled (about one hour for 1M
+scores): use a test instance and the '--cleanup' option to remove them.
+"""
+
+# System import
+from __future__ import print_function
+from __future__ import division
+import time
+import json
+import random
+import hashlib
+import argparse
+
+# Cubicweb import
+from cubicweb.utils import admincnx
+
+# Zeijemol import
+from cubes.zeijemol.queries import status_tables
+from cubes.zeijemol.stats import rebuild_rating_stats
+
+
+PREFIX = u"benchmark-"
+ANSWERS = [u"Good", u"Average", u"Bad"]
+
+
+def legacy_status_tables(cnx):
+    """ The Status computation before the grouped queries: every score is
+    transferred and counted in Python.
+    """
+    rset = cnx.execute(
+        "Any WN, SC, UN Where W is Wave, W name WN, W snapsets S, "
+        "R snapset S, R score SC, R scored_by U, U login UN")
+    snapsets_struct = {}
+    for wave_name, score, rater in rset:
+        snapsets_struct.setdefault(wave_name, {}).setdefault(
+            rater, []).append(score)
+    tables = []
+    for wave_name, wave_struct in snapsets_struct.items():
+        nb_of_snapsets = cnx.execute(
+            "Any COUNT(S) Where W is Wave, W name %(w)s, W snapsets S",
+            {"w": wave_name})[0][0]
+        records = []
+        for rater, scores in wave_struct.items():
+            records.append([rater, "{0}/{1}".format(
+                len(scores), nb_of_snapsets)] + [
+                "{0}/{1}".format(scores.count(answer), len(scores))
+                for answer in ANSWERS])
+        tables.append((wave_name, records))
+    return tables
+
+
+def populate(cnx, nb_scores, nb_waves, nb_raters, rng):
+    """ Insert synthetic scores until the database contains 'nb_scores'
+    synthetic scores.
+    """
+    # Create the synthetic waves and raters once
+    if len(cnx.execute("Any W Where W is Wave, W name LIKE %(p)s",
+                       {"p": PREFIX + u"%"})) == 0:
+        for index in range(nb_waves):
+            name = u"{0}wave-{1}".format(PREFIX, index)
+            cnx.create_entity(
+                "Wave", identifier=name, name=name, category=u"benchmark",
+                description=u"", score_definitions=unicode(
+                    json.dumps(ANSWERS)), extra_answers=u"[]")
+        for index in range(nb_raters):
+            login = u"{0}rater-{1}".format(PREFIX, index)
+            cnx.execute(
+                "INSERT CWUser U: U login %(l)s, U upassword %(l)s, "
+                "U in_group G Where G name 'users'", {"l": login})
+        cnx.commit()
+    waves = [row[0] for row in cnx.execute(
+        "Any W Where W is Wave, W name LIKE %(p)s", {"p": PREFIX + u"%"})]
+    raters = cnx.execute("Any U, L Where U is CWUser, U login L, "
+                         "U login LIKE %(p)s", {"p": PREFIX + u"%"}).rows
+
+    # Add snapsets so that each rater can rate each snapset at most once,
+    # then scores
+    nb_existing = cnx.execute(
+        "Any COUNT(R) Where R is Score, R uid LIKE %(p)s",
+        {"p": PREFIX + u"%"})[0][0]
+    nb_snapsets = (nb_scores - nb_existing) // len(raters) + 1
+    with cnx.deny_all_hooks_but():
+        for index in range(nb_snapsets):
+            name = u"{0}snapset-{1}-{2}".format(PREFIX, nb_existing, index)
+            snapset_eid = cnx.execute(
+                "INSERT SnapSet S: S identifier %(n)s, S name %(n)s, "
+                "S wave W Where W eid %(w)s",
+                {"n": name, "w": rng.choice(waves)})[0][0]
+            cnx.execute("SET W snapsets S Where S eid %(s)s, S wave W",
+                        {"s": snapset_eid})
+            for rater_eid, login in raters:
+                if nb_existing >= nb_scores:
+                    break
+                identifier = hashlib.md5(
+                    (login + str(snapset_eid)).encode("utf-8")).hexdigest()
+                cnx.execute(
+                    "INSERT Score X: X identifier %(i)s, X uid %(l)s, "
+                    "X score %(a)s, X extra_scores '[]', X snapset S, "
+                    "X scored_by U Where S eid %(s)s, U eid %(u)s",
+                    {"i": unicode(identifier), "l": login,
+                     "a": rng.choice(ANSWERS), "s": snapset_eid,
+                     "u": rater_eid})
+                nb_existing += 1
+            if index % 100 == 0:
+                cnx.commit()
+    cnx.commit()
+    with cnx.security_enabled(read=False, write=False):
+        rebuild_rating_stats(cnx)
+    cnx.commit()
+
+
+def cleanup(cnx):
+    """ Remove the synthetic waves, snapsets, scores and raters.
+    """
+    cnx.execute("DELETE Wave W Where W name LIKE %(p)s",
+                {"p": PREFIX + u"%"})
+    cnx.execute("DELETE CWUser U Where U login LIKE %(p)s",
+                {"p": PREFIX + u"%"})
+    cnx.commit()
+
+
+def timeit(func, nb_runs):
+    """ Get the best execution time of a function in milliseconds.
+    """
+    durations = []
+    for _ in range(nb_runs):
+        start = time.time()
+        func()
+        durations.append(time.time() - start)
+    return min(durations) * 1000.
+
+
+# Parse the command line
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("instance", help="the cubicweb instance name.")
+parser.add_argument(
+    "-s", "--sizes", type=int, nargs="+",
+    default=[10000, 100000, 1000000],
+    help="the numbers of synthetic scores to benchmark.")
+parser.add_argument("-w", "--nb-waves", type=int, default=10,
+                    help="the number of synthetic waves.")
+parser.add_argument("-r", "--nb-raters", type=int, default=50,
+                    help="the number of synthetic raters.")
+parser.add_argument("-n", "--nb-runs", type=int, default=3,
+                    help="the number of runs of each computation.")
+parser.add_argument("-c", "--cleanup", action="store_true",
+                    help="remove the synthetic data at the end.")
+args = parser.parse_args()
+
+# Benchmark the three Status computations for each database size
+rng = random.Random(0)
+with admincnx(args.instance) as cnx:
+    print("{0:>10} {1:>14} {2:>14} {3:>14}".format(
+        "scores", "legacy (ms)", "grouped (ms)", "stats (ms)"))
+    for nb_scores in sorted(args.sizes):
+        populate(cnx, nb_scores, args.nb_waves, args.nb_raters, rng)
+        print("{0:>10} {1:>14.1f} {2:>14.1f} {3:>14.1f}".format(
+            nb_scores,
+            timeit(lambda: legacy_status_tables(cnx), args.nb_runs),
+            timeit(lambda: status_tables(cnx, materialized=False),
+                   args.nb_runs),
+            timeit(lambda: status_tables(cnx, materialized=True),
+                   args.nb_runs)))
+    if args.cleanup:
+        cleanup(cnx)
@@ -0,0 +1,252 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Write-behind buffer for the ratings.
+
+The ratings are acknowledged as soon as they are appended to a local
+journal and are inserted in the database by grouped transactions. The
+journal is replayed when the buffer is created, so that the ratings
+acknowledged before a crash are not lost.
+"""
+
+# System import
+import os
+import json
+import hashlib
+import logging
+import threading
+
+
+# A single statement inserting a Score bound to its snapset and its rater
+INSERT_SCORE = (
+    "INSERT Score X: X identifier %(identifier)s, X uid %(uid)s, "
+    "X score %(score)s, X extra_scores %(extra_scores)s, X snapset S, "
+    "X scored_by U Where S eid %(snapset)s, U eid %(user)s")
+
+
+def score_row(login, user_eid, snapset_eid, rate, extra_answers):
+    """ Create the parameters of the score insertion statement.
+
+    Parameters
+    ----------
+    login: str
+        the rater login.
+    user_eid: int
+        the rater eid.
+    snapset_eid: str or int
+        the rated snapset eid.
+    rate: str
+        the user score.
+    extra_answers: list of str
+        the user extra answers.
+
+    Returns
+    -------
+    row: dict
+        the 'INSERT_SCORE' statement parameters.
+    """
+    login = unicode(login)
+    m = hashlib.md5()
+    m.update((login + str(snapset_eid)).encode("utf-8"))
+    return {
+        "identifier": unicode(m.hexdigest()),
+        "uid": login,
+        "score": unicode(rate),
+        "extra_scores": unicode(json.dumps(extra_answers)),
+        "snapset": int(snapset_eid),
+        "user": int(user_eid)}
+
+
+class RatingBuffer(object):
+    """ Queue the ratings in an append-only journal and flush them in the
+    database with grouped transactions.
+    """
+    def __init__(self, journal):
+        """ Initialize the buffer and replay the journal.
+
+        Parameters
+        ----------
+        journal: str
+            the path to the append-only journal.
+        """
+        self.journal = journal
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.logger = logging.getLogger("zeijemol.buffer")
+        self.rows = []
+        if os.path.isfile(self.journal):
+            with open(self.journal) as open_file:
+                for line in open_file:
+                    try:
+                        self.rows.append(json.loads(line))
+                    except ValueError:
+                        # > a partial line written during a crash
+                        self.logger.warning(
+                            "Ignoring corrupted journal line: %r", line)
+            if len(self.rows) > 0:
+                self.logger.info("Replaying %d buffered ratings from '%s'",
+                                 len(self.rows), self.journal)
+        self._rewrite(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def append(self, row):
+        """ Queue a rating: the rating is durable once this method returns.
+
+        Parameters
+        ----------
+        row: dict
+            the rating as returned by 'score_row'.
+        """
+        line = json.dumps(row) + "\n"
+        with self.lock:
+            self.stream.write(line)
+            self.stream.flush()
+            os.fsync(self.stream.fileno())
+            self.rows.append(row)
+
+    def pending(self, login):
+        """ The snapsets rated by a user that are not yet in the database.
+
+        Parameters
+        ----------
+        login: str
+            the rater login.
+
+        Returns
+        -------
+        snapset_eids: list of int
+            the pending rated snapset eids.
+        """
+        with self.lock:
+            return [row["snapset"] for row in self.rows
+                    if row["uid"] == login]
+
+    def flush(self, cnx):
+        """ Insert the queued ratings with grouped transactions.
+
+        The ratings already stored (a crash between the commit and the
+        journal truncation) or referencing a removed snapset are dropped.
+        When the transaction fails, the ratings are inserted again by
+        halves to isolate the invalid ones, that are moved to the
+        '<journal>.rejected' file. If the database is not available, the
+        ratings are kept for the next flush.
+
+        Parameters
+        ----------
+        cnx: Connection
+            a repository connection allowed to create scores.
+
+        Returns
+        -------
+        nb_inserted: int
+            the number of inserted scores.
+        """
+        with self.flush_lock:
+            with self.lock:
+                rows = list(self.rows)
+            if len(rows) == 0:
+                return 0
+            try:
+                stored = set(row[0] for row in cnx.execute(
+                    "Any I Where X is Score, X identifier IN ({0}), "
+                    "X identifier I".format(",".join(
+                        ["'{0}'".format(row["identifier"]) for row in rows]))))
+                snapsets = set(row[0] for row in cnx.execute(
+                    "Any S Where S is SnapSet, S eid IN ({0})".format(
+                        ",".join(set(str(row["snapset"]) for row in rows)))))
+                new_rows = []
+                for row in rows:
+                    if (row["identifier"] in stored or
+                            row["snapset"] not in snapsets):
+                        continue
+                    new_rows.append(row)
+                    stored.add(row["identifier"])
+                nb_inserted, rejected = self._insert(cnx, new_rows)
+            except Exception:
+                cnx.rollback()
+                self.logger.exception(
+                    "Can't flush %d buffered ratings", len(rows))
+                return 0
+            if len(rejected) > 0:
+                with open(self.journal + ".rejected", "a") as open_file:
+                    for row in rejected:
+                        open_file.write(json.dumps(row) + "\n")
+
+            # Only the flushed ratings are removed: new ratings may have
+            # been appended meanwhile
+            with self.lock:
+                self.rows = self.rows[len(rows):]
+                self._rewrite(self.rows)
+            return nb_inserted
+
+    def close(self):
+        """ Close the journal.
+        """
+        with self.lock:
+            self.stream.close()
+
+    def _insert(self, cnx, rows):
+        """ Insert ratings in a single transaction, or by halves if the
+        transaction fails.
+
+        Parameters
+        ----------
+        cnx: Connection
+            a repository connection allowed to create scores.
+        rows: list of dict
+            the ratings to insert.
+
+        Returns
+        -------
+        nb_inserted: int
+            the number of inserted scores.
+        rejected: list of dict
+            the ratings that can't be inserted.
+
+        Raises
+        ------
+        Exception
+            if the database is not available.
+        """
+        if len(rows) == 0:
+            return 0, []
+        try:
+            for row in rows:
+                cnx.execute(INSERT_SCORE, row)
+            cnx.commit()
+            return len(rows), []
+        except Exception:
+            cnx.rollback()
+            if len(rows) == 1:
+                # > a rating is rejected only if the database answers
+                cnx.execute("Any X Where X eid %(e)s",
+                            {"e": rows[0]["snapset"]})
+                self.logger.exception(
+                    "Rejecting the buffered rating %r", rows[0])
+                return 0, rows
+        middle = len(rows) // 2
+        nb_first, rejected_first = self._insert(cnx, rows[:middle])
+        nb_last, rejected_last = self._insert(cnx, rows[middle:])
+        return nb_first + nb_last, rejected_first + rejected_last
+
+    def _rewrite(self, rows):
+        """ Atomically replace the journal content and reopen it in append
+        mode.
+        """
+        if getattr(self, "stream", None) is not None:
+            self.stream.close()
+        tmp_journal = self.journal + ".tmp"
+        with open(tmp_journal, "w") as open_file:
+            for row in rows:
+                open_file.write(json.dumps(row) + "\n")
+            open_file.flush()
+            os.fsync(open_file.fileno())
+        os.rename(tmp_journal, self.journal)
+        self.stream = open(self.journal, "a")
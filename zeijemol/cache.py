@@ -0,0 +1,352 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Process level caches shared by the views.
+
+The caches are filled lazily from the database and kept up to date by the
+hooks defined in the 'hooks' module.
+"""
+
+# System import
+from __future__ import division
+import json
+import threading
+import collections
+import numpy
+
+
+def unsafe_read(cnx):
+    """ Disable the read permissions of a connection or of the connection of
+    a request: the 'rated_by' relations are only readable by the managers.
+
+    Parameters
+    ----------
+    cnx: Connection or request
+        the connection used to load the cached data.
+
+    Returns
+    -------
+    context: context manager
+        the context in which the read permissions are not checked.
+    """
+    return getattr(cnx, "cnx", cnx).security_enabled(read=False)
+
+
+class CompletionCache(object):
+    """ Cache the number of snapsets of each wave and the number of snapsets
+    rated by each user in each wave.
+
+    The counters are stored in arrays aligned on the wave eids, each filled
+    by a single grouped COUNT query.
+
+    Each user counters load gets a new stamp: a rating committed after a
+    stamp is counted in the counters loaded after this stamp, thus these
+    counters are dropped rather than incremented.
+    """
+    def __init__(self):
+        """ Initialize the empty cache.
+        """
+        self.lock = threading.Lock()
+        self.waves = None
+        self.positions = {}
+        self.users = {}
+        self.loads = {}
+        self.nb_loads = 0
+
+    def completion(self, cnx, login):
+        """ Get the user completion of all the waves.
+
+        Parameters
+        ----------
+        cnx: Connection or request
+            used to load the missing counters.
+        login: str
+            the rater login.
+
+        Returns
+        -------
+        completion: numpy record array
+            one record per wave with the 'eid', 'name', 'category',
+            'nb_snapsets' and 'nb_rated' fields, the last one counting the
+            snapsets rated by the user.
+        """
+        return self._snapshot(cnx, login)[0]
+
+    def progress(self, cnx, wave_eid, login):
+        """ Get the percentage of the wave snapsets rated by a user.
+
+        Parameters
+        ----------
+        cnx: Connection or request
+            used to load the missing counters.
+        wave_eid: int
+            the wave eid.
+        login: str
+            the rater login.
+
+        Returns
+        -------
+        progress: int
+            the user progress in percent.
+        """
+        completion, positions = self._snapshot(cnx, login)
+        if wave_eid not in positions:
+            raise ValueError("Unknown wave '{0}'.".format(wave_eid))
+        return int(progress(completion)[positions[wave_eid]])
+
+    def stamp(self):
+        """ Get the stamp of the last user counters load: taken before a
+        commit, it tells which counters may already count the committed
+        ratings.
+
+        Returns
+        -------
+        stamp: int
+            the number of user counters loads so far.
+        """
+        with self.lock:
+            return self.nb_loads
+
+    def add_score(self, wave_eid, login, stamp):
+        """ Count a new rating of a user in a wave.
+
+        Parameters
+        ----------
+        wave_eid: int
+            the wave eid.
+        login: str
+            the rater login.
+        stamp: int
+            the cache stamp taken before the rating was committed.
+        """
+        with self.lock:
+            if login not in self.users or wave_eid not in self.positions:
+                return
+            # > the counters loaded while the rating was committed are
+            #   reloaded on demand
+            if self.loads[login] > stamp:
+                del self.users[login]
+                del self.loads[login]
+                return
+            self.users[login][self.positions[wave_eid]] += 1
+
+    def invalidate(self):
+        """ Drop all the counters: they will be reloaded on demand.
+        """
+        with self.lock:
+            self.waves = None
+            self.positions = {}
+            self.users = {}
+            self.loads = {}
+
+    def _snapshot(self, cnx, login):
+        """ Get the user completion of all the waves and the wave positions
+        from the same cache state.
+        """
+        with self.lock:
+            if self.waves is None:
+                self.waves = self._load_waves(cnx)
+                self.positions = dict(
+                    (int(eid), index)
+                    for index, eid in enumerate(self.waves.eid))
+            if login not in self.users:
+                self.nb_loads += 1
+                self.loads[login] = self.nb_loads
+                self.users[login] = self._load_user(cnx, login)
+            completion = self.waves.copy()
+            completion.nb_rated = self.users[login]
+            return completion, self.positions
+
+    def _load_waves(self, cnx):
+        """ Load the wave descriptions and snapset counts.
+        """
+        rset = cnx.execute(
+            "Any W, N, C, COUNT(S) GROUPBY W, N, C Where W is Wave, "
+            "W name N, W category C, W snapsets S?")
+        waves = numpy.recarray((len(rset), ), dtype=[
+            ("eid", int), ("name", object), ("category", object),
+            ("nb_snapsets", int), ("nb_rated", int)])
+        for index, row in enumerate(rset):
+            waves[index] = tuple(row) + (0, )
+        return waves
+
+    def _load_user(self, cnx, login):
+        """ Load the number of snapsets rated by a user in each wave.
+        """
+        nb_rated = numpy.zeros((len(self.waves), ), dtype=int)
+        with unsafe_read(cnx):
+            rset = cnx.execute(
+                "Any W, COUNT(S) GROUPBY W Where W snapsets S, S rated_by U, "
+                "U login %(l)s", {"l": login})
+        for wave_eid, count in rset:
+            if wave_eid in self.positions:
+                nb_rated[self.positions[wave_eid]] = count
+        return nb_rated
+
+
+# The parsed metadata of a wave, 'file_only' if all the snaps of the wave
+# are displayed with the 'FILE' viewer
+WaveMetadata = collections.namedtuple(
+    "WaveMetadata", ["eid", "name", "category", "description",
+                     "score_definitions", "extra_answers", "filepath",
+                     "file_only"])
+
+
+class WaveMetadataCache(object):
+    """ Cache the parsed metadata of all the waves.
+
+    The metadata of all the waves are loaded with two queries. Each
+    invalidation increments the cache version.
+    """
+    def __init__(self):
+        """ Initialize the empty cache.
+        """
+        self.lock = threading.Lock()
+        self.version = 0
+        self.waves = None
+        self.names = {}
+
+    def get(self, cnx, wave_eid=None, name=None):
+        """ Get the metadata of a wave from its eid or from its name.
+
+        Parameters
+        ----------
+        cnx: Connection or request
+            used to load the metadata.
+        wave_eid: int (optional, default None)
+            the wave eid.
+        name: str (optional, default None)
+            the wave name, used if no eid is specified.
+
+        Returns
+        -------
+        metadata: WaveMetadata
+            the wave metadata with parsed 'score_definitions' and
+            'extra_answers' lists.
+        """
+        waves, names = self._load(cnx)
+        if wave_eid is None:
+            if name not in names:
+                raise ValueError("Unknown wave '{0}'.".format(name))
+            wave_eid = names[name]
+        wave_eid = int(wave_eid)
+        if wave_eid not in waves:
+            raise ValueError("Unknown wave '{0}'.".format(wave_eid))
+        return waves[wave_eid]
+
+    def all(self, cnx):
+        """ Get the metadata of all the waves.
+
+        Parameters
+        ----------
+        cnx: Connection or request
+            used to load the metadata.
+
+        Returns
+        -------
+        metadata: list of WaveMetadata
+            the waves metadata.
+        """
+        return list(self._load(cnx)[0].values())
+
+    def invalidate(self):
+        """ Drop the metadata: they will be reloaded on demand.
+        """
+        with self.lock:
+            self.version += 1
+            self.waves = None
+            self.names = {}
+
+    def _load(self, cnx):
+        """ Load the metadata of all the waves if needed.
+        """
+        with self.lock:
+            if self.waves is None:
+                waves = {}
+                rset = cnx.execute(
+                    "Any W, N, C, D, SC, E, F Where W is Wave, W name N, "
+                    "W category C, W description D, W score_definitions SC, "
+                    "W extra_answers E, W filepath F")
+                not_file_only = set(row[0] for row in cnx.execute(
+                    "Any W, COUNT(SN) GROUPBY W Where W is Wave, "
+                    "W snapsets S, S snaps SN, NOT SN viewer 'FILE'"))
+                for (wave_eid, name, category, description, score_definitions,
+                     extra_answers, filepath) in rset:
+                    waves[wave_eid] = WaveMetadata(
+                        wave_eid, name, category, description,
+                        json.loads(score_definitions),
+                        json.loads(extra_answers or "[]"), filepath,
+                        wave_eid not in not_file_only)
+                self.waves = waves
+                self.names = dict(
+                    (metadata.name, wave_eid)
+                    for wave_eid, metadata in waves.items())
+            return self.waves, self.names
+
+
+class PayloadCache(object):
+    """ A bounded cache of computed view payloads, the least recently used
+    payloads being dropped first.
+    """
+    def __init__(self, size=32):
+        """ Initialize the empty cache.
+
+        Parameters
+        ----------
+        size: int (optional, default 32)
+            the maximum number of cached payloads.
+        """
+        self.lock = threading.Lock()
+        self.size = size
+        self.payloads = collections.OrderedDict()
+
+    def get(self, key, compute):
+        """ Get a cached payload or compute and cache it.
+
+        Parameters
+        ----------
+        key: str
+            the payload key, that must change whenever the payload changes.
+        compute: callable
+            a function without argument that computes the payload.
+
+        Returns
+        -------
+        payload: object
+            the payload.
+        """
+        with self.lock:
+            if key in self.payloads:
+                payload = self.payloads.pop(key)
+                self.payloads[key] = payload
+                return payload
+        payload = compute()
+        with self.lock:
+            self.payloads[key] = payload
+            while len(self.payloads) > self.size:
+                self.payloads.popitem(last=False)
+        return payload
+
+
+def progress(completion):
+    """ Compute the user progress of each wave.
+
+    Parameters
+    ----------
+    completion: numpy record array
+        the user completion as returned by 'CompletionCache.completion'.
+
+    Returns
+    -------
+    progress: numpy array
+        the user progress in percent, 100 for the waves without snapsets.
+    """
+    nb_snapsets = numpy.maximum(completion.nb_snapsets, 1)
+    progress = completion.nb_rated * 100 // nb_snapsets
+    progress[completion.nb_snapsets == 0] = 100
+    return progress
@@ -0,0 +1,62 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" cubicweb-ctl commands of the zeijemol cube.
+"""
+
+# System import
+from __future__ import print_function
+
+# CW import
+from cubicweb.cwctl import CWCTL
+from cubicweb.toolsutils import Command
+from cubicweb.utils import admincnx
+
+# Zeijemol import
+from cubes.zeijemol.stats import rebuild_rating_stats
+
+
+class RebuildRatingStatsCommand(Command):
+    """ Check the materialized rating statistics against the Score table and
+    rebuild the inconsistent ones.
+
+    <instance>
+      the identifier of the instance.
+    """
+    name = "zeijemol-rebuild-stats"
+    arguments = "<instance>"
+    min_args = max_args = 1
+    options = (
+        ("check", {
+            "action": "store_true",
+            "default": False,
+            "help": "only report the inconsistent statistics."}),
+    )
+
+    def run(self, args):
+        """ Run the command.
+        """
+        appid = args[0]
+        with admincnx(appid) as cnx:
+            with cnx.security_enabled(read=False, write=False):
+                differences = rebuild_rating_stats(
+                    cnx, check_only=self.config.check)
+            for (wave_eid, rater_eid, answer), stored, expected in (
+                    differences):
+                print(u"wave {0}, rater {1}, answer '{2}': stored {3}, "
+                      u"expected {4}".format(wave_eid, rater_eid, answer,
+                                            stored, expected))
+            if self.config.check:
+                print("{0} inconsistent statistic(s).".format(
+                    len(differences)))
+            else:
+                cnx.commit()
+                print("{0} statistic(s) rebuilt.".format(len(differences)))
+
+
+CWCTL.register(RebuildRatingStatsCommand)
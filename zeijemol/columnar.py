@@ -0,0 +1,163 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Columnar export of the ratings.
+
+The ratings are encoded in a single pass as NumPy arrays: the waves,
+snapsets, raters and answers are dictionary-encoded as integer codes, the
+extra answers as a boolean matrix and the creation dates as int64
+timestamps. The arrays are saved in an uncompressed NPZ file that is
+loaded with 'numpy.load'.
+"""
+
+# System import
+import json
+import array
+import calendar
+import numpy
+
+
+class Dictionary(object):
+    """ Encode values as integer codes in order of first appearance.
+    """
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, value):
+        """ Get the code of a value, adding the value if necessary.
+        """
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def labels(self):
+        """ Get the encoded values as a unicode array indexed by code.
+        """
+        return numpy.array(self.values, dtype=numpy.unicode_)
+
+
+def timestamp(date):
+    """ Convert a date to a number of microseconds since the epoch.
+
+    Parameters
+    ----------
+    date: datetime
+        the date, in UTC if not timezone aware.
+
+    Returns
+    -------
+    timestamp: int
+        the number of microseconds since 1970-01-01 UTC.
+    """
+    return (calendar.timegm(date.utctimetuple()) * 1000000 +
+            date.microsecond)
+
+
+class RatingsColumns(object):
+    """ Build the ratings columns in a streaming pass.
+
+    The codes are accumulated in compact typed arrays, so that the memory
+    usage stays proportional to the number of ratings and not to the size
+    of their string representation.
+    """
+    # The encoded columns
+    columns = ("rater", "wave", "snapset", "answer")
+    # The number of timestamps converted together to an int64 array
+    chunk_size = 65536
+
+    def __init__(self):
+        """ Initialize the empty columns.
+        """
+        self.dictionaries = dict(
+            (name, Dictionary()) for name in self.columns + ("extra", ))
+        self.codes = dict(
+            (name, array.array("i")) for name in self.columns)
+        self.timestamps = []
+        self.timestamp_chunks = []
+        self.extra_rows = array.array("i")
+        self.extra_codes = array.array("i")
+        self.nb_ratings = 0
+
+    def add(self, rater, date, wave_name, snapset_name, answer,
+            extra_answers):
+        """ Add a rating.
+
+        Parameters
+        ----------
+        rater: str
+            the rater login.
+        date: datetime
+            the rating creation date.
+        wave_name: str
+            the wave name.
+        snapset_name: str
+            the snapset name.
+        answer: str
+            the rating answer.
+        extra_answers: str
+            the JSON encoded extra answers.
+        """
+        for name, value in zip(self.columns,
+                               (rater, wave_name, snapset_name, answer)):
+            self.codes[name].append(self.dictionaries[name].encode(value))
+        self.timestamps.append(timestamp(date))
+        if len(self.timestamps) == self.chunk_size:
+            self.timestamp_chunks.append(
+                numpy.array(self.timestamps, dtype=numpy.int64))
+            self.timestamps = []
+        extra_answers = json.loads(extra_answers or "[]")
+        if not isinstance(extra_answers, list):
+            extra_answers = [extra_answers]
+        for extra_answer in extra_answers:
+            self.extra_rows.append(self.nb_ratings)
+            self.extra_codes.append(
+                self.dictionaries["extra"].encode(extra_answer))
+        self.nb_ratings += 1
+
+    def arrays(self):
+        """ Get the ratings columns and dictionaries.
+
+        Returns
+        -------
+        arrays: dict
+            the 'rater', 'wave', 'snapset' and 'answer' int32 codes, the
+            '<column>_labels' unicode dictionaries indexed by code, the
+            'timestamp' int64 microseconds since the epoch, the
+            'extra_answers' boolean matrix with one row per rating and one
+            column per 'extra_answers_labels' item.
+        """
+        arrays = {}
+        for name in self.columns:
+            arrays[name] = numpy.frombuffer(
+                self.codes[name], dtype=numpy.intc).astype(numpy.int32)
+            arrays[name + "_labels"] = self.dictionaries[name].labels()
+        arrays["timestamp"] = numpy.concatenate(self.timestamp_chunks + [
+            numpy.array(self.timestamps, dtype=numpy.int64)])
+        extra_labels = self.dictionaries["extra"].labels()
+        extra_answers = numpy.zeros((self.nb_ratings, len(extra_labels)),
+                                    dtype=numpy.bool_)
+        extra_answers[numpy.frombuffer(self.extra_rows, dtype=numpy.intc),
+                      numpy.frombuffer(self.extra_codes,
+                                       dtype=numpy.intc)] = True
+        arrays["extra_answers"] = extra_answers
+        arrays["extra_answers_labels"] = extra_labels
+        return arrays
+
+    def save(self, fileobj):
+        """ Save the columns in an uncompressed NPZ file.
+
+        Parameters
+        ----------
+        fileobj: file
+            the destination file, opened in binary mode.
+        """
+        numpy.savez(fileobj, **self.arrays())
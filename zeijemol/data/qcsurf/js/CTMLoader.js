@@ -66,12 +66,7 @@ THREE.CTMLoader.prototype.load = function( url, callback, parameters ) {
 	var length = 0;
 
 	xhr.addEventListener("progress",callbackProgress, false);
-    var raw = window.atob(encoded_mesh);
-    var rawLength = raw.length;
-    var binaryData = new Uint8Array(new ArrayBuffer(rawLength));
-    for(var i = 0; i < rawLength; i++) {
-        binaryData[i] = raw.charCodeAt(i);
-    }
+    var binaryData = new Uint8Array(mesh_buffer);
     //var binaryData = new Uint8Array(binary);
 	var s = Date.now();
 	if ( parameters.useWorker ) {
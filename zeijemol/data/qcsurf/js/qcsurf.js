@@ -18,24 +18,38 @@ var materials = [
 ];
 var current_material = 0;
 //var pop_stats;
-var encoded_mesh;
+var mesh_buffer;
 var lines;
 var meshpath;
 
 
 function get_new_data () {
+    // Fetch the raw mesh and stats files, cached by the browser
     var ctmfile = fs_struct[hemi][surf]["mesh"];
     var statsfile = fs_struct[hemi][surf]["stats"];
-    $.ajax({
-        url: ajaxcallback,
-        method: "POST",
-        data: {"ctmfile": ctmfile, "statsfile": statsfile}
-    }).done(function(data) {
-        encoded_mesh = data.encoded_mesh;
-        lines = data.statlines;
-        meshpath = ctmfile;
-        loadMesh();
-    });
+    var mesh_loading = $.Deferred();
+    var xhr = new XMLHttpRequest();
+    xhr.open("GET", ctmfile, true);
+    xhr.responseType = "arraybuffer";
+    xhr.onload = function() {
+        if (xhr.status == 200) {
+            mesh_loading.resolve(xhr.response);
+        }
+        else {
+            mesh_loading.reject();
+        }
+    };
+    xhr.onerror = function() {
+        mesh_loading.reject();
+    };
+    xhr.send();
+    $.when(mesh_loading, $.ajax({url: statsfile, dataType: "text"})).done(
+        function(buffer, stats) {
+            mesh_buffer = buffer;
+            lines = stats[0].split("\n");
+            meshpath = ctmfile;
+            loadMesh();
+        });
 }
 //function population_statistics () {
     // Load subject population stats
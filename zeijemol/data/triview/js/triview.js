@@ -1,17 +1,181 @@
 
 var images_stack;
+var full_stack = {};
+var atlases = {};
+var level = 1;
 
 function initTriViewGui() {
     $("#loading-msg").show();
+    level = choose_level();
+    $.each(triview_data.orientations, function( index, orient ) {
+        full_stack[orient] = new Array(triview_data.nb_slices[orient] + 1);
+    });
+    if (triview_data.atlases) {
+        load_atlases(function() {
+            $("#loading-msg").hide();
+            load_images();
+            enableTriViewBtn();
+        }, function() {
+            // An atlas can't be fetched: load the slices one by one
+            triview_data.atlases = null;
+            load_stacks();
+        });
+        return;
+    }
+    load_stacks();
+}
+function load_stacks() {
+    /* Load the middle slice of each orientation first, then the neighbour
+     * slices outward and the rest in the background. */
+    images_stack = {};
+    var nb_loading = triview_data.orientations.length;
+    var queue = [];
+    $.each(triview_data.orientations, function( index, orient ) {
+        var nb_slices = triview_data.nb_slices[orient] + 1;
+        var middle = Math.floor(triview_data.nb_slices[orient] / 2);
+        images_stack[orient] = new Array(nb_slices);
+        $.each(slice_ranges(nb_slices, middle), function( rank, range ) {
+            queue.push([rank, index, orient, range[0], range[1]]);
+        });
+        load_slices(orient, middle, middle + 1, function() {
+            nb_loading -= 1;
+            if (nb_loading == 0) {
+                $("#loading-msg").hide();
+                load_images();
+                enableTriViewBtn();
+                queue.sort(function(a, b) {
+                    return (a[0] - b[0]) || (a[1] - b[1]);
+                });
+                load_queue(queue);
+            }
+        });
+    });
+}
+function choose_level() {
+    /* Pick the pyramid level of the slices loaded in the background: the
+     * level hint if any, a coarse level on slow connections, else the
+     * coarsest level that still fills the displayed canvases. */
+    if (triview_data.level) {
+        return triview_data.level;
+    }
+    var connection = navigator.connection || {};
+    var effective_type = connection.effectiveType || "";
+    if (connection.saveData || /2g$/.test(effective_type)) {
+        return 4;
+    }
+    if (effective_type == "3g") {
+        return 2;
+    }
+    var ratio = window.devicePixelRatio || 1;
+    var chosen = triview_data.levels[triview_data.levels.length - 1];
+    $.each(triview_data.orientations, function( index, orient ) {
+        var canvas_el = $("#" + orient).children("canvas").get(0);
+        var width = (canvas_el.getBoundingClientRect().width ||
+                     canvas_el.width);
+        while (chosen > 1 &&
+                triview_data.shapes[orient][0] / chosen < width * ratio) {
+            chosen = triview_data.levels[
+                triview_data.levels.indexOf(chosen) - 1];
+        }
+    });
+    return chosen;
+}
+function slice_ranges(nb_slices, middle) {
+    /* Split the slices around the middle one in ranges of growing width,
+     * ordered outward. */
+    var ranges = [];
+    var low = middle;
+    var high = middle + 1;
+    var width = 4;
+    while (low > 0 || high < nb_slices) {
+        var new_low = Math.max(0, low - width);
+        var new_high = Math.min(nb_slices, high + width);
+        if (new_low < low) {
+            ranges.push([new_low, low]);
+        }
+        if (high < new_high) {
+            ranges.push([high, new_high]);
+        }
+        low = new_low;
+        high = new_high;
+        width = Math.min(2 * width, 32);
+    }
+    return ranges;
+}
+function load_queue(queue) {
+    /* Load the queued slice ranges one after the other. */
+    if (queue.length == 0) {
+        return;
+    }
+    var item = queue.shift();
+    load_slices(item[2], item[3], item[4], function() {
+        load_queue(queue);
+    });
+}
+function load_slices(orient, start, stop, callback) {
+    /* Load the slices of an orientation that are not loaded yet. */
+    var stack = images_stack[orient];
+    while (start < stop && stack[start] !== undefined) {
+        start += 1;
+    }
+    while (stop > start && stack[stop - 1] !== undefined) {
+        stop -= 1;
+    }
+    if (start == stop) {
+        callback();
+        return;
+    }
     $.ajax({
         url: triview_data.ajaxcallback,
         method: "POST",
-        data: {"file_data": JSON.stringify(triview_data.file_data)}
+        data: {
+            "snap_eid": triview_data.snap_eid,
+            "orient": orient,
+            "start": start,
+            "stop": stop,
+            "level": level}
     }).done(function(data) {
-        $("#loading-msg").hide();
-        images_stack = data;
-        load_images();
-        enableTriViewBtn();
+        var nb_loading = data.urls.length;
+        if (nb_loading == 0) {
+            callback();
+            return;
+        }
+        $.each(data.urls, function( index, url ) {
+            var image = new Image();
+            image.onload = image.onerror = function() {
+                nb_loading -= 1;
+                if (nb_loading == 0) {
+                    callback();
+                }
+            };
+            image.src = url;
+            stack[data.start + index] = image;
+        });
+    }).fail(function() {
+        callback();
+    });
+}
+function load_atlases(callback, error_callback) {
+    /* Fetch and decode each atlas once, then call the callback, or the
+     * error callback once if an atlas can't be fetched. */
+    var nb_loading = triview_data.orientations.length;
+    var failed = false;
+    $.each(triview_data.orientations, function( index, orient ) {
+        var image = new Image();
+        image.onload = function() {
+            nb_loading -= 1;
+            if (nb_loading == 0 && !failed) {
+                callback();
+            }
+        };
+        image.onerror = function() {
+            if (!failed) {
+                failed = true;
+                error_callback();
+            }
+        };
+        image.src = triview_data.atlases[orient].src;
+        atlases[orient] = image;
     });
 }
 function disableTriViewBtn() {
@@ -41,16 +205,16 @@ function load_images() {
 
         var ctx = canvas_el.getContext("2d");
         $("#" + orient).children(".slice-bar").each(function () {
-            var nb_slices = images_stack[orient].length;
             $("<span>").addClass("output").insertAfter($(this));
-            draw_img(ctx, images_stack[orient][nb_slices / 2.]);
+            draw_slice(ctx, orient,
+                       Math.floor(triview_data.nb_slices[orient] / 2));
             set_brightness(canvas, triview_data.brightness);
 
         }).bind("slider:ready slider:changed", function (event, data) {
             var slice_index = data.value;
             $("#"+orient).children(".slice-bar-text").html(
                 slice_index + " / " + triview_data.nb_slices[orient]);
-            draw_img(ctx, images_stack[orient][slice_index]);
+            draw_slice(ctx, orient, slice_index);
             set_brightness(canvas, triview_data.brightness);
         });
 
@@ -66,12 +230,99 @@ function load_images() {
         $(".container").show();
     });
 }
-function draw_img(canvas_context, encoded_img) {
-    var image = new Image();
-    image.onload = function() {
-        canvas_context.drawImage(image, 0, 0);
-    };
-    image.src = "data:image/"+ triview_data.extension  + ";base64," + encoded_img;
+function draw_slice(canvas_context, orient, slice_index) {
+    /* Draw a slice at full resolution if loaded, else from its atlas tile
+     * or from its downscaled image, then upgrade it to full resolution. */
+    if (full_stack[orient][slice_index]) {
+        draw_img(canvas_context, full_stack[orient][slice_index]);
+        return;
+    }
+    if (triview_data.atlases) {
+        var atlas = triview_data.atlases[orient];
+        var image = atlases[orient];
+        var width = atlas.tile[0];
+        var height = atlas.tile[1];
+        var nb_rows = Math.ceil(atlas.nb_slices / atlas.columns);
+        var scale_x = image.naturalWidth / (atlas.columns * width);
+        var scale_y = image.naturalHeight / (nb_rows * height);
+        var x = (slice_index % atlas.columns) * width;
+        var y = Math.floor(slice_index / atlas.columns) * height;
+        canvas_context.drawImage(
+            image, x * scale_x, y * scale_y, width * scale_x,
+            height * scale_y, 0, 0, width, height);
+    }
+    else if (images_stack[orient][slice_index] !== undefined) {
+        draw_img(canvas_context, images_stack[orient][slice_index]);
+    }
+    else {
+        // Load the requested slice now and draw it if still displayed
+        load_slices(orient, slice_index, slice_index + 1, function() {
+            var current = $("#" + orient).children(".slice-bar").val();
+            if (parseInt(current, 10) == slice_index &&
+                    images_stack[orient][slice_index] !== undefined) {
+                draw_img(canvas_context, images_stack[orient][slice_index]);
+            }
+        });
+    }
+    upgrade_slice(canvas_context, orient, slice_index);
+}
+function upgrade_slice(canvas_context, orient, slice_index) {
+    /* Replace the displayed slice by its full resolution image once the
+     * slider stays on it. */
+    if (level == 1) {
+        return;
+    }
+    setTimeout(function() {
+        if (current_slice(orient) != slice_index ||
+                full_stack[orient][slice_index] !== undefined) {
+            return;
+        }
+        // Mark the slice as loading
+        full_stack[orient][slice_index] = null;
+        $.ajax({
+            url: triview_data.ajaxcallback,
+            method: "POST",
+            data: {
+                "snap_eid": triview_data.snap_eid,
+                "orient": orient,
+                "start": slice_index,
+                "stop": slice_index + 1,
+                "level": 1}
+        }).done(function(data) {
+            var image = new Image();
+            image.onload = function() {
+                full_stack[orient][slice_index] = image;
+                if (current_slice(orient) == slice_index) {
+                    draw_img(canvas_context, image);
+                }
+            };
+            image.onerror = function() {
+                full_stack[orient][slice_index] = undefined;
+            };
+            image.src = data.urls[0];
+        }).fail(function() {
+            full_stack[orient][slice_index] = undefined;
+        });
+    }, 150);
+}
+function current_slice(orient) {
+    return parseInt($("#" + orient).children(".slice-bar").val(), 10);
+}
+function draw_img(canvas_context, image) {
+    /* Draw an image, possibly downscaled, to the whole canvas. */
+    var canvas_el = canvas_context.canvas;
+    if (image.complete) {
+        if (image.naturalWidth > 0) {
+            canvas_context.drawImage(
+                image, 0, 0, canvas_el.width, canvas_el.height);
+        }
+    }
+    else {
+        $(image).one("load", function() {
+            canvas_context.drawImage(
+                image, 0, 0, canvas_el.width, canvas_el.height);
+        });
+    }
 }
 function set_brightness(canvas_el, brightness) {
     var filter = "brightness(" + brightness + "%)";
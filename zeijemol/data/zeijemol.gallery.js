@@ -0,0 +1,73 @@
+/* Send the gallery answers with an ajax callback and swap the viewers in
+ * place with the next snapset returned by the server. When the next snapset
+ * can't be displayed with the current viewers, reload the page. */
+$(document).ready(function() {
+    $("#gallery-form form").on("click", "input[name=rate]", function(event) {
+        event.preventDefault();
+        rate_and_next($(this).val());
+    });
+});
+function rate_and_next(rate) {
+    var form = $("#gallery-form form");
+    var extra_answers = form.find("input[name=extra_answers]:checked").map(
+        function() { return this.value; }).get();
+    disable_gallery_btn(true);
+    $.ajax({
+        url: gallery_data.ajaxcallback,
+        method: "POST",
+        traditional: true,
+        data: {
+            "eid": gallery_data.eid,
+            "wave_name": gallery_data.wave_name,
+            "rate": rate,
+            "extra_answers": extra_answers}
+    }).done(function(data) {
+        if (data.eid === null || !can_swap(data)) {
+            window.location.href = gallery_data.reload_url;
+            return;
+        }
+        swap_snapset(data);
+        form.find("input[name=extra_answers]").prop("checked", false);
+        disable_gallery_btn(false);
+    }).fail(function() {
+        window.location.href = gallery_data.reload_url;
+    });
+}
+function disable_gallery_btn(disabled) {
+    $("#gallery-form input[name=rate]").each(function() {
+        $(this).prop("disabled", disabled);
+    });
+}
+function can_swap(data) {
+    var snaps = $(".gallery-snap");
+    if (snaps.length != data.snaps.length) {
+        return false;
+    }
+    var swappable = true;
+    snaps.each(function(index) {
+        var viewer = $(this).data("viewer");
+        if (viewer != data.snaps[index].viewer ||
+                (viewer != "FILE" && viewer != "TRIPLANAR-STACK")) {
+            swappable = false;
+        }
+    });
+    return swappable;
+}
+function swap_snapset(data) {
+    gallery_data.eid = data.eid;
+    $(".gallery-snap").each(function(index) {
+        var snap = data.snaps[index];
+        if (snap.viewer == "FILE") {
+            $(this).children("img, embed").attr("src", snap.src);
+        }
+        else if (snap.viewer == "TRIPLANAR-STACK") {
+            $(this).children("input[name=file_data]").val(
+                JSON.stringify(snap.file_data));
+            $(this).children("input[name=snap_eid]").val(snap.eid);
+            $(this).children("input[name=data_type]").val(snap.data_type);
+            $(this).submit();
+        }
+    });
+    $(".progress-bar").attr("aria-valuenow", data.progress).css(
+        "width", data.progress + "%").html(data.progress + "%");
+}
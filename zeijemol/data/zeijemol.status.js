@@ -0,0 +1,74 @@
+/* Long-poll the rating counters deltas committed since the Status page was
+ * rendered and update the status tables in place. When some deltas are
+ * lost, reload the page. */
+$(document).ready(function() {
+    poll_status_feed();
+});
+function poll_status_feed() {
+    $.ajax({
+        url: status_feed_data.ajaxcallback,
+        method: "POST",
+        data: {
+            "epoch": status_feed_data.epoch,
+            "seq": status_feed_data.seq}
+    }).done(function(data) {
+        if (data.deltas === null) {
+            window.location.reload();
+            return;
+        }
+        status_feed_data.seq = data.seq;
+        var updated = {};
+        $.each(data.deltas, function(index, delta) {
+            if (apply_status_delta(delta)) {
+                updated[delta.wave] = true;
+            }
+        });
+        $.each(updated, function(wave_name) {
+            zeijemol_tables[wave_name].table.fnDraw(false);
+        });
+        poll_status_feed();
+    }).fail(function() {
+        setTimeout(poll_status_feed, 10000);
+    });
+}
+function apply_status_delta(delta) {
+    var tables = window.zeijemol_tables || {};
+    var wave_table = tables[delta.wave];
+    if (wave_table === undefined) {
+        return false;
+    }
+    var column = wave_table.labels.indexOf(delta.answer);
+    var data = wave_table.data;
+    if (column < 2 || data.length == 0) {
+        return false;
+    }
+    var row = null;
+    for (var i = 0; i < data.length; i++) {
+        if (data[i][0] == delta.rater) {
+            row = data[i];
+            break;
+        }
+    }
+    if (row === null) {
+        row = [delta.rater, "0/" + split_counter(data[0][1])[1]];
+        for (var j = 2; j < wave_table.labels.length; j++) {
+            row.push("0/0");
+        }
+        data.push(row);
+    }
+    var rates = split_counter(row[1]);
+    var nb_rates = rates[0] + delta.delta;
+    row[1] = nb_rates + "/" + rates[1];
+    for (var j = 2; j < row.length; j++) {
+        var count = split_counter(row[j])[0];
+        if (j == column) {
+            count += delta.delta;
+        }
+        row[j] = count + "/" + nb_rates;
+    }
+    return true;
+}
+function split_counter(cell) {
+    var parts = cell.split("/");
+    return [parseInt(parts[0], 10), parseInt(parts[1], 10)];
+}
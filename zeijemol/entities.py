@@ -16,3 +16,89 @@
 # with this program. If not, see <http://www.gnu.org/licenses/>.
 
 """cubicweb-snapview entity's classes"""
+
+# System import
+import collections
+
+# CW import
+from cubicweb.entities import AnyEntity
+from logilab.common.decorators import cached
+
+
+# Light descriptions of the snaps and files of a snapset: they expose the
+# same attributes as the entities read by the viewers
+PrefetchedSnap = collections.namedtuple(
+    "PrefetchedSnap", ["eid", "identifier", "name", "order", "viewer",
+                       "atlas_index", "files", "atlases"])
+PrefetchedFile = collections.namedtuple(
+    "PrefetchedFile", ["eid", "filepath", "order", "description", "dtype",
+                       "sha1hex"])
+
+
+class SnapSet(AnyEntity):
+    """ A snapset with a prefetch API of its snaps and files.
+    """
+    __regid__ = "SnapSet"
+
+    @cached
+    def prefetched_snaps(self):
+        """ Load the snapset snaps and their files with three queries.
+
+        Returns
+        -------
+        snaps: list of PrefetchedSnap
+            the snaps sorted by display order, each one with its files
+            sorted by file order.
+        """
+        return prefetch_snaps(self._cw, [self.eid])[self.eid]
+
+
+def prefetch_snaps(cnx, snapset_eids):
+    """ Load the snaps, the files and the atlases of many snapsets with three
+    queries.
+
+    Parameters
+    ----------
+    cnx: Connection or request
+        used to execute the queries.
+    snapset_eids: list of int
+        the snapset eids.
+
+    Returns
+    -------
+    snaps: dict
+        the snapset eids as keys and the snaps sorted by display order, each
+        one with its files sorted by file order and its atlases, as values.
+    """
+    snaps = dict((int(eid), []) for eid in snapset_eids)
+    if len(snaps) == 0:
+        return snaps
+    eids = ",".join([str(eid) for eid in snaps])
+    files = {}
+    rset = cnx.execute(
+        "Any SN, F, P, O, D, T, H ORDERBY O Where S eid IN ({0}), "
+        "S snaps SN, SN files F, F filepath P, F order O, F description D, "
+        "F dtype T, F sha1hex H".format(eids))
+    for snap_eid, file_eid, filepath, order, description, dtype, sha1hex in (
+            rset):
+        files.setdefault(snap_eid, []).append(PrefetchedFile(
+            file_eid, filepath, order, description, dtype, sha1hex))
+    atlases = {}
+    rset = cnx.execute(
+        "Any SN, F, P, O, D, T, H ORDERBY O Where S eid IN ({0}), "
+        "S snaps SN, SN atlases F, F filepath P, F order O, F description D, "
+        "F dtype T, F sha1hex H".format(eids))
+    for snap_eid, file_eid, filepath, order, description, dtype, sha1hex in (
+            rset):
+        atlases.setdefault(snap_eid, []).append(PrefetchedFile(
+            file_eid, filepath, order, description, dtype, sha1hex))
+    rset = cnx.execute(
+        "Any S, SN, I, N, O, V, A ORDERBY O Where S eid IN ({0}), "
+        "S snaps SN, SN identifier I, SN name N, SN order O, SN viewer V, "
+        "SN atlas_index A".format(eids))
+    for snapset_eid, snap_eid, identifier, name, order, viewer, atlas_index in (
+            rset):
+        snaps[snapset_eid].append(PrefetchedSnap(
+            snap_eid, identifier, name, order, viewer, atlas_index,
+            files.get(snap_eid, []), atlases.get(snap_eid, [])))
+    return snaps
@@ -0,0 +1,90 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Feed of the rating counters deltas pushed to the live Status page.
+
+The Score hooks publish the committed counters variations in a ring buffer,
+and the Status page long-polls the deltas published after the last one it
+has applied.
+"""
+
+# System import
+import uuid
+import threading
+import collections
+
+
+class StatusFeed(object):
+    """ A bounded feed of the committed rating counters deltas.
+
+    Each published batch of deltas gets an increasing sequence number. The
+    feed epoch changes with the process, so that a client holding a
+    sequence number of another process knows it must reload the page.
+    """
+    def __init__(self, size=1024):
+        """ Initialize the empty feed.
+
+        Parameters
+        ----------
+        size: int (optional, default 1024)
+            the number of batches kept in the feed.
+        """
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self.batches = collections.deque(maxlen=size)
+        self.condition = threading.Condition()
+
+    def publish(self, deltas):
+        """ Publish a batch of deltas and wake up the waiting clients.
+
+        Parameters
+        ----------
+        deltas: list of dict
+            the 'wave', 'rater', 'answer' and 'delta' counter variations.
+        """
+        if len(deltas) == 0:
+            return
+        with self.condition:
+            self.seq += 1
+            self.batches.append((self.seq, deltas))
+            self.condition.notify_all()
+
+    def since(self, epoch, seq, timeout):
+        """ Get the deltas published after a sequence number, waiting for
+        new deltas if none is available.
+
+        Parameters
+        ----------
+        epoch: str
+            the feed epoch known by the client.
+        seq: int
+            the sequence number of the last batch applied by the client.
+        timeout: float
+            the maximum waiting time in seconds.
+
+        Returns
+        -------
+        seq: int
+            the sequence number of the last returned batch.
+        deltas: list of dict or None
+            the published deltas, None if the client must reload the
+            counters because the feed epoch changed or some deltas were
+            dropped from the ring buffer.
+        """
+        with self.condition:
+            if epoch != self.epoch or seq > self.seq:
+                return self.seq, None
+            if seq == self.seq:
+                self.condition.wait(timeout)
+            if len(self.batches) > 0 and self.batches[0][0] > seq + 1:
+                return self.seq, None
+            deltas = []
+            for batch_seq, batch in self.batches:
+                if batch_seq > seq:
+                    deltas.extend(batch)
+            return self.seq, deltas
@@ -12,6 +12,7 @@ import json
 
 # CW import
 from cubicweb.server import hook
+from cubicweb.predicates import is_instance
 from logilab.common.decorators import monkeypatch
 from cubicweb.dataimport.importer import ExtEntitiesImporter
 
@@ -23,6 +24,14 @@ from jinja2 import select_autoescape
 # Package import
 import cubes.zeijemol as zeijemol
 from cubes.zeijemol.migration.update_sources import _create_or_update_ldap_data_source
+from cubes.zeijemol.sampler import SamplerRegistry
+from cubes.zeijemol.buffer import RatingBuffer
+from cubes.zeijemol.cache import CompletionCache
+from cubes.zeijemol.cache import WaveMetadataCache
+from cubes.zeijemol.cache import PayloadCache
+from cubes.zeijemol.feed import StatusFeed
+from cubes.zeijemol.stats import score_key
+from cubes.zeijemol.stats import update_rating_stats
 
 
 class ConfigureTemplateEnvironment(hook.Hook):
@@ -38,6 +47,91 @@ class ConfigureTemplateEnvironment(hook.Hook):
         self.repo.vreg.template_env = template_env
 
 
+class ConfigureSamplers(hook.Hook):
+    """ On startup create the process level registry of wave samplers.
+    """
+    __regid__ = "zeijemol.samplers"
+    events = ("server_startup", )
+
+    def __call__(self):
+        self.repo.vreg.wave_samplers = SamplerRegistry()
+
+
+class ConfigureCompletionCache(hook.Hook):
+    """ On startup create the process level cache of the users' wave
+    completion.
+    """
+    __regid__ = "zeijemol.completion-cache"
+    events = ("server_startup", )
+
+    def __call__(self):
+        self.repo.vreg.wave_completion = CompletionCache()
+
+
+class ConfigureWaveMetadataCache(hook.Hook):
+    """ On startup create the process level caches of the waves metadata and
+    of the status pages payloads.
+    """
+    __regid__ = "zeijemol.wave-metadata-cache"
+    events = ("server_startup", )
+
+    def __call__(self):
+        self.repo.vreg.wave_metadata = WaveMetadataCache()
+        self.repo.vreg.status_payloads = PayloadCache()
+
+
+class ConfigureStatusFeed(hook.Hook):
+    """ On startup create the feed of the rating counters deltas pushed to
+    the live Status page.
+    """
+    __regid__ = "zeijemol.status-feed"
+    events = ("server_startup", )
+
+    def __call__(self):
+        self.repo.vreg.status_feed = StatusFeed()
+
+
+class ConfigureRatingBuffer(hook.Hook):
+    """ On startup create the rating write-behind buffer if enabled: the
+    journal is replayed and a looping task flushes the buffered ratings.
+    """
+    __regid__ = "zeijemol.rating-buffer"
+    events = ("server_startup", )
+
+    def __call__(self):
+        interval = self.repo.vreg.config["rating_buffer_interval"]
+        if interval <= 0:
+            self.repo.vreg.rating_buffer = None
+            return
+        journal = os.path.join(
+            self.repo.config.appdatahome, "zeijemol-ratings.journal")
+        rating_buffer = RatingBuffer(journal)
+        self.repo.vreg.rating_buffer = rating_buffer
+
+        def flush_rating_buffer(repo):
+            with repo.internal_cnx() as cnx:
+                rating_buffer.flush(cnx)
+
+        # Insert the replayed ratings now, then on a regular basis
+        flush_rating_buffer(self.repo)
+        self.repo.looping_task(interval, flush_rating_buffer, self.repo)
+
+
+class FlushRatingBuffer(hook.Hook):
+    """ On shutdown flush the rating write-behind buffer.
+    """
+    __regid__ = "zeijemol.flush-rating-buffer"
+    events = ("server_shutdown", )
+
+    def __call__(self):
+        rating_buffer = getattr(self.repo.vreg, "rating_buffer", None)
+        if rating_buffer is None:
+            return
+        with self.repo.internal_cnx() as cnx:
+            rating_buffer.flush(cnx)
+        rating_buffer.close()
+
+
 class UpdateSource(hook.Hook):
     """ On startup update the LDAP source if specified.
     """
@@ -55,6 +149,253 @@ class UpdateSource(hook.Hook):
                     cnx, configuration, update=True)
 
 
+class UpdateSnapSetCounters(hook.Hook):
+    """ On Score creation or deletion, register the associated snapset in
+    order to update its rating counters at commit time.
+    """
+    __regid__ = "zeijemol.update-snapset-counters"
+    __select__ = hook.Hook.__select__ & hook.match_rtype(
+        "snapset", frometypes=("Score", ))
+    events = ("after_add_relation", "after_delete_relation")
+
+    def __call__(self):
+        SnapSetCountersOp.get_instance(self._cw).add_data(self.eidto)
+
+
+class SnapSetCountersOp(hook.DataOperationMixIn, hook.Operation):
+    """ Recompute the 'nb_scores' attribute and the 'rated_by' relations of
+    the modified snapsets.
+
+    The counters are recomputed from the Score table once per snapset and
+    per transaction, so that a single commit with many ratings stays cheap.
+    """
+    def precommit_event(self):
+        with self.cnx.security_enabled(read=False, write=False):
+            for snapset_eid in self.get_data():
+                if self.cnx.deleted_in_transaction(snapset_eid):
+                    continue
+                nb_scores = self.cnx.execute(
+                    "Any COUNT(R) Where R snapset S, S eid '{0}'".format(
+                        snapset_eid))[0][0]
+                self.cnx.execute(
+                    "SET S nb_scores {0} Where S eid '{1}'".format(
+                        nb_scores, snapset_eid))
+                self.cnx.execute(
+                    "SET S rated_by U Where S eid '{0}', R snapset S, "
+                    "R scored_by U, NOT S rated_by U".format(snapset_eid))
+                self.cnx.execute(
+                    "DELETE S rated_by U Where S eid '{0}', S rated_by U, "
+                    "NOT EXISTS(R snapset S, R scored_by U)".format(
+                        snapset_eid))
+
+
+class UpdateRatingStats(hook.Hook):
+    """ On Score creation, modification or deletion, register the score in
+    order to update the rating statistics at commit time.
+
+    The statistic key of a score is resolved before its first modification
+    or deletion in the transaction.
+    """
+    __regid__ = "zeijemol.update-rating-stats"
+    __select__ = hook.Hook.__select__ & is_instance("Score")
+    events = ("after_add_entity", "before_update_entity",
+              "before_delete_entity")
+
+    def __call__(self):
+        op = RatingStatsOp.get_instance(self._cw)
+        eid = self.entity.eid
+        if self.event == "after_add_entity":
+            op.created.add(eid)
+        elif (self.event == "before_update_entity" and
+                "score" not in self.entity.cw_edited):
+            return
+        elif eid not in op.created and eid not in op.original_keys:
+            with self._cw.security_enabled(read=False):
+                op.original_keys[eid] = score_key(self._cw, eid)
+        op.add_data(eid)
+
+
+class RatingStatsOp(hook.DataOperationMixIn, hook.Operation):
+    """ Apply the Score modifications to the 'RatingStat' entities and
+    publish them in the status feed once the transaction is committed.
+
+    The statistic of a score is decremented with its key before the
+    transaction unless the score was created in the transaction, and is
+    incremented with its final key unless the score is deleted.
+    """
+    def __init__(self, *args, **kwargs):
+        super(RatingStatsOp, self).__init__(*args, **kwargs)
+        self.created = set()
+        self.original_keys = {}
+
+    def precommit_event(self):
+        deltas = {}
+        with self.cnx.security_enabled(read=False, write=False):
+            for score_eid in self.get_data():
+                keys = []
+                if score_eid not in self.created:
+                    keys.append((self.original_keys.get(score_eid), -1))
+                if not self.cnx.deleted_in_transaction(score_eid):
+                    keys.append((score_key(self.cnx, score_eid), 1))
+                for key, delta in keys:
+                    if key is not None:
+                        deltas[key] = deltas.get(key, 0) + delta
+            update_rating_stats(self.cnx, deltas)
+            self.feed_deltas = self.named_deltas(deltas)
+
+    def named_deltas(self, deltas):
+        """ Identify the waves and the raters of the deltas by their name
+        as displayed in the Status page.
+        """
+        if getattr(self.cnx.repo.vreg, "status_feed", None) is None:
+            return []
+        names = {}
+        feed_deltas = []
+        for (wave_eid, rater_eid, answer), delta in deltas.items():
+            if (delta == 0 or self.cnx.deleted_in_transaction(wave_eid) or
+                    self.cnx.deleted_in_transaction(rater_eid)):
+                continue
+            for eid, rql in ((wave_eid, "Any N Where X eid %(x)s, X name N"),
+                             (rater_eid,
+                              "Any L Where X eid %(x)s, X login L")):
+                if eid not in names:
+                    names[eid] = self.cnx.execute(rql, {"x": eid})[0][0]
+            feed_deltas.append({
+                "wave": names[wave_eid], "rater": names[rater_eid],
+                "answer": answer, "delta": delta})
+        return feed_deltas
+
+    def postcommit_event(self):
+        feed = getattr(self.cnx.repo.vreg, "status_feed", None)
+        if feed is not None:
+            feed.publish(self.feed_deltas)
+
+
+class UpdateWaveSamplers(hook.Hook):
+    """ On Score creation or deletion, register the modification in order to
+    update the in-memory wave samplers once the transaction is committed.
+    """
+    __regid__ = "zeijemol.update-wave-samplers"
+    __select__ = hook.Hook.__select__ & hook.match_rtype(
+        "snapset", frometypes=("Score", ))
+    events = ("after_add_relation", "after_delete_relation")
+
+    def __call__(self):
+        WaveSamplersOp.get_instance(self._cw).add_data(
+            (self.event, self.eidfrom, self.eidto))
+
+
+class InvalidateWaveSamplers(hook.Hook):
+    """ When snapsets are added to or removed from a wave, drop the wave
+    sampler: it will be rebuilt on the next draw.
+    """
+    __regid__ = "zeijemol.invalidate-wave-samplers"
+    __select__ = hook.Hook.__select__ & hook.match_rtype("snapsets")
+    events = ("after_add_relation", "after_delete_relation")
+
+    def __call__(self):
+        WaveSamplersOp.get_instance(self._cw).add_data(
+            ("invalidate", self.eidfrom, None))
+
+
+class InvalidateWaveCompletion(hook.Hook):
+    """ When a wave is created or deleted, drop the completion cache.
+    """
+    __regid__ = "zeijemol.invalidate-wave-completion"
+    __select__ = hook.Hook.__select__ & is_instance("Wave")
+    events = ("after_add_entity", "after_delete_entity")
+
+    def __call__(self):
+        WaveSamplersOp.get_instance(self._cw).add_data(
+            ("invalidate", self.entity.eid, None))
+
+
+class InvalidateWaveMetadata(hook.Hook):
+    """ When a wave is created, modified or deleted, drop the waves metadata
+    cache.
+    """
+    __regid__ = "zeijemol.invalidate-wave-metadata"
+    __select__ = hook.Hook.__select__ & is_instance("Wave")
+    events = ("after_add_entity", "after_update_entity",
+              "after_delete_entity")
+
+    def __call__(self):
+        WaveMetadataOp.get_instance(self._cw).add_data(self.entity.eid)
+
+
+class InvalidateWaveViewers(hook.Hook):
+    """ When a snap is created, modified or deleted, drop the waves metadata
+    cache: the waves 'FILE' viewers flag may change.
+    """
+    __regid__ = "zeijemol.invalidate-wave-viewers"
+    __select__ = hook.Hook.__select__ & is_instance("Snap")
+    events = ("after_add_entity", "after_update_entity",
+              "after_delete_entity")
+
+    def __call__(self):
+        WaveMetadataOp.get_instance(self._cw).add_data(self.entity.eid)
+
+
+class WaveMetadataOp(hook.DataOperationMixIn, hook.Operation):
+    """ Drop the waves metadata cache once the transaction is committed.
+    """
+    def postcommit_event(self):
+        metadata = getattr(self.cnx.repo.vreg, "wave_metadata", None)
+        if metadata is not None:
+            metadata.invalidate()
+
+
+class WaveSamplersOp(hook.DataOperationMixIn, hook.Operation):
+    """ Forward the committed Score modifications to the wave samplers and
+    to the completion cache.
+
+    The rater and the wave are resolved before commit, the samplers are only
+    updated after commit so that a rollback leaves them untouched.
+    """
+    def precommit_event(self):
+        self.updates = []
+        completion = getattr(self.cnx.repo.vreg, "wave_completion", None)
+        if completion is not None:
+            self.completion_stamp = completion.stamp()
+        with self.cnx.security_enabled(read=False, write=False):
+            for event, eidfrom, eidto in self.get_data():
+                if event == "invalidate":
+                    self.updates.append(("invalidate", eidfrom, None, None))
+                    continue
+                if self.cnx.deleted_in_transaction(eidto):
+                    continue
+                rset = self.cnx.execute(
+                    "Any W Where S eid '{0}', S wave W".format(eidto))
+                if rset.rowcount != 1:
+                    continue
+                wave_eid = rset[0][0]
+                if event == "after_delete_relation":
+                    self.updates.append(("invalidate", wave_eid, None, None))
+                    continue
+                rset = self.cnx.execute(
+                    "Any L Where R eid '{0}', R scored_by U, "
+                    "U login L".format(eidfrom))
+                if rset.rowcount == 1:
+                    self.updates.append(
+                        ("add", wave_eid, eidto, rset[0][0]))
+
+    def postcommit_event(self):
+        samplers = getattr(self.cnx.repo.vreg, "wave_samplers", None)
+        completion = getattr(self.cnx.repo.vreg, "wave_completion", None)
+        for action, wave_eid, snapset_eid, login in self.updates:
+            if action == "invalidate":
+                if samplers is not None:
+                    samplers.invalidate(wave_eid)
+                if completion is not None:
+                    completion.invalidate()
+            else:
+                if samplers is not None:
+                    samplers.add_score(wave_eid, snapset_eid, login)
+                if completion is not None:
+                    completion.add_score(
+                        wave_eid, login, self.completion_stamp)
+
+
 @monkeypatch(ExtEntitiesImporter)
 def _import_entities(self, ext_entities, queue):
     """ LDAP synch import groups as external entities and thus the
@@ -0,0 +1,173 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Image files metadata and multi-resolution pyramid.
+
+The size and the mode of the image files are stored with the files at
+import, so that the viewers never open the files to check them.
+
+The downscaled levels of an image are built on their first request and
+cached on disk by SHA1 sum.
+"""
+
+# System import
+import os
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+# Third party import
+from PIL import Image
+
+
+# The file types with image metadata
+IMAGE_DTYPES = ("PNG", "JPG", "JPEG")
+# The downscaling factors of the pyramid levels
+PYRAMID_LEVELS = (1, 2, 4)
+
+
+def image_header(path):
+    """ Read the size and the mode of an image: only the file header is
+    decoded.
+
+    Parameters
+    ----------
+    path: str
+        the image file path.
+
+    Returns
+    -------
+    width, height: int
+        the image size in pixels.
+    mode: str
+        the image PIL mode.
+    """
+    with Image.open(path) as open_image:
+        width, height = open_image.size
+        return width, height, open_image.mode
+
+
+def read_image_headers(paths, nb_workers=16):
+    """ Read the image headers of many files in parallel.
+
+    Reading the headers is dominated by the file system latency, thus the
+    files are opened from a pool of threads.
+
+    Parameters
+    ----------
+    paths: list of str
+        the image file paths.
+    nb_workers: int (optional, default 16)
+        the number of files opened together.
+
+    Returns
+    -------
+    headers: list of 3-uplet
+        the width, height and mode of each image, None if the image can't
+        be read.
+    """
+    def safe_header(path):
+        try:
+            return image_header(path)
+        except (IOError, OSError):
+            return None
+    pool = ThreadPool(max(min(nb_workers, len(paths)), 1))
+    try:
+        return pool.map(safe_header, paths)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def level_size(size, level):
+    """ Get the size of an image downscaled to a pyramid level.
+
+    Parameters
+    ----------
+    size: 2-uplet
+        the full resolution image size.
+    level: int
+        the downscaling factor.
+
+    Returns
+    -------
+    size: 2-uplet
+        the downscaled image size, at least one pixel wide.
+    """
+    return tuple(max(length // level, 1) for length in size)
+
+
+def downscale_image(path, level_path, level):
+    """ Downscale an image by an integer factor.
+
+    The image is written to a temporary file renamed at the end, so that a
+    partially written level is never served.
+
+    Parameters
+    ----------
+    path: str
+        the full resolution image file path.
+    level_path: str
+        the downscaled image destination file, its format is deduced from
+        its extension.
+    level: int
+        the downscaling factor.
+    """
+    with Image.open(path) as open_image:
+        image = open_image
+        # > slices with a palette or an exotic mode are converted
+        if image.mode not in ("L", "LA", "RGB", "RGBA"):
+            image = image.convert(
+                "RGBA" if level_path.lower().endswith(".png") else "RGB")
+        image = image.resize(level_size(image.size, level), Image.LANCZOS)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(level_path),
+        suffix=os.path.splitext(level_path)[1])
+    os.close(fd)
+    try:
+        image.save(tmp_path)
+        os.rename(tmp_path, level_path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+
+def pyramid_level(path, sha1hex, level, cache_dir):
+    """ Get a pyramid level of an image, built on its first request.
+
+    Parameters
+    ----------
+    path: str
+        the full resolution image file path.
+    sha1hex: str
+        the SHA1 sum of the image file.
+    level: int
+        the downscaling factor, one of 'PYRAMID_LEVELS'.
+    cache_dir: str
+        the directory where the levels are cached.
+
+    Returns
+    -------
+    level_path: str
+        the downscaled image file path, the input path for the full
+        resolution level.
+    """
+    if level == 1:
+        return path
+    level_dir = os.path.join(cache_dir, sha1hex[:2])
+    level_path = os.path.join(level_dir, "{0}-{1}{2}".format(
+        sha1hex, level, os.path.splitext(path)[1]))
+    if not os.path.isfile(level_path):
+        if not os.path.isdir(level_dir):
+            try:
+                os.makedirs(level_dir)
+            except OSError:
+                # > created by a concurrent request
+                if not os.path.isdir(level_dir):
+                    raise
+        downscale_image(path, level_path, level)
+    return level_path
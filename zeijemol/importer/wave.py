@@ -22,12 +22,15 @@ from cubicweb.server.utils import crypt_password
 
 # SnapView import
 from cubes.zeijemol.docgen.rst2html import rst2html
+from cubes.zeijemol.atlas import pack_atlas
+from cubes.zeijemol.images import IMAGE_DTYPES
+from cubes.zeijemol.images import image_header
 
 
 class WaveImporter(object):
     """ This class enables us to add/update new wave in a CW instance.
     """
-    def __init__(self, instance_name, session):
+    def __init__(self, instance_name, session, atlas_dir=None):
         """ Initialize the WaveImporter class.
 
         Parameters
@@ -36,8 +39,14 @@ class WaveImporter(object):
             the name of the cubicweb instance based in the 'snapview' cube.
         session: CubicWeb session
             the session used to insert the data.
+        atlas_dir: str (optional, default None)
+            the directory where the 'TRIPLANAR-STACK' atlases are written,
+            by default a 'zeijemol-atlases' directory in the instance data
+            directory: the slices directories are left untouched.
         """
         self.session = session
+        self.atlas_dir = atlas_dir or os.path.join(
+            session.repo.config.appdatahome, "zeijemol-atlases")
 
     ###########################################################################
     #   Public Methods
@@ -203,12 +212,48 @@ class WaveImporter(object):
                     else:
                         raise ValueError("'{0}' is not a path or a "
                                          "2-uplet.".format(file_data))
+                # >> pack the stack slices in atlases
+                if snaps["viewer"] == "TRIPLANAR-STACK":
+                    self.insert_atlases(snap_eid, snap_struct["identifier"],
+                                        snaps["filepaths"])
         # Commit changes
         self.session.commit()
 
-    def insert_file(self, snap_eid, fpath, order, description=None):
+    def insert_atlases(self, snap_eid, snap_identifier, filepaths):
+        """ Pack each orientation of a 'TRIPLANAR-STACK' snap in an atlas
+        image and store the atlases index with the snap.
+
+        Parameters
+        ----------
+        snap_eid: int (mandatory)
+            the snap eid.
+        snap_identifier: str (mandatory)
+            the snap identifier used to name the atlases.
+        filepaths: list of 2-uplet (mandatory)
+            the orientations and their ordered slice paths.
+        """
+        atlas_index = {}
+        if not os.path.isdir(self.atlas_dir):
+            os.makedirs(self.atlas_dir)
+        for order, (orient, fpaths) in enumerate(filepaths):
+            ext = os.path.splitext(fpaths[0])[1]
+            atlas_path = os.path.join(
+                self.atlas_dir, "{0}-{1}-atlas{2}".format(
+                    snap_identifier, orient, ext))
+            atlas_index[orient] = pack_atlas(fpaths, atlas_path)
+            self.insert_file(snap_eid, atlas_path, order + 1,
+                             description=orient, relation="atlases")
+        self.session.execute(
+            "SET S atlas_index %(index)s Where S eid %(s)s",
+            {"index": unicode(json.dumps(atlas_index)), "s": snap_eid})
+
+    def insert_file(self, snap_eid, fpath, order, description=None,
+                    relation="files"):
         """ Add 'ExternalFile' to a specific snap.
 
+        The size and the mode of the image files are read from their header
+        and stored with the file.
+
         Parameters
         ----------
         snap_eid: int (mandatory)
@@ -219,6 +264,8 @@ class WaveImporter(object):
             the file order.
         description: str (optional, default None)
             the file description.
+        relation: str (optional, default 'files')
+            the relation from the snap to the file: 'files' or 'atlases'.
         """
         ext = fpath.split(".")[-1].upper()
         if ext == "GZ":
@@ -234,6 +281,9 @@ class WaveImporter(object):
         }
         if description is not None:
             file_struct["description"] = description
+        if ext in IMAGE_DTYPES:
+            (file_struct["width"], file_struct["height"],
+             file_struct["mode"]) = image_header(fpath)
         file_entity, file_created = (
             self._get_or_create_unique_entity(
                 rql=("Any X Where X is ExternalFile, X identifier "
@@ -245,7 +295,7 @@ class WaveImporter(object):
         self._set_unique_relation(
             file_eid, "snap", snap_eid, check_unicity=False)
         self._set_unique_relation(
-            snap_eid, "files", file_eid, check_unicity=False)
+            snap_eid, relation, file_eid, check_unicity=False)
 
     def add_user(self, user_name, password, group_name="users"):
         """ Add a new user in the database.
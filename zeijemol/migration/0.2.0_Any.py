@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Migration script executed when upgrading an instance to the 0.2.0
+version.
+"""
+
+# Add the per snapset score counters and fill them from the existing scores
+add_attribute("SnapSet", "nb_scores")
+add_relation_definition("SnapSet", "rated_by", "CWUser")
+rql("SET S nb_scores 0 Where S is SnapSet")
+for snapset_eid, nb_scores in rql(
+        "Any S, COUNT(R) GROUPBY S Where R snapset S"):
+    rql("SET S nb_scores {0} Where S eid '{1}'".format(nb_scores, snapset_eid))
+rql("SET S rated_by U Where R snapset S, R scored_by U, NOT S rated_by U")
+commit()
+
+# Scores are only linked to their snapset through the 'snapset' relation
+sync_schema_props_perms(("Score", "snapset", "SnapSet"))
+drop_relation_type("scores")
+commit()
+
+# Materialize the rating statistics from the existing scores
+from cubes.zeijemol.stats import rebuild_rating_stats
+add_entity_type("RatingStat")
+with cnx.security_enabled(read=False, write=False):
+    rebuild_rating_stats(cnx)
+commit()
+
+# Index the wave names, score answers and scores creation date used to
+# filter the ratings
+sync_schema_props_perms(("Wave", "name", "String"))
+sync_schema_props_perms(("Score", "score", "String"))
+sql("CREATE INDEX score_creation_date_idx ON cw_Score(cw_creation_date)")
+commit()
+
+# The 'TRIPLANAR-STACK' slices are packed in atlases at import, the snaps
+# imported before keep loading their slices one by one. The atlas files are
+# only linked through the 'atlases' relation.
+sync_schema_props_perms(("Snap", "files", "ExternalFile"))
+add_attribute("Snap", "atlas_index")
+add_relation_definition("Snap", "atlases", "ExternalFile")
+commit()
+
+# Index the files SHA1 sums used to serve the content-addressed files
+sync_schema_props_perms(("ExternalFile", "sha1hex", "String"))
+commit()
+
+# Store the image files size and mode, the headers are read in parallel
+from cubes.zeijemol.images import IMAGE_DTYPES
+from cubes.zeijemol.images import read_image_headers
+for attribute in ("width", "height", "mode"):
+    add_attribute("ExternalFile", attribute)
+commit()
+rset = rql("Any F, P Where F is ExternalFile, F filepath P, F dtype IN ({0}), "
+           "F width NULL".format(",".join(
+                "'{0}'".format(dtype) for dtype in IMAGE_DTYPES)))
+chunk_size = 1000
+for start in range(0, rset.rowcount, chunk_size):
+    rows = rset.rows[start: start + chunk_size]
+    headers = read_image_headers([filepath for _, filepath in rows])
+    for (file_eid, filepath), header in zip(rows, headers):
+        if header is None:
+            print("Can't read the image header of '{0}'.".format(filepath))
+            continue
+        width, height, mode = header
+        rql("SET F width %(w)s, F height %(h)s, F mode %(m)s "
+            "Where F eid %(f)s",
+            {"w": width, "h": height, "m": unicode(mode), "f": file_eid})
+    commit()
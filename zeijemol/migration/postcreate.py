@@ -19,3 +19,5 @@ set_property("ui.site-title", "")
 # Change pagination properties
 set_property("navigation.page-size", "40")
 
+# Index the scores creation date used to filter the ratings
+sql("CREATE INDEX score_creation_date_idx ON cw_Score(cw_creation_date)")
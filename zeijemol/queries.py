@@ -0,0 +1,462 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Aggregation queries behind the Status and Ratings views and exports.
+
+The counts are computed by the database with grouped RQL queries: no
+Score row is transferred to compute a statistic.
+"""
+
+# System import
+import json
+import datetime
+
+
+def wave_restriction(wave_name, variable="W"):
+    """ Build an optional restriction on the wave name.
+
+    Parameters
+    ----------
+    wave_name: str or None
+        the wave name, None for all the waves.
+    variable: str (optional, default 'W')
+        the wave variable in the query.
+
+    Returns
+    -------
+    restriction: str
+        the restriction to be appended to the query.
+    args: dict
+        the restriction arguments.
+    """
+    if wave_name is None:
+        return "", {}
+    return ", {0} name %(wave)s".format(variable), {"wave": wave_name}
+
+
+def rating_counts(cnx, wave_name=None, materialized=True):
+    """ Count the scores per wave, rater and answer.
+
+    Parameters
+    ----------
+    cnx: Connection or request
+        used to execute the query.
+    wave_name: str (optional, default None)
+        restrict the counts to this wave.
+    materialized: bool (optional, default True)
+        if True read the 'RatingStat' entities maintained by the hooks,
+        otherwise count the Score table with a single grouped query.
+
+    Returns
+    -------
+    counts: dict
+        the counts organized by wave name, rater login and answer.
+    """
+    restriction, args = wave_restriction(wave_name)
+    if materialized:
+        rset = cnx.execute(
+            "Any WN, UN, A, C Where X is RatingStat, X stat_wave W, "
+            "W name WN, X stat_rater U, U login UN, X answer A, "
+            "X count C{0}".format(restriction), args)
+    else:
+        rset = cnx.execute(
+            "Any WN, UN, SC, COUNT(R) GROUPBY WN, UN, SC Where R is Score, "
+            "R snapset S, W snapsets S, W name WN, R scored_by U, "
+            "U login UN, R score SC{0}".format(restriction), args)
+    counts = {}
+    for wave_name, rater, answer, count in rset:
+        counts.setdefault(wave_name, {}).setdefault(rater, {})[answer] = count
+    return counts
+
+
+def snapset_counts(cnx, wave_name=None):
+    """ Count the snapsets of each wave with a single grouped query.
+
+    Parameters
+    ----------
+    cnx: Connection or request
+        used to execute the query.
+    wave_name: str (optional, default None)
+        restrict the counts to this wave.
+
+    Returns
+    -------
+    counts: dict
+        the wave names as keys and the number of snapsets as values.
+    """
+    restriction, args = wave_restriction(wave_name)
+    rset = cnx.execute(
+        "Any WN, COUNT(S) GROUPBY WN Where W is Wave, W name WN, "
+        "W snapsets S{0}".format(restriction), args)
+    return dict(rset)
+
+
+def score_summary(cnx):
+    """ Get the number of scores, the last score eid and the last score
+    modification date of each wave with a single grouped query.
+
+    The modification date marks the score answer updates which change
+    neither the number of scores nor the last score eid.
+
+    Parameters
+    ----------
+    cnx: Connection or request
+        used to execute the query.
+
+    Returns
+    -------
+    summary: list of 4-uplet
+        the wave eid, the number of scores, the max score eid and the max
+        score modification date, sorted by wave eid.
+    """
+    rset = cnx.execute(
+        "Any W, COUNT(R), MAX(R), MAX(D) GROUPBY W Where W snapsets S, "
+        "R snapset S, R modification_date D")
+    return sorted(tuple(row) for row in rset)
+
+
+def status_tables(cnx, wave_name=None, materialized=True):
+    """ Get the rating status tables: one for each wave.
+
+    Parameters
+    ----------
+    cnx: Connection or request
+        used to execute the queries.
+    wave_name: str (optional, default None)
+        restrict the tables to this wave.
+    materialized: bool (optional, default True)
+        if True use the materialized rating statistics, otherwise count the
+        Score table.
+
+    Returns
+    -------
+    tables: list of 3-uplet
+        the wave name, the table labels and the table records.
+    """
+    # Get the number of scores per wave, rater and answer, the waves
+    # possible scores, ie. table headers, and the number of snaps associated
+    # to each wave
+    counts = rating_counts(cnx, wave_name, materialized=materialized)
+    waves_struct = dict(
+        (metadata.name, metadata.score_definitions)
+        for metadata in cnx.vreg.wave_metadata.all(cnx))
+    nb_of_snapsets = snapset_counts(cnx, wave_name)
+
+    # Construct all table: one for each wave
+    tables = []
+    for wave_name, wave_struct in counts.items():
+
+        # Get wave labels
+        labels = ["UID", "Number of rates"] + waves_struct[wave_name]
+        records = []
+
+        # Fill the record
+        for rater, rater_counts in wave_struct.items():
+            nb_rates = sum(rater_counts.values())
+            rater_record = [
+                rater,
+                "{0}/{1}".format(nb_rates, nb_of_snapsets[wave_name])]
+            for score_definition in waves_struct[wave_name]:
+                rater_record.append("{0}/{1}".format(
+                    rater_counts.get(score_definition, 0), nb_rates))
+            records.append(rater_record)
+        tables.append((wave_name, labels, records))
+    return tables
+
+
+# The Ratings table columns
+RATINGS_LABELS = ["UID", "TIMESTAMP", "WAVE NAME", "SID", "ANSWER",
+                  "EXTRA ANSWERS"]
+
+
+# The Ratings table filters, given as request parameters: the dates filters
+# names differ from the DataTables 'start' paging parameter
+RATINGS_FILTERS = ("wave", "rater", "answer", "from_date", "to_date")
+
+
+# The maximum number of records of a Ratings table page served at once
+RATINGS_PAGE_MAX_LENGTH = 100
+
+
+def ratings_filters(form):
+    """ Extract the Ratings table filters from request parameters.
+
+    Parameters
+    ----------
+    form: dict
+        the request parameters.
+
+    Returns
+    -------
+    filters: dict
+        the non empty 'wave', 'rater', 'answer', 'from_date' and 'to_date'
+        filters.
+    """
+    filters = {}
+    for name in RATINGS_FILTERS:
+        value = form.get(name, u"").strip()
+        if value:
+            filters[name] = value
+    return filters
+
+
+def parse_date(value, end=False):
+    """ Parse a 'YYYY-MM-DD' or 'YYYY-MM-DDTHH:MM' date filter.
+
+    Parameters
+    ----------
+    value: str
+        the date to parse.
+    end: bool (optional, default False)
+        if True and the value is a day, return the first instant of the
+        next day so that the whole day is included in a '<' restriction.
+
+    Returns
+    -------
+    date: datetime
+        the parsed date.
+    """
+    for fmt in ("%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    try:
+        date = datetime.datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError("Invalid date '{0}': expect 'YYYY-MM-DD' or "
+                         "'YYYY-MM-DDTHH:MM'.".format(value))
+    if end:
+        date += datetime.timedelta(days=1)
+    return date
+
+
+def ratings_restriction(filters=None):
+    """ Build the restriction selecting the scores of the Ratings table.
+
+    The filters are pushed into the query so that the database only reads
+    the matching scores through the wave name, rater login, score answer
+    and creation date indexes.
+
+    Parameters
+    ----------
+    filters: dict (optional, default None)
+        the 'wave', 'rater', 'answer', 'from_date' and 'to_date'
+        filters.
+
+    Returns
+    -------
+    restriction: str
+        the restriction with the score R, snapset S, wave W, rater U and
+        rater login UN variables.
+    args: dict
+        the restriction arguments.
+    """
+    filters = filters or {}
+    restriction = ("R is Score, R snapset S, W snapsets S, R scored_by U, "
+                   "U login UN")
+    args = {}
+    if "wave" in filters:
+        restriction += ", W name %(wave)s"
+        args["wave"] = filters["wave"]
+    if "rater" in filters:
+        restriction += ", U login %(rater)s"
+        args["rater"] = filters["rater"]
+    if "answer" in filters:
+        restriction += ", R score %(answer)s"
+        args["answer"] = filters["answer"]
+    if "from_date" in filters:
+        restriction += ", R creation_date >= %(from_date)s"
+        args["from_date"] = parse_date(filters["from_date"])
+    if "to_date" in filters:
+        restriction += ", R creation_date < %(to_date)s"
+        args["to_date"] = parse_date(filters["to_date"], end=True)
+    return restriction, args
+
+
+def escape_like(pattern):
+    """ Escape the wildcards of a LIKE pattern so that it is matched
+    literally.
+
+    Parameters
+    ----------
+    pattern: str
+        the searched text.
+
+    Returns
+    -------
+    pattern: str
+        the text with its '%', '_' and escape characters escaped.
+    """
+    for character in ("\\", "%", "_"):
+        pattern = pattern.replace(character, "\\" + character)
+    return pattern
+
+
+def ratings_page(cnx, start=0, length=10, search=None, sort_dir="asc",
+                 filters=None):
+    """ Get a page of the Ratings table with paging, sorting and search done
+    in the database.
+
+    Parameters
+    ----------
+    cnx: Connection or request
+        used to execute the queries.
+    start: int (optional, default 0)
+        the index of the first record.
+    length: int (optional, default 10)
+        the number of records, -1 for all the records.
+    search: str (optional, default None)
+        a text searched in the raters login (the first column).
+    sort_dir: str (optional, default 'asc')
+        the raters login sort direction: 'asc' or 'desc'.
+    filters: dict (optional, default None)
+        the 'wave', 'rater', 'answer', 'from_date' and 'to_date'
+        filters.
+
+    Returns
+    -------
+    nb_records: int
+        the total number of records matching the filters.
+    nb_filtered: int
+        the number of these records matching the search pattern.
+    records: list of list
+        the page records.
+    """
+    restriction, args = ratings_restriction(filters)
+    nb_records = cnx.execute(
+        "Any COUNT(R) Where {0}".format(restriction), args)[0][0]
+    if search:
+        restriction += ", U login ILIKE %(search)s"
+        args["search"] = u"%{0}%".format(escape_like(search))
+        nb_filtered = cnx.execute(
+            "Any COUNT(R) Where {0}".format(restriction), args)[0][0]
+    else:
+        nb_filtered = nb_records
+    sort_dir = "DESC" if sort_dir.lower() == "desc" else "ASC"
+    limit = ""
+    if length >= 0:
+        limit = " LIMIT {0} OFFSET {1}".format(int(length), int(start))
+    rset = cnx.execute(
+        "Any UN, D, WN, SN, SC, ESC, R ORDERBY UN {0}, R{1} Where {2}, "
+        "W name WN, S name SN, R creation_date D, R score SC, "
+        "R extra_scores ESC".format(sort_dir, limit, restriction), args)
+    records = [rating_record(row) for row in rset]
+    return nb_records, nb_filtered, records
+
+
+def iter_ratings(cnx, chunk_size=1000, filters=None):
+    """ Iterate over all the records of the Ratings table.
+
+    Parameters
+    ----------
+    cnx: Connection or request
+        used to execute the queries.
+    chunk_size: int (optional, default 1000)
+        the number of scores loaded by each query.
+    filters: dict (optional, default None)
+        the 'wave', 'rater', 'answer', 'from_date' and 'to_date'
+        filters.
+
+    Returns
+    -------
+    records: generator of list
+        the Ratings table records.
+    """
+    for row in iter_rating_rows(cnx, chunk_size=chunk_size, filters=filters):
+        yield rating_record(row)
+
+
+def iter_by_eid(cnx, selection, restriction, args=None, variable="R",
+                chunk_size=1000):
+    """ Iterate over the rows of a query by chunks ordered by eid.
+
+    Each chunk starts after the last eid of the previous one, so that the
+    memory usage does not depend on the number of rows.
+
+    Parameters
+    ----------
+    cnx: Connection or request
+        used to execute the queries.
+    selection: str
+        the selected variables, the last one being the ordering variable.
+    restriction: str
+        the query restriction.
+    args: dict (optional, default None)
+        the restriction arguments.
+    variable: str (optional, default 'R')
+        the variable whose eid orders the rows.
+    chunk_size: int (optional, default 1000)
+        the number of rows loaded by each query.
+
+    Returns
+    -------
+    rows: generator of list
+        the selected rows.
+    """
+    args = dict(args or {}, last=0)
+    rql = "Any {0} ORDERBY {1} LIMIT {2} Where {3}, {1} eid > %(last)s".format(
+        selection, variable, int(chunk_size), restriction)
+    while True:
+        rset = cnx.execute(rql, args)
+        for row in rset:
+            yield row
+        if rset.rowcount < chunk_size:
+            break
+        args["last"] = rset[-1][-1]
+
+
+def iter_rating_rows(cnx, chunk_size=1000, filters=None):
+    """ Iterate over the raw rows of the Ratings table, loaded by chunks
+    ordered by score eid.
+
+    Parameters
+    ----------
+    cnx: Connection or request
+        used to execute the queries.
+    chunk_size: int (optional, default 1000)
+        the number of scores loaded by each query.
+    filters: dict (optional, default None)
+        the 'wave', 'rater', 'answer', 'from_date' and 'to_date'
+        filters.
+
+    Returns
+    -------
+    rows: generator of list
+        the rater login, score creation date, wave name, snapset name,
+        answer, extra answers and score eid.
+    """
+    restriction, args = ratings_restriction(filters)
+    return iter_by_eid(
+        cnx, "UN, D, WN, SN, SC, ESC, R",
+        "{0}, W name WN, S name SN, R creation_date D, R score SC, "
+        "R extra_scores ESC".format(restriction), args,
+        chunk_size=chunk_size)
+
+
+def rating_record(row):
+    """ Format a Ratings table record.
+
+    Parameters
+    ----------
+    row: list
+        the rater login, score creation date, wave name, snapset name,
+        answer, extra answers and score eid.
+
+    Returns
+    -------
+    record: list
+        the Ratings table record.
+    """
+    rater, timestamp, wave_name, sid, answers, extra_answers, _ = row
+    extra_answers = json.loads(extra_answers)
+    if not isinstance(extra_answers, list):
+        extra_answers = [extra_answers]
+    extra_answers = ",".join(extra_answers)
+    return [rater, timestamp.isoformat(), wave_name, sid, answers,
+            extra_answers]
@@ -0,0 +1,82 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" HTTP conditional and partial requests helpers of the file endpoint.
+"""
+
+
+def parse_range(header, size):
+    """ Parse the 'Range' header of a request for a single byte range.
+
+    The headers with an other unit, several ranges or an invalid syntax are
+    ignored, so that the whole file is served.
+
+    Parameters
+    ----------
+    header: str
+        the 'Range' header value, None if not specified.
+    size: int
+        the size of the file in bytes.
+
+    Returns
+    -------
+    byte_range: 2-uplet or None
+        the first byte and the end byte (excluded) of the range, None if the
+        whole file must be served.
+
+    Raises
+    ------
+    ValueError
+        if the range is not satisfiable.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    if (not (first.isdigit() or first == "") or
+            not (last.isdigit() or last == "") or first == last == ""):
+        return None
+    # > suffix range: the last bytes of the file
+    if first == "":
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Unsatisfiable range '{0}'.".format(header))
+        return max(size - length, 0), size
+    start = int(first)
+    stop = size
+    if last != "":
+        if int(last) < start:
+            return None
+        stop = min(int(last) + 1, size)
+    if start >= size:
+        raise ValueError("Unsatisfiable range '{0}'.".format(header))
+    return start, stop
+
+
+def etag_matches(header, etag):
+    """ Check if an 'If-None-Match' header matches an entity tag.
+
+    Parameters
+    ----------
+    header: str
+        the 'If-None-Match' header value, None if not specified.
+    etag: str
+        the quoted entity tag of the file.
+
+    Returns
+    -------
+    match: bool
+        True if the client copy is up to date.
+    """
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    # > weak comparison
+    return "*" in tags or etag in tags or "W/" + etag in tags
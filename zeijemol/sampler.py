@@ -0,0 +1,435 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" In-memory weighted samplers used to select the next snapset to be rated
+in a wave.
+
+The sampling law is the one historically used by the gallery: a snapset
+rated X times in a wave where Nx snapsets have been rated X times is drawn
+with a probability proportional to 1 / ((X + 1) * Nx), and snapsets already
+rated by the current user get a null probability.
+"""
+
+# System import
+from __future__ import division
+import random
+import threading
+import time
+
+# Zeijemol import
+from cubes.zeijemol.cache import unsafe_read
+
+
+class FenwickTree(object):
+    """ A binary indexed tree over non negative integers supporting point
+    updates, prefix sums and k-th element search in O(log n).
+    """
+    def __init__(self, values):
+        """ Initialize the FenwickTree class in O(n).
+
+        Parameters
+        ----------
+        values: list of int
+            the initial values.
+        """
+        self.size = len(values)
+        self.tree = [0] + list(values)
+        for index in range(1, self.size + 1):
+            parent = index + (index & -index)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[index]
+
+    def add(self, index, delta):
+        """ Add 'delta' to the value stored at position 'index'.
+        """
+        index += 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, index):
+        """ Sum of the values stored in the [0, index[ positions.
+        """
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def range_sum(self, start, stop):
+        """ Sum of the values stored in the [start, stop[ positions.
+        """
+        return self.prefix_sum(stop) - self.prefix_sum(start)
+
+    def find(self, k):
+        """ Find the smallest position such that the sum of the values up to
+        and including this position is strictly greater than 'k'.
+        """
+        position = 0
+        step = 1
+        while step * 2 <= self.size:
+            step *= 2
+        while step > 0:
+            if (position + step <= self.size and
+                    self.tree[position + step] <= k):
+                position += step
+                k -= self.tree[position]
+            step //= 2
+        return position
+
+
+class WaveSampler(object):
+    """ Incremental weighted sampler over the snapsets of one wave.
+
+    The snapsets are stored in an array sorted by number of scores so that
+    the snapsets rated X times form a contiguous bucket. Each registered
+    user owns a Fenwick tree flagging the snapsets not rated yet. A
+    draw first picks a bucket with a probability proportional to
+    Ux / ((X + 1) * Nx), where Ux is the number of snapsets of the bucket
+    not rated by the user, then picks uniformly one of these snapsets. A
+    draw thus costs O(B log n) where B is the number of distinct score
+    counts, which is bounded by the number of raters.
+
+    Drawn snapsets can be leased to the rater for a short time: the
+    snapsets leased by the other raters are then skipped, so that
+    concurrent raters do not receive the same item. Leases expire after
+    their time to live and are released when the rater gives an answer.
+    """
+    def __init__(self, snapset_eids, nb_scores, seed=None):
+        """ Initialize the WaveSampler class.
+
+        Parameters
+        ----------
+        snapset_eids: list of int
+            the wave snapset eids.
+        nb_scores: list of int
+            the number of scores of each snapset.
+        seed: int (optional, default None)
+            a seed for the random generator.
+        """
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        order = sorted(range(len(snapset_eids)), key=lambda i: nb_scores[i])
+        self.eids = [snapset_eids[index] for index in order]
+        self.counts = [int(nb_scores[index] or 0) for index in order]
+        self.positions = dict(
+            (eid, position) for position, eid in enumerate(self.eids))
+        self.buckets = {}
+        for position, count in enumerate(self.counts):
+            bounds = self.buckets.setdefault(count, [position, position])
+            bounds[1] = position + 1
+        self.users = {}
+        self.leases = {}
+        self.clock = time.time
+
+    def __len__(self):
+        return len(self.eids)
+
+    ###########################################################################
+    #   Public Methods
+    ###########################################################################
+
+    def has_user(self, login):
+        """ Check if a user exclusion mask is registered.
+        """
+        return login in self.users
+
+    def register_user(self, login, rated_eids):
+        """ Register the exclusion mask of a user.
+
+        Parameters
+        ----------
+        login: str
+            the user login.
+        rated_eids: list of int
+            the snapsets already rated by the user.
+        """
+        with self.lock:
+            flags = [1] * len(self.eids)
+            for eid in rated_eids:
+                if eid in self.positions:
+                    flags[self.positions[eid]] = 0
+            self.users[login] = (flags, FenwickTree(flags))
+
+    def nb_unrated(self, login):
+        """ Get the number of snapsets the user has not rated yet.
+        """
+        flags, tree = self.users[login]
+        return tree.prefix_sum(tree.size)
+
+    def add_score(self, snapset_eid, login):
+        """ Update the sampler when a score is created.
+
+        Parameters
+        ----------
+        snapset_eid: int
+            the rated snapset eid.
+        login: str
+            the rater login.
+        """
+        with self.lock:
+            if snapset_eid not in self.positions:
+                return
+            position = self.positions[snapset_eid]
+            count = self.counts[position]
+            start, stop = self.buckets[count]
+            last = stop - 1
+            self._swap(position, last)
+            self._move_boundary(count, last)
+            self._set_flag(last, login, 0)
+
+    def draw(self, login, exclude=None, lease_ttl=None):
+        """ Draw a snapset that has not been rated by a user.
+
+        Parameters
+        ----------
+        login: str
+            the user login: the exclusion mask must be registered.
+        exclude: list of int (optional, default None)
+            snapset eids that must not be drawn.
+        lease_ttl: int (optional, default None)
+            if set, skip the snapsets leased by the other users and lease the
+            drawn snapset to the user for 'lease_ttl' seconds. When all the
+            remaining snapsets are leased, the leases are ignored.
+
+        Returns
+        -------
+        snapset_eid: int
+            the selected snapset eid or None if the user has nothing left to
+            rate.
+        """
+        snapset_eids = self.draw_batch(
+            login, 1, exclude=exclude, lease_ttl=lease_ttl)
+        if len(snapset_eids) == 0:
+            return None
+        return snapset_eids[0]
+
+    def draw_batch(self, login, size, exclude=None, lease_ttl=None):
+        """ Draw up to 'size' distinct snapsets that have not been rated by a
+        user.
+
+        The snapsets are drawn one after the other following the sampling
+        law of the not yet drawn snapsets.
+
+        Parameters
+        ----------
+        login: str
+            the user login: the exclusion mask must be registered.
+        size: int
+            the number of snapsets to draw.
+        exclude: list of int (optional, default None)
+            snapset eids that must not be drawn.
+        lease_ttl: int (optional, default None)
+            if set, the leases are handled as described in 'draw' and all the
+            drawn snapsets are leased to the user.
+
+        Returns
+        -------
+        snapset_eids: list of int
+            the selected snapset eids.
+        """
+        with self.lock:
+            exclude = list(exclude or [])
+            leased = []
+            if lease_ttl is not None:
+                leased = self.leased(login)
+            snapset_eids = []
+            for _ in range(size):
+                snapset_eid = self._draw(
+                    login, exclude + snapset_eids + leased)
+                if snapset_eid is None and len(leased) > 0:
+                    snapset_eid = self._draw(login, exclude + snapset_eids)
+                if snapset_eid is None:
+                    break
+                snapset_eids.append(snapset_eid)
+            if lease_ttl is not None:
+                self.release(login)
+                expiry = self.clock() + lease_ttl
+                for snapset_eid in snapset_eids:
+                    self.leases[snapset_eid] = (login, expiry)
+            return snapset_eids
+
+    def leased(self, login):
+        """ Get the snapsets currently leased by the other users.
+
+        Parameters
+        ----------
+        login: str
+            the user login.
+
+        Returns
+        -------
+        snapset_eids: list of int
+            the leased snapsets.
+        """
+        with self.lock:
+            now = self.clock()
+            for snapset_eid, (owner, expiry) in list(self.leases.items()):
+                if expiry <= now:
+                    del self.leases[snapset_eid]
+            return [snapset_eid
+                    for snapset_eid, (owner, _) in self.leases.items()
+                    if owner != login]
+
+    def release(self, login, snapset_eid=None):
+        """ Release the leases of a user.
+
+        Parameters
+        ----------
+        login: str
+            the user login.
+        snapset_eid: int (optional, default None)
+            release only the lease on this snapset.
+        """
+        with self.lock:
+            for eid, (owner, _) in list(self.leases.items()):
+                if owner == login and snapset_eid in (None, eid):
+                    del self.leases[eid]
+
+    ###########################################################################
+    #   Private Methods
+    ###########################################################################
+
+    def _draw(self, login, exclude):
+        """ Draw a snapset that has not been rated by a user, see 'draw'.
+        """
+        with self.lock:
+            flags, tree = self.users[login]
+            masked = []
+            for eid in exclude or []:
+                position = self.positions.get(eid)
+                if position is not None and flags[position] == 1:
+                    tree.add(position, -1)
+                    masked.append(position)
+            try:
+                buckets = []
+                total = 0.
+                for count, (start, stop) in sorted(self.buckets.items()):
+                    nb_unrated = tree.range_sum(start, stop)
+                    if nb_unrated == 0:
+                        continue
+                    weight = nb_unrated / ((count + 1) * (stop - start))
+                    buckets.append((weight, start, nb_unrated))
+                    total += weight
+                if total == 0:
+                    return None
+                threshold = self.random.random() * total
+                for weight, start, nb_unrated in buckets:
+                    threshold -= weight
+                    if threshold < 0:
+                        break
+                offset = self.random.randint(0, nb_unrated - 1)
+                position = tree.find(tree.prefix_sum(start) + offset)
+                return self.eids[position]
+            finally:
+                for position in masked:
+                    tree.add(position, 1)
+
+    def _swap(self, first, second):
+        """ Swap two snapsets in the sorted array.
+        """
+        if first == second:
+            return
+        eids, counts = self.eids, self.counts
+        eids[first], eids[second] = eids[second], eids[first]
+        counts[first], counts[second] = counts[second], counts[first]
+        self.positions[eids[first]] = first
+        self.positions[eids[second]] = second
+        for flags, tree in self.users.values():
+            delta = flags[second] - flags[first]
+            if delta != 0:
+                flags[first], flags[second] = flags[second], flags[first]
+                tree.add(first, delta)
+                tree.add(second, -delta)
+
+    def _move_boundary(self, count, position):
+        """ Move the snapset at the upper edge of the 'count' bucket in the
+        adjacent 'count + 1' bucket.
+        """
+        bounds = self.buckets[count]
+        bounds[1] -= 1
+        self.buckets.setdefault(count + 1, [position + 1, position + 1])
+        self.buckets[count + 1][0] = position
+        if bounds[0] == bounds[1]:
+            del self.buckets[count]
+        self.counts[position] = count + 1
+
+    def _set_flag(self, position, login, value):
+        """ Update the exclusion mask of a user.
+        """
+        if login not in self.users:
+            return
+        flags, tree = self.users[login]
+        if flags[position] != value:
+            tree.add(position, value - flags[position])
+            flags[position] = value
+
+
+class SamplerRegistry(object):
+    """ Process level registry of the wave samplers.
+
+    Samplers are lazily built from the snapset score counters and updated by
+    the Score hooks once the transactions are committed.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samplers = {}
+
+    def get(self, cnx, wave_eid, login):
+        """ Get the sampler of a wave with the exclusion mask of a user.
+
+        Parameters
+        ----------
+        cnx: CubicWeb connection or request
+            used to load the wave counters if necessary.
+        wave_eid: int
+            the wave eid.
+        login: str
+            the user login.
+
+        Returns
+        -------
+        sampler: WaveSampler
+            the wave sampler.
+        """
+        with self.lock:
+            sampler = self.samplers.get(wave_eid)
+            if sampler is None:
+                rset = cnx.execute(
+                    "Any S, N Where W eid '{0}', W snapsets S, "
+                    "S nb_scores N".format(wave_eid))
+                sampler = WaveSampler(
+                    [row[0] for row in rset], [row[1] for row in rset])
+                self.samplers[wave_eid] = sampler
+        if not sampler.has_user(login):
+            with unsafe_read(cnx):
+                rset = cnx.execute(
+                    "Any S Where W eid %(w)s, W snapsets S, S rated_by U, "
+                    "U login %(l)s", {"w": wave_eid, "l": login})
+            sampler.register_user(login, [row[0] for row in rset])
+        return sampler
+
+    def add_score(self, wave_eid, snapset_eid, login):
+        """ Forward a score creation to the wave sampler if loaded.
+        """
+        sampler = self.samplers.get(wave_eid)
+        if sampler is not None:
+            sampler.add_score(snapset_eid, login)
+
+    def release(self, login, snapset_eid):
+        """ Release the lease of a user on a snapset whatever its wave.
+        """
+        for sampler in self.samplers.values():
+            if snapset_eid in sampler.positions:
+                sampler.release(login, snapset_eid)
+
+    def invalidate(self, wave_eid):
+        """ Drop the sampler of a wave: it will be rebuilt on the next draw.
+        """
+        with self.lock:
+            self.samplers.pop(wave_eid, None)
@@ -54,6 +54,7 @@ class Wave(EntityType):
         description=u"a unique identifier for the entity.")
     name = String(
         required=True,
+        indexed=True,
         fulltextindexed=True,
         maxsize=256,
         description=u"a short description of the wave.")
@@ -89,13 +90,15 @@ class SnapSet(EntityType):
         a unique identifier for the entity.
     name: String (mandatory)
         a short description of the wave.
+    nb_scores: Int
+        the number of scores associated to the snapset, maintained by hooks.
 
     Relations
     ---------
     snaps: SubjectRelation
         a SnapSet is connected to one wave.
-    scores: SubjectRelation
-        a score is connected to one snapset.
+    rated_by: SubjectRelation
+        the users that have scored the snapset, maintained by hooks.
     """
     identifier = String(
         required=True,
@@ -107,6 +110,10 @@ class SnapSet(EntityType):
         fulltextindexed=True,
         maxsize=256,
         description=u"a name for the snapset.")
+    nb_scores = Int(
+        default=0,
+        indexed=True,
+        description=u"the number of scores associated to the snapset.")
     snaps = SubjectRelation(
         "Snap",
         cardinality="*1",
@@ -115,11 +122,14 @@ class SnapSet(EntityType):
         "Wave",
         cardinality="1*",
         inlined=False)
-    scores = SubjectRelation(
-        "Score",
-        cardinality="*1",
+    rated_by = SubjectRelation(
+        "CWUser",
+        cardinality="**",
         inlined=False,
-        composite="subject")
+        __permissions__={
+            "read": ("managers", ),
+            "add": ("managers", ),
+            "delete": ("managers", )})
 
 
 class Snap(EntityType):
@@ -133,6 +143,10 @@ class Snap(EntityType):
         a short description of the file.
     viewer: String (mandatory)
         the viewer type: 'TRIPLANAR-STACK', 'TRIPLANAR-IMAGE', 'SURF' or 'FILE'.
+    atlas_index: String (optional)
+        the JSON index of the 'TRIPLANAR-STACK' atlases: the orientations as
+        keys and the tile size, the number of columns and the number of
+        slices of each atlas as values.
 
     Relations
     ---------
@@ -140,6 +154,9 @@ class Snap(EntityType):
         a snap is connected to one snapset.
     files: SubjectRelation
         a snap is connected to files.
+    atlases: SubjectRelation
+        a 'TRIPLANAR-STACK' snap is connected to one atlas file per
+        orientation, described by the orientation.
     """
     identifier = String(
         required=True,
@@ -159,13 +176,20 @@ class Snap(EntityType):
         vocabulary=("TRIPLANAR-STACK", "TRIPLANAR-IMAGE", "SURF", "FILE"),
         description=(u"the viewer type: 'TRIPLANAR-STACK', 'TRIPLANAR-IMAGE', "
                       "'SURF' or 'FILE' are supported."))
+    atlas_index = String(
+        description=u"the JSON index of the slice stack atlases.")
     snapset = SubjectRelation(
         "SnapSet",
         cardinality="1*",
         inlined=False)
     files = SubjectRelation(
         "ExternalFile",
-        cardinality="*+",
+        cardinality="**",
+        inlined=False,
+        composite="subject")
+    atlases = SubjectRelation(
+        "ExternalFile",
+        cardinality="*?",
         inlined=False,
         composite="subject")
 
@@ -189,6 +213,12 @@ class ExternalFile(EntityType):
     dtype: String (mandatory)
         the file type: only 'PDF', 'CTM', 'STATS', 'PNG', 'JPG', 'JPEG' or
         'NIIGZ' are supported.
+    width: Int (optional)
+        the width of an image file in pixels.
+    height: Int (optional)
+        the height of an image file in pixels.
+    mode: String (optional)
+        the PIL mode of an image file.
 
     Relations
     ---------
@@ -210,12 +240,20 @@ class ExternalFile(EntityType):
         description=u"a description for the file.")
     sha1hex = String(
         maxsize=40,
+        indexed=True,
         description=u"the SHA1 sum of the file.")
     dtype = String(
         required=True,
         vocabulary=("CTM", "STATS", "PNG", "JPEG", "JPG", "PDF", "NIIGZ"),
         description=(u"the file type: 'PDF', 'CTM', 'STATS', 'PNG', 'JPG', "
                       "'JPEG' or 'NIIGZ' are supported."))
+    width = Int(
+        description=u"the width of an image file in pixels.")
+    height = Int(
+        description=u"the height of an image file in pixels.")
+    mode = String(
+        maxsize=8,
+        description=u"the PIL mode of an image file.")
     snap = SubjectRelation(
         "Snap",
         cardinality="+*",
@@ -237,7 +275,8 @@ class Score(EntityType):
     Relations
     ---------
     snapset: SubjectRelation
-        a score is connected to one snapset.
+        a score is connected to one snapset, the score is deleted with the
+        snapset.
     scored_by: SubjectRelation
         a score is realted to one user of the database.
     """
@@ -253,13 +292,15 @@ class Score(EntityType):
         description=u"the user that have scored the snap file")
     score = String(
         required=True,
+        indexed=True,
         description=u"the user score.")
     extra_scores = String(
         description=u"the extra user scores.")
     snapset = SubjectRelation(
         "SnapSet",
         cardinality="1*",
-        inlined=False)
+        inlined=False,
+        composite="object")
     scored_by = SubjectRelation(
         "CWUser",
         cardinality="1*",
@@ -267,6 +308,48 @@ class Score(EntityType):
         composite="object")
 
 
+class RatingStat(EntityType):
+    """ An entity used to store the number of scores given by a rater with a
+    specific answer in a wave.
+
+    This materialized statistic is maintained by the Score hooks.
+
+    Attributes
+    ----------
+    answer: String (mandatory)
+        the score answer.
+    count: Int (mandatory)
+        the number of scores.
+
+    Relations
+    ---------
+    stat_wave: SubjectRelation
+        a statistic is connected to one wave, the statistic is deleted with
+        the wave.
+    stat_rater: SubjectRelation
+        a statistic is related to one user of the database, the statistic is
+        deleted with the user.
+    """
+    __unique_together__ = [("stat_wave", "stat_rater", "answer")]
+    answer = String(
+        required=True,
+        description=u"the score answer.")
+    count = Int(
+        required=True,
+        default=0,
+        description=u"the number of scores.")
+    stat_wave = SubjectRelation(
+        "Wave",
+        cardinality="1*",
+        inlined=True,
+        composite="object")
+    stat_rater = SubjectRelation(
+        "CWUser",
+        cardinality="1*",
+        inlined=True,
+        composite="object")
+
+
 ###############################################################################
 # Set permissions
 ###############################################################################
@@ -280,3 +363,13 @@ SCORE_PERMISSIONS = {
     "delete": ("managers", ),
 }
 Score.set_permissions(SCORE_PERMISSIONS)
+
+RATINGSTAT_PERMISSIONS = {
+    "read": (
+        "managers",
+        ERQLExpression("X stat_rater U")),
+    "add": ("managers", ),
+    "update": ("managers", ),
+    "delete": ("managers", ),
+}
+RatingStat.set_permissions(RATINGSTAT_PERMISSIONS)
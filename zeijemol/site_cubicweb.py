@@ -16,4 +16,51 @@ options = (
         "group": "zeijemol",
         "level": 1,
     }),
+    ("snapset_lease_ttl", {
+        "type": "int",
+        "default": 600,
+        "help": "the time (in seconds) a snapset displayed in the gallery is "
+                "reserved for its rater: during this time the snapset is not "
+                "proposed to the other raters unless nothing else is left",
+        "group": "zeijemol",
+        "level": 1,
+    }),
+    ("gallery_batch_size", {
+        "type": "int",
+        "default": 9,
+        "help": "the number of snapsets displayed in the gallery batch mode, "
+                "only available for waves with 'FILE' viewers",
+        "group": "zeijemol",
+        "level": 1,
+    }),
+    ("rating_buffer_interval", {
+        "type": "int",
+        "default": 0,
+        "help": "the interval (in seconds) between two flushes of the rating "
+                "write-behind buffer: the ratings are acknowledged once "
+                "written in a local journal and inserted in the database by "
+                "grouped transactions. The default 0 disables the buffer and "
+                "each rating is committed immediately",
+        "group": "zeijemol",
+        "level": 1,
+    }),
+    ("status_feed_timeout", {
+        "type": "int",
+        "default": 20,
+        "help": "the maximum time (in seconds) a live Status page waits for "
+                "new ratings before polling again: each waiting page holds "
+                "a server thread. A value of 0 disables the live updates of "
+                "the managers Status page",
+        "group": "zeijemol",
+        "level": 1,
+    }),
+    ("pyramid_cache_dir", {
+        "type": "string",
+        "default": "",
+        "help": "the directory where the downscaled levels of the stack "
+                "slices are cached, by default a 'zeijemol-pyramid' "
+                "directory in the system temporary directory",
+        "group": "zeijemol",
+        "level": 1,
+    }),
 )
@@ -0,0 +1,140 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Maintenance of the materialized rating statistics.
+
+A 'RatingStat' entity counts the scores given by a rater with a specific
+answer in a wave. The statistics are updated incrementally by the Score
+hooks and can be rebuilt from the Score table.
+"""
+
+
+def score_key(cnx, score_eid):
+    """ Get the statistic key of a score.
+
+    Parameters
+    ----------
+    cnx: Connection
+        used to execute the query.
+    score_eid: int
+        the score eid.
+
+    Returns
+    -------
+    key: 3-uplet or None
+        the wave eid, the rater eid and the score answer, None if the score
+        is not fully linked.
+    """
+    rset = cnx.execute(
+        "Any W, U, SC Where R eid %(r)s, R snapset S, W snapsets S, "
+        "R scored_by U, R score SC", {"r": score_eid})
+    if rset.rowcount != 1:
+        return None
+    return tuple(rset[0])
+
+
+def update_rating_stats(cnx, deltas):
+    """ Apply count variations to the rating statistics.
+
+    Parameters
+    ----------
+    cnx: Connection
+        used to execute the queries, with the security disabled.
+    deltas: dict
+        the (wave eid, rater eid, answer) keys and the count variations as
+        values.
+    """
+    for (wave_eid, rater_eid, answer), delta in deltas.items():
+        if delta == 0:
+            continue
+        args = {"w": wave_eid, "u": rater_eid, "a": answer, "d": delta}
+        rset = cnx.execute(
+            "SET X count C + %(d)s Where X is RatingStat, X stat_wave W, "
+            "W eid %(w)s, X stat_rater U, U eid %(u)s, X answer %(a)s, "
+            "X count C", args)
+        if rset.rowcount == 0 and delta > 0:
+            cnx.execute(
+                "INSERT RatingStat X: X answer %(a)s, X count %(d)s, "
+                "X stat_wave W, X stat_rater U Where W eid %(w)s, "
+                "U eid %(u)s", args)
+        elif rset.rowcount == 1 and delta < 0:
+            cnx.execute("DELETE RatingStat X Where X eid %(x)s, "
+                        "X count <= 0", {"x": rset[0][0]})
+
+
+def compute_rating_stats(cnx):
+    """ Compute the rating statistics from the Score table.
+
+    Parameters
+    ----------
+    cnx: Connection
+        used to execute the query.
+
+    Returns
+    -------
+    stats: dict
+        the (wave eid, rater eid, answer) keys and the number of scores as
+        values.
+    """
+    rset = cnx.execute(
+        "Any W, U, SC, COUNT(R) GROUPBY W, U, SC Where R is Score, "
+        "R snapset S, W snapsets S, R scored_by U, R score SC")
+    return dict(((wave_eid, rater_eid, answer), count)
+                for wave_eid, rater_eid, answer, count in rset)
+
+
+def stored_rating_stats(cnx):
+    """ Get the stored rating statistics.
+
+    Parameters
+    ----------
+    cnx: Connection
+        used to execute the query.
+
+    Returns
+    -------
+    stats: dict
+        the (wave eid, rater eid, answer) keys and the number of scores as
+        values.
+    """
+    rset = cnx.execute(
+        "Any W, U, A, C Where X is RatingStat, X stat_wave W, "
+        "X stat_rater U, X answer A, X count C")
+    return dict(((wave_eid, rater_eid, answer), count)
+                for wave_eid, rater_eid, answer, count in rset)
+
+
+def rebuild_rating_stats(cnx, check_only=False):
+    """ Compare the stored rating statistics with the Score table and fix
+    them.
+
+    Parameters
+    ----------
+    cnx: Connection
+        used to execute the queries, with the security disabled.
+    check_only: bool (optional, default False)
+        if True only report the differences.
+
+    Returns
+    -------
+    differences: list of 3-uplet
+        the statistic key, the stored count and the expected count of the
+        inconsistent statistics.
+    """
+    expected = compute_rating_stats(cnx)
+    stored = stored_rating_stats(cnx)
+    differences = []
+    for key in sorted(set(expected) | set(stored)):
+        if expected.get(key, 0) != stored.get(key, 0):
+            differences.append(
+                (key, stored.get(key, 0), expected.get(key, 0)))
+    if not check_only:
+        update_rating_stats(cnx, dict(
+            (key, expected_count - stored_count)
+            for key, stored_count, expected_count in differences))
+    return differences
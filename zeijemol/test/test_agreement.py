@@ -0,0 +1,55 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""cubicweb-zeijemol agreement tests"""
+
+# System import
+import unittest
+import numpy
+
+# Zeijemol import
+from cubes.zeijemol.agreement import AnswerMatrix
+
+
+class AnswerMatrixTC(unittest.TestCase):
+
+    def setUp(self):
+        answers = {
+            u"a": [u"yes", u"yes", u"no", u"no", u"yes"],
+            u"b": [u"yes", u"no", u"no", u"no", u"yes"]}
+        scores = [(index, rater, answer)
+                  for rater, rater_answers in sorted(answers.items())
+                  for index, answer in enumerate(rater_answers)]
+        # > a snapset only rated by a third rater
+        scores.append((5, u"c", u"no"))
+        self.matrix = AnswerMatrix.from_scores(
+            scores, answer_labels=[u"yes", u"no", u"maybe"])
+
+    def test_counts(self):
+        self.assertEqual(self.matrix.shape, (6, 3, 3))
+        self.assertEqual(self.matrix.counts().tolist(), [
+            [2, 0, 0], [1, 1, 0], [0, 2, 0], [0, 2, 0], [2, 0, 0],
+            [0, 1, 0]])
+        disagreement = self.matrix.disagreement()
+        self.assertEqual(disagreement[:5].tolist(), [0, 1, 0, 0, 0])
+        self.assertTrue(numpy.isnan(disagreement[5]))
+
+    def test_kappas(self):
+        self.assertAlmostEqual(self.matrix.fleiss_kappa(), 0.6)
+        for chunk_size in (2, 10000):
+            kappa, nb_common = self.matrix.cohen_kappa(chunk_size=chunk_size)
+            self.assertEqual(nb_common.tolist(),
+                             [[5, 5, 0], [5, 5, 0], [0, 0, 1]])
+            self.assertAlmostEqual(kappa[0, 1], (0.8 - 0.48) / 0.52)
+            self.assertAlmostEqual(kappa[1, 0], kappa[0, 1])
+            self.assertAlmostEqual(kappa[0, 0], 1)
+            self.assertTrue(numpy.isnan(kappa[0, 2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""cubicweb-zeijemol atlas tests"""
+
+# System import
+import os
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+
+# Zeijemol import
+from cubes.zeijemol.atlas import atlas_layout
+from cubes.zeijemol.atlas import pack_atlas
+from cubes.zeijemol.atlas import tile_offset
+
+
+class AtlasTC(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.paths = []
+        for index in range(5):
+            path = os.path.join(self.tmpdir, "slice-{0}.png".format(index))
+            Image.new("L", (4, 3), color=index * 10).save(path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_layout(self):
+        self.assertEqual(atlas_layout(1), (1, 1))
+        self.assertEqual(atlas_layout(5), (3, 2))
+        self.assertEqual(atlas_layout(128), (12, 11))
+
+    def test_pack(self):
+        atlas_path = os.path.join(self.tmpdir, "atlas.png")
+        atlas_index = pack_atlas(self.paths, atlas_path)
+        self.assertEqual(atlas_index,
+                         {"tile": [4, 3], "columns": 3, "nb_slices": 5})
+        with Image.open(atlas_path) as atlas:
+            self.assertEqual(atlas.size, (12, 6))
+            for index in range(5):
+                x, y = tile_offset(index, atlas_index)
+                self.assertEqual(atlas.getpixel((x + 3, y + 2)), index * 10)
+
+    def test_size_mismatch(self):
+        Image.new("L", (3, 3)).save(self.paths[-1])
+        self.assertRaises(ValueError, pack_atlas, self.paths,
+                          os.path.join(self.tmpdir, "atlas.png"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""cubicweb-zeijemol rating buffer tests"""
+
+# System import
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+# Zeijemol import
+from cubes.zeijemol.buffer import INSERT_SCORE
+from cubes.zeijemol.buffer import RatingBuffer
+from cubes.zeijemol.buffer import score_row
+
+
+class ScoreConnection(object):
+    """ A connection storing the inserted scores of existing snapsets.
+    """
+    def __init__(self, snapset_eids):
+        self.snapset_eids = snapset_eids
+        self.scores = []
+        self.transaction = []
+        self.fail = False
+        self.invalid_snapsets = set()
+
+    def execute(self, rql, args=None):
+        if self.fail:
+            raise ValueError("database error")
+        if rql == INSERT_SCORE:
+            if args["snapset"] in self.invalid_snapsets:
+                raise ValueError("invalid score")
+            self.transaction.append(args)
+            return []
+        if rql.startswith("Any I"):
+            return [[score["identifier"]] for score in self.scores]
+        return [[eid] for eid in self.snapset_eids]
+
+    def commit(self):
+        self.scores.extend(self.transaction)
+        self.transaction = []
+
+    def rollback(self):
+        self.transaction = []
+
+
+class RatingBufferTC(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.journal = os.path.join(self.tmpdir, "ratings.journal")
+        self.cnx = ScoreConnection([10, 11, 12])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_grouped_flush(self):
+        rating_buffer = RatingBuffer(self.journal)
+        for eid in (10, 11, 12):
+            rating_buffer.append(score_row("rater", 1, eid, "Good", []))
+        self.assertEqual(sorted(rating_buffer.pending("rater")), [10, 11, 12])
+        self.assertEqual(rating_buffer.pending("other"), [])
+        self.assertEqual(rating_buffer.flush(self.cnx), 3)
+        self.assertEqual(len(self.cnx.scores), 3)
+        self.assertEqual(len(rating_buffer), 0)
+        self.assertEqual(os.path.getsize(self.journal), 0)
+
+    def test_replay_after_crash(self):
+        rating_buffer = RatingBuffer(self.journal)
+        rating_buffer.append(score_row("rater", 1, 10, "Good", ["blur"]))
+        rating_buffer.append(score_row("rater", 1, 11, "Bad", []))
+        # > crash: a partial line is left at the end of the journal
+        with open(self.journal, "a") as open_file:
+            open_file.write('{"uid": "rat')
+        rating_buffer = RatingBuffer(self.journal)
+        self.assertEqual(sorted(rating_buffer.pending("rater")), [10, 11])
+        self.assertEqual(rating_buffer.flush(self.cnx), 2)
+        self.assertEqual(self.cnx.scores[0]["extra_scores"], '["blur"]')
+
+    def test_flush_is_idempotent(self):
+        rating_buffer = RatingBuffer(self.journal)
+        rating_buffer.append(score_row("rater", 1, 10, "Good", []))
+        # > already stored (crash before the journal truncation) and
+        # removed snapsets are dropped
+        self.cnx.scores.append(score_row("rater", 1, 10, "Good", []))
+        rating_buffer.append(score_row("rater", 1, 10, "Good", []))
+        rating_buffer.append(score_row("rater", 1, 99, "Good", []))
+        rating_buffer.append(score_row("rater", 1, 11, "Good", []))
+        self.assertEqual(rating_buffer.flush(self.cnx), 1)
+        self.assertEqual(len(self.cnx.scores), 2)
+        self.assertEqual(len(rating_buffer), 0)
+
+    def test_failed_flush_keeps_ratings(self):
+        rating_buffer = RatingBuffer(self.journal)
+        rating_buffer.append(score_row("rater", 1, 10, "Good", []))
+        self.cnx.fail = True
+        self.assertEqual(rating_buffer.flush(self.cnx), 0)
+        self.assertEqual(self.cnx.scores, [])
+        self.assertEqual(rating_buffer.pending("rater"), [10])
+        self.cnx.fail = False
+        self.assertEqual(rating_buffer.flush(self.cnx), 1)
+
+    def test_invalid_ratings_rejected(self):
+        rating_buffer = RatingBuffer(self.journal)
+        for eid in (10, 11, 12):
+            rating_buffer.append(score_row("rater", 1, eid, "Good", []))
+        self.cnx.invalid_snapsets.add(11)
+        self.assertEqual(rating_buffer.flush(self.cnx), 2)
+        self.assertEqual(sorted(score["snapset"] for score in self.cnx.scores),
+                         [10, 12])
+        self.assertEqual(len(rating_buffer), 0)
+        with open(self.journal + ".rejected") as open_file:
+            self.assertEqual([json.loads(line)["snapset"]
+                              for line in open_file], [11])
+
+
+if __name__ == "__main__":
+    unittest.main()
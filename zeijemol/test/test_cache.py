@@ -0,0 +1,152 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""cubicweb-zeijemol cache tests"""
+
+# System import
+import unittest
+import contextlib
+
+# Zeijemol import
+from cubes.zeijemol.cache import CompletionCache
+from cubes.zeijemol.cache import WaveMetadataCache
+from cubes.zeijemol.cache import PayloadCache
+from cubes.zeijemol.cache import progress
+
+
+class WaveConnection(object):
+    """ A connection answering the completion cache queries from a
+    {wave_eid: (name, category, snapset_eids)} structure and a
+    {login: rated_snapset_eids} structure.
+    """
+    def __init__(self, waves, rated):
+        self.waves = waves
+        self.rated = rated
+        self.nb_queries = 0
+
+    @contextlib.contextmanager
+    def security_enabled(self, read=None, write=None):
+        yield
+
+    def execute(self, rql, args=None):
+        self.nb_queries += 1
+        if "rated_by" in rql:
+            return [[eid, len(set(snapset_eids) & self.rated[args["l"]])]
+                    for eid, (_, _, snapset_eids) in self.waves.items()]
+        return [[eid, name, category, len(snapset_eids)]
+                for eid, (name, category, snapset_eids) in self.waves.items()]
+
+
+class CompletionCacheTC(unittest.TestCase):
+
+    def setUp(self):
+        self.cnx = WaveConnection(
+            {1: (u"qc", u"T1", [10, 11, 12, 13]), 2: (u"fs", u"T1", [20]),
+             3: (u"empty", u"T2", [])},
+            {"rater": set([10, 20]), "other": set()})
+
+    def test_completion_is_cached(self):
+        cache = CompletionCache()
+        completion = cache.completion(self.cnx, "rater")
+        self.assertEqual(sorted(completion.tolist()),
+                         [(1, u"qc", u"T1", 4, 1), (2, u"fs", u"T1", 1, 1),
+                          (3, u"empty", u"T2", 0, 0)])
+        self.assertEqual(progress(completion).tolist(), [25, 100, 100])
+        # > one grouped query for the waves and one for the user
+        nb_queries = self.cnx.nb_queries
+        self.assertEqual(nb_queries, 2)
+        self.assertEqual(cache.progress(self.cnx, 1, "rater"), 25)
+        self.assertEqual(cache.completion(self.cnx, "other").nb_rated.tolist(),
+                         [0, 0, 0])
+        self.assertEqual(self.cnx.nb_queries, nb_queries + 1)
+
+    def test_updates(self):
+        cache = CompletionCache()
+        cache.add_score(1, "rater", cache.stamp())
+        self.assertEqual(cache.progress(self.cnx, 1, "rater"), 25)
+        cache.add_score(1, "rater", cache.stamp())
+        self.assertEqual(cache.progress(self.cnx, 1, "rater"), 50)
+        cache.invalidate()
+        self.assertEqual(cache.progress(self.cnx, 1, "rater"), 25)
+        self.assertRaises(ValueError, cache.progress, self.cnx, 4, "rater")
+
+    def test_overlapping_load(self):
+        cache = CompletionCache()
+        cache.progress(self.cnx, 1, "other")
+        stamp = cache.stamp()
+        # > the rating is committed while the counters are loaded
+        self.cnx.rated["rater"].add(11)
+        self.assertEqual(cache.progress(self.cnx, 1, "rater"), 50)
+        nb_queries = self.cnx.nb_queries
+        cache.add_score(1, "rater", stamp)
+        cache.add_score(1, "other", stamp)
+        self.assertEqual(cache.progress(self.cnx, 1, "other"), 25)
+        self.assertEqual(self.cnx.nb_queries, nb_queries)
+        self.assertEqual(cache.progress(self.cnx, 1, "rater"), 50)
+        self.assertEqual(self.cnx.nb_queries, nb_queries + 1)
+
+
+class MetadataConnection(object):
+    """ A connection answering the wave metadata query with fixed rows.
+    """
+    def __init__(self, rows, viewer_rows=None):
+        self.rows = rows
+        self.viewer_rows = viewer_rows or []
+        self.nb_queries = 0
+
+    @contextlib.contextmanager
+    def security_enabled(self, read=None, write=None):
+        yield
+
+    def execute(self, rql, args=None):
+        self.nb_queries += 1
+        if "viewer" in rql:
+            return self.viewer_rows
+        return self.rows
+
+
+class WaveMetadataCacheTC(unittest.TestCase):
+
+    def test_parsed_metadata(self):
+        rows = [[1, u"qc", u"T1", u"<p>doc</p>", u'["Good", "Bad"]', None,
+                 None],
+                [2, u"fs", u"T1", u"<p>doc</p>", u'["Good"]', None, None]]
+        cnx = MetadataConnection(rows, viewer_rows=[[2, 3]])
+        cache = WaveMetadataCache()
+        metadata = cache.get(cnx, name=u"qc")
+        self.assertEqual(metadata.score_definitions, [u"Good", u"Bad"])
+        self.assertEqual(metadata.extra_answers, [])
+        self.assertTrue(metadata.file_only)
+        self.assertFalse(cache.get(cnx, 2).file_only)
+        self.assertTrue(cache.get(cnx, 1) is metadata)
+        self.assertEqual(cnx.nb_queries, 2)
+        rows[0][5] = u'["blur"]'
+        cache.invalidate()
+        self.assertEqual(cache.version, 1)
+        self.assertEqual(cache.get(cnx, 1).extra_answers, [u"blur"])
+        self.assertRaises(ValueError, cache.get, cnx, name=u"t2")
+
+
+class PayloadCacheTC(unittest.TestCase):
+
+    def test_least_recently_used(self):
+        cache = PayloadCache(size=2)
+        computed = []
+
+        def compute(key):
+            computed.append(key)
+            return key.upper()
+
+        for key in ("a", "b", "a", "c", "a", "b"):
+            self.assertEqual(cache.get(key, lambda: compute(key)),
+                             key.upper())
+        self.assertEqual(computed, ["a", "b", "c", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
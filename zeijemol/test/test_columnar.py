@@ -0,0 +1,57 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""cubicweb-zeijemol columnar export tests"""
+
+# System import
+import datetime
+import unittest
+from StringIO import StringIO
+import numpy
+
+# Zeijemol import
+from cubes.zeijemol.columnar import RatingsColumns
+
+
+class RatingsColumnsTC(unittest.TestCase):
+
+    def test_empty(self):
+        arrays = RatingsColumns().arrays()
+        self.assertEqual(arrays["rater"].shape, (0, ))
+        self.assertEqual(arrays["timestamp"].dtype, numpy.int64)
+        self.assertEqual(arrays["extra_answers"].shape, (0, 0))
+
+    def test_columns(self):
+        columns = RatingsColumns()
+        columns.chunk_size = 2
+        date = datetime.datetime(2017, 3, 1, 12, 0, 0, 5)
+        columns.add(u"a", date, u"qc", u"s1", u"Good", u'["blur"]')
+        columns.add(u"b", date, u"qc", u"s1", u"Bad", u'["motion", "blur"]')
+        columns.add(u"a", date, u"fs", u"s2", u"Good", u'"motion"')
+        columns.add(u"a", date, u"fs", u"s3", u"Good", None)
+        stream = StringIO()
+        columns.save(stream)
+        stream.seek(0)
+        arrays = numpy.load(stream)
+        self.assertEqual(arrays["rater"].tolist(), [0, 1, 0, 0])
+        self.assertEqual(arrays["rater_labels"].tolist(), [u"a", u"b"])
+        self.assertEqual(arrays["wave"].dtype, numpy.int32)
+        self.assertEqual(arrays["snapset"].tolist(), [0, 0, 1, 2])
+        self.assertEqual(arrays["answer_labels"][arrays["answer"]].tolist(),
+                         [u"Good", u"Bad", u"Good", u"Good"])
+        self.assertEqual(arrays["timestamp"].tolist(),
+                         [1488369600000005] * 4)
+        self.assertEqual(arrays["extra_answers_labels"].tolist(),
+                         [u"blur", u"motion"])
+        self.assertEqual(arrays["extra_answers"].tolist(),
+                         [[True, False], [True, True], [False, True],
+                          [False, False]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""cubicweb-zeijemol status feed tests"""
+
+# System import
+import time
+import unittest
+import threading
+
+# Zeijemol import
+from cubes.zeijemol.feed import StatusFeed
+
+
+def delta(rater, value=1):
+    return {"wave": u"qc", "rater": rater, "answer": u"Good", "delta": value}
+
+
+class StatusFeedTC(unittest.TestCase):
+
+    def test_since(self):
+        feed = StatusFeed(size=2)
+        feed.publish([delta(u"a")])
+        feed.publish([])
+        feed.publish([delta(u"b"), delta(u"c", -1)])
+        self.assertEqual(feed.since(feed.epoch, 0, 0),
+                         (2, [delta(u"a"), delta(u"b"), delta(u"c", -1)]))
+        self.assertEqual(feed.since(feed.epoch, 1, 0),
+                         (2, [delta(u"b"), delta(u"c", -1)]))
+        self.assertEqual(feed.since(feed.epoch, 2, 0), (2, []))
+        # > unknown epoch or dropped deltas: reload
+        self.assertEqual(feed.since(u"other", 2, 0), (2, None))
+        feed.publish([delta(u"d")])
+        feed.publish([delta(u"e")])
+        self.assertEqual(feed.since(feed.epoch, 1, 0), (4, None))
+        self.assertEqual(feed.since(feed.epoch, 2, 0),
+                         (4, [delta(u"d"), delta(u"e")]))
+
+    def test_wait(self):
+        feed = StatusFeed()
+        timer = threading.Timer(0.1, feed.publish, [[delta(u"a")]])
+        timer.start()
+        start = time.time()
+        self.assertEqual(feed.since(feed.epoch, 0, 5), (1, [delta(u"a")]))
+        self.assertTrue(time.time() - start < 5)
+        timer.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
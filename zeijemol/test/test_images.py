@@ -0,0 +1,63 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""cubicweb-zeijemol image metadata tests"""
+
+# System import
+import os
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+
+# Zeijemol import
+from cubes.zeijemol.images import image_header
+from cubes.zeijemol.images import read_image_headers
+from cubes.zeijemol.images import level_size
+from cubes.zeijemol.images import pyramid_level
+
+
+class ImagesTC(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_headers(self):
+        paths = []
+        for index, mode in enumerate(("L", "RGB", "RGBA")):
+            path = os.path.join(self.tmpdir, "image-{0}.png".format(index))
+            Image.new(mode, (4 + index, 3)).save(path)
+            paths.append(path)
+        self.assertEqual(image_header(paths[1]), (5, 3, "RGB"))
+        paths.append(os.path.join(self.tmpdir, "missing.png"))
+        self.assertEqual(read_image_headers(paths, nb_workers=2),
+                         [(4, 3, "L"), (5, 3, "RGB"), (6, 3, "RGBA"), None])
+
+    def test_pyramid(self):
+        path = os.path.join(self.tmpdir, "slice.png")
+        Image.new("P", (10, 5)).save(path)
+        cache_dir = os.path.join(self.tmpdir, "cache")
+        self.assertEqual(level_size((10, 5), 4), (2, 1))
+        self.assertEqual(pyramid_level(path, "ab12", 1, cache_dir), path)
+        level_path = pyramid_level(path, "ab12", 2, cache_dir)
+        self.assertEqual(level_path,
+                         os.path.join(cache_dir, "ab", "ab12-2.png"))
+        with Image.open(level_path) as open_image:
+            self.assertEqual(open_image.size, (5, 2))
+            self.assertEqual(open_image.mode, "RGBA")
+        # > cached levels are not rebuilt
+        os.remove(path)
+        self.assertEqual(pyramid_level(path, "ab12", 2, cache_dir),
+                         level_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""cubicweb-zeijemol wave importer tests"""
+
+# System import
+import os
+import json
+import shutil
+import tempfile
+from PIL import Image
+
+# Cubicweb import
+from cubicweb.devtools import testlib
+
+# Zeijemol import
+from cubes.zeijemol.importer import WaveImporter
+
+
+class WaveImporterTC(testlib.CubicWebTC):
+
+    def setUp(self):
+        super(WaveImporterTC, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(WaveImporterTC, self).tearDown()
+
+    def stack(self, orient, nb_slices):
+        paths = []
+        for index in range(nb_slices):
+            path = os.path.join(self.tmpdir, "{0}-{1}.png".format(
+                orient, index))
+            Image.new("L", (4, 3), color=index).save(path)
+            paths.append(path)
+        return orient, paths
+
+    def test_stack_snap(self):
+        wave_data = {
+            "sub01": {
+                "anat": {
+                    "viewer": "TRIPLANAR-STACK",
+                    "filepaths": [self.stack("axial", 3),
+                                  self.stack("coronal", 2)]}}}
+        with self.admin_access.repo_cnx() as cnx:
+            importer = WaveImporter(None, cnx)
+            importer.insert(
+                "stack", "qc", wave_data, {"description": u"Stack wave."},
+                ["Good", "Bad"], verbose=0)
+            snap = cnx.execute("Any S Where S is Snap").get_entity(0, 0)
+            self.assertEqual(
+                json.loads(snap.atlas_index),
+                {"axial": {"tile": [4, 3], "columns": 2, "nb_slices": 3},
+                 "coronal": {"tile": [4, 3], "columns": 2, "nb_slices": 2}})
+            rset = cnx.execute(
+                "Any D ORDERBY D Where S eid %(s)s, S atlases F, "
+                "F description D", {"s": snap.eid})
+            self.assertEqual(rset.rows, [[u"axial"], [u"coronal"]])
+            self.assertEqual(cnx.execute(
+                "Any COUNT(F) Where S eid %(s)s, S files F",
+                {"s": snap.eid})[0][0], 5)
+            # > the atlases are not written next to the slices
+            self.assertEqual(len(os.listdir(self.tmpdir)), 5)
+            for atlas_path, in cnx.execute(
+                    "Any P Where S eid %(s)s, S atlases F, F filepath P",
+                    {"s": snap.eid}):
+                self.assertEqual(os.path.dirname(atlas_path),
+                                 importer.atlas_dir)
+
+
+if __name__ == "__main__":
+    from logilab.common.testlib import unittest_main
+    unittest_main()
@@ -0,0 +1,132 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""cubicweb-zeijemol queries tests"""
+
+# System import
+import re
+import datetime
+import unittest
+
+# Zeijemol import
+from cubes.zeijemol.queries import escape_like
+from cubes.zeijemol.queries import iter_by_eid
+from cubes.zeijemol.queries import ratings_filters
+from cubes.zeijemol.queries import ratings_restriction
+from cubes.zeijemol.queries import score_summary
+
+
+class RatingsRestrictionTC(unittest.TestCase):
+
+    def test_no_filter(self):
+        self.assertEqual(ratings_filters({"wave": u" ", "vid": u"x"}), {})
+        restriction, args = ratings_restriction()
+        self.assertEqual(args, {})
+        self.assertEqual(restriction, "R is Score, R snapset S, W snapsets S, "
+                                      "R scored_by U, U login UN")
+
+    def test_filters(self):
+        filters = ratings_filters({
+            "wave": u"qc", "rater": u"rater ", "answer": u"Good",
+            "from_date": u"2017-03-01", "to_date": u"2017-03-02"})
+        restriction, args = ratings_restriction(filters)
+        for part in ("W name %(wave)s", "U login %(rater)s",
+                     "R score %(answer)s", "R creation_date >= %(from_date)s",
+                     "R creation_date < %(to_date)s"):
+            self.assertIn(part, restriction)
+        self.assertEqual(args["rater"], u"rater")
+        self.assertEqual(args["from_date"], datetime.datetime(2017, 3, 1))
+        # > the end day is included
+        self.assertEqual(args["to_date"], datetime.datetime(2017, 3, 3))
+        restriction, args = ratings_restriction(
+            {"to_date": u"2017-03-02T12:30"})
+        self.assertEqual(args["to_date"],
+                         datetime.datetime(2017, 3, 2, 12, 30))
+        self.assertRaises(ValueError, ratings_restriction,
+                          {"from_date": u"01/03"})
+
+    def test_datatables_form(self):
+        # > the DataTables server-side parameters are not filters
+        form = {
+            "draw": u"2", "start": u"10", "length": u"10",
+            "search[value]": u"", "search[regex]": u"false",
+            "order[0][column]": u"0", "order[0][dir]": u"asc",
+            "columns[0][data]": u"0", "columns[0][searchable]": u"true",
+            "fname": u"ratings_table", "wave": u"qc",
+            "to_date": u"2017-03-02"}
+        filters = ratings_filters(form)
+        self.assertEqual(filters, {"wave": u"qc", "to_date": u"2017-03-02"})
+        restriction, args = ratings_restriction(filters)
+        self.assertEqual(sorted(args), ["to_date", "wave"])
+
+    def test_escape_like(self):
+        self.assertEqual(escape_like(u"rater"), u"rater")
+        self.assertEqual(escape_like(u"50%_a\\b"), u"50\\%\\_a\\\\b")
+
+
+class SummaryConnection(object):
+    """ A connection answering the score summary query from a list of rows.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, rql, args=None):
+        return self.rows
+
+
+class ScoreSummaryTC(unittest.TestCase):
+
+    def test_answer_update(self):
+        date = datetime.datetime(2017, 3, 1, 12)
+        cnx = SummaryConnection([[2, 1, 20, date], [1, 3, 12, date]])
+        summary = score_summary(cnx)
+        self.assertEqual(summary, [(1, 3, 12, date), (2, 1, 20, date)])
+        # > an answer update only changes the modification date
+        cnx.rows[1][3] = date + datetime.timedelta(seconds=1)
+        self.assertNotEqual(score_summary(cnx), summary)
+
+
+class ResultSet(list):
+    """ A result set of rows.
+    """
+    @property
+    def rowcount(self):
+        return len(self)
+
+
+class ChunkConnection(object):
+    """ A connection answering the chunked queries from a list of rows
+    ordered by eid.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def execute(self, rql, args=None):
+        self.queries.append((rql, dict(args)))
+        limit = int(re.search("LIMIT ([0-9]+)", rql).group(1))
+        return ResultSet(
+            [row for row in self.rows if row[-1] > args["last"]][:limit])
+
+
+class IterByEidTC(unittest.TestCase):
+
+    def test_chunks(self):
+        cnx = ChunkConnection([[u"a", 3], [u"b", 5], [u"c", 8], [u"d", 9]])
+        rows = list(iter_by_eid(cnx, "N, R", "R is Score, R name N",
+                                {"w": 1}, chunk_size=2))
+        self.assertEqual(rows, cnx.rows)
+        self.assertEqual([args for _, args in cnx.queries], [
+            {"w": 1, "last": 0}, {"w": 1, "last": 5}, {"w": 1, "last": 9}])
+        self.assertEqual(cnx.queries[0][0],
+                         "Any N, R ORDERBY R LIMIT 2 Where R is Score, "
+                         "R name N, R eid > %(last)s")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""cubicweb-zeijemol file endpoint HTTP helpers tests"""
+
+# System import
+import unittest
+
+# Zeijemol import
+from cubes.zeijemol.ranges import parse_range
+from cubes.zeijemol.ranges import etag_matches
+
+
+class RangesTC(unittest.TestCase):
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range(None, 100), None)
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 10))
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 100))
+        self.assertEqual(parse_range("bytes=90-200", 100), (90, 100))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 100))
+        self.assertEqual(parse_range("bytes=-200", 100), (0, 100))
+        # > ignored headers: the whole file is served
+        for header in ("items=0-9", "bytes=0-9,20-29", "bytes=9-0",
+                       "bytes=-", "bytes=a-b", "bytes=--1"):
+            self.assertEqual(parse_range(header, 100), None)
+        # > unsatisfiable ranges
+        for header in ("bytes=100-", "bytes=-0"):
+            self.assertRaises(ValueError, parse_range, header, 100)
+        self.assertRaises(ValueError, parse_range, "bytes=-10", 0)
+
+    def test_etag_matches(self):
+        self.assertFalse(etag_matches(None, '"abc"'))
+        self.assertTrue(etag_matches('"abc"', '"abc"'))
+        self.assertTrue(etag_matches('"def", W/"abc"', '"abc"'))
+        self.assertTrue(etag_matches("*", '"abc"'))
+        self.assertFalse(etag_matches('"def"', '"abc"'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""cubicweb-zeijemol sampler tests"""
+
+# System import
+from __future__ import division
+import math
+import random
+import unittest
+import numpy
+
+# Zeijemol import
+from cubes.zeijemol.sampler import FenwickTree
+from cubes.zeijemol.sampler import WaveSampler
+
+
+def reference_law(nb_scores, nb_user_scores):
+    """ The sampling law historically computed by the gallery view.
+    """
+    nb_scores = numpy.asarray(nb_scores).astype(numpy.double)
+    keys, counts = numpy.unique(nb_scores, return_counts=True)
+    item_per_score = dict(zip(keys, counts))
+    weights = numpy.asarray(
+        [1. / ((x + 1) * item_per_score[x]) for x in nb_scores])
+    weights[numpy.where(numpy.asarray(nb_user_scores) == 1)] = 0
+    return weights / weights.sum()
+
+
+def chi2_quantile(dof, z=3.09):
+    """ Wilson-Hilferty approximation of the chi2 0.999 quantile.
+    """
+    factor = 2. / (9. * dof)
+    return dof * (1 - factor + z * math.sqrt(factor)) ** 3
+
+
+class FenwickTreeTC(unittest.TestCase):
+
+    def test_sums_and_find(self):
+        values = [random.Random(0).randint(0, 3) for _ in range(37)]
+        tree = FenwickTree(values)
+        tree.add(5, 2)
+        values[5] += 2
+        for index in range(len(values) + 1):
+            self.assertEqual(tree.prefix_sum(index), sum(values[:index]))
+        for k in range(sum(values)):
+            position = tree.find(k)
+            self.assertTrue(sum(values[:position + 1]) > k)
+            self.assertTrue(sum(values[:position]) <= k)
+
+
+class WaveSamplerTC(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(42)
+        self.eids = list(range(100, 160))
+        self.nb_scores = [rng.choice([0, 0, 1, 1, 1, 2, 3])
+                          for _ in self.eids]
+        self.rated = set(rng.sample(self.eids, 15))
+
+    def check_distribution(self, sampler, nb_scores, rated, nb_draws=60000):
+        expected = reference_law(
+            nb_scores, [int(eid in rated) for eid in self.eids])
+        observed = numpy.zeros(len(self.eids))
+        for _ in range(nb_draws):
+            observed[self.eids.index(sampler.draw("rater"))] += 1
+        support = expected > 0
+        self.assertEqual(observed[~support].sum(), 0)
+        expected = expected[support] * nb_draws
+        chi2 = ((observed[support] - expected) ** 2 / expected).sum()
+        self.assertTrue(chi2 < chi2_quantile(support.sum() - 1), chi2)
+
+    def test_same_law_as_gallery(self):
+        sampler = WaveSampler(self.eids, self.nb_scores, seed=0)
+        sampler.register_user("rater", self.rated)
+        self.check_distribution(sampler, self.nb_scores, self.rated)
+
+    def test_incremental_updates(self):
+        sampler = WaveSampler(self.eids, self.nb_scores, seed=1)
+        sampler.register_user("rater", self.rated)
+        nb_scores = list(self.nb_scores)
+        rated = set(self.rated)
+        rng = random.Random(3)
+        for _ in range(40):
+            eid = rng.choice(self.eids)
+            index = self.eids.index(eid)
+            if eid not in rated and rng.random() < 0.3:
+                sampler.add_score(eid, "rater")
+                nb_scores[index] += 1
+                rated.add(eid)
+            else:
+                sampler.add_score(eid, "other")
+                nb_scores[index] += 1
+        self.assertEqual(sampler.nb_unrated("rater"),
+                         len(self.eids) - len(rated))
+        self.check_distribution(sampler, nb_scores, rated)
+
+    def test_exclusion(self):
+        sampler = WaveSampler(self.eids[:3], [0, 0, 0], seed=2)
+        sampler.register_user("rater", [self.eids[0]])
+        for _ in range(50):
+            self.assertEqual(
+                sampler.draw("rater", exclude=[self.eids[1]]), self.eids[2])
+        sampler.add_score(self.eids[2], "rater")
+        self.assertEqual(sampler.draw("rater", exclude=[self.eids[1]]), None)
+        self.assertEqual(sampler.draw("rater"), self.eids[1])
+
+    def test_leases(self):
+        sampler = WaveSampler(self.eids[:3], [0, 0, 0], seed=3)
+        now = [0.]
+        sampler.clock = lambda: now[0]
+        for login in ("u1", "u2", "u3", "u4"):
+            sampler.register_user(login, [])
+        drawn = [sampler.draw(login, lease_ttl=10)
+                 for login in ("u1", "u2", "u3")]
+        self.assertEqual(sorted(drawn), self.eids[:3])
+        # > everything is leased: the leases are ignored
+        self.assertTrue(sampler.draw("u4", lease_ttl=10) in self.eids[:3])
+        sampler.release("u4")
+        # > released and expired leases are available again
+        sampler.release("u2", drawn[1])
+        self.assertEqual(sampler.leased("u1"), [drawn[2]])
+        self.assertEqual(sampler.draw("u4", lease_ttl=10), drawn[1])
+        now[0] = 11.
+        self.assertEqual(sampler.leased("u1"), [])
+
+    def test_batch(self):
+        sampler = WaveSampler(self.eids, self.nb_scores, seed=4)
+        sampler.register_user("rater", self.rated)
+        snapset_eids = sampler.draw_batch("rater", 10, lease_ttl=10)
+        self.assertEqual(len(set(snapset_eids)), 10)
+        self.assertFalse(set(snapset_eids) & self.rated)
+        self.assertEqual(sorted(sampler.leased("other")),
+                         sorted(snapset_eids))
+        snapset_eids = sampler.draw_batch("rater", len(self.eids))
+        self.assertEqual(sorted(snapset_eids),
+                         sorted(set(self.eids) - self.rated))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""cubicweb-zeijemol status pages HTTP cache tests"""
+
+# Cubicweb import
+from cubicweb.devtools import testlib
+
+
+class RatingsHTTPCacheTC(testlib.CubicWebTC):
+
+    def test_set_headers(self):
+        for vid in ("status-view", "ratings-view", "agreement-view"):
+            with self.admin_access.web_request() as req:
+                view = self.vreg["views"].select(vid, req, rset=None)
+                view.http_cache_manager(view).set_headers()
+                self.assertTrue(req.get_response_header("etag"))
+                # > no score yet: the epoch
+                self.assertEqual(
+                    req.headers_out.getHeader("last-modified"), 0)
+
+
+if __name__ == "__main__":
+    from logilab.common.testlib import unittest_main
+    unittest_main()
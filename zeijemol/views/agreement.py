@@ -0,0 +1,105 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# Cubicweb import
+from cubicweb.view import View
+from logilab.mtconverter import xml_escape
+from cubicweb.predicates import match_user_groups
+from cubicweb.predicates import authenticated_user
+
+# Zeijemol import
+from cubes.zeijemol.agreement import wave_agreement
+from cubes.zeijemol.views.status import ratings_validator
+from cubes.zeijemol.views.status import RatingsHTTPCacheManager
+
+
+class Agreement(View):
+    """ Custom view to display the inter-rater agreement of a wave.
+
+    This view is usefull for managers to take QC decisions: the results are
+    cached until the scores change.
+    """
+    __regid__ = "agreement-view"
+    title = "Agreement"
+    __select__ = authenticated_user() & match_user_groups("managers")
+    http_cache_manager = RatingsHTTPCacheManager
+
+    def call(self, **kwargs):
+        """ Create the agreement tables of the wave given in the 'wave'
+        parameter, the first wave by default.
+        """
+        # Select the wave
+        self.w(u"<div class='zeijemol-status'>")
+        wave_names = sorted(
+            metadata.name
+            for metadata in self._cw.vreg.wave_metadata.all(self._cw))
+        if len(wave_names) == 0:
+            self.w(u"<h1>No wave in the database yet.</h1>")
+            self.w(u"</div>")
+            return
+        wave_name = self._cw.form.get("wave", wave_names[0])
+        self.wave_form(wave_names, wave_name)
+
+        # Compute the agreement statistics
+        try:
+            metadata = self._cw.vreg.wave_metadata.get(
+                self._cw, name=wave_name)
+        except ValueError:
+            self.w(u"<h1>Unknown wave '{0}'.</h1>".format(
+                xml_escape(wave_name)))
+            self.w(u"</div>")
+            return
+        agreement = self._cw.vreg.status_payloads.get(
+            "agreement/{0}/{1}".format(
+                metadata.eid, ratings_validator(self._cw)),
+            lambda: wave_agreement(self._cw, metadata))
+        self.w(u"<h1>{0} agreement</h1>".format(xml_escape(wave_name)))
+        self.w(u"<p>Fleiss' kappa: <b>{0}</b> on {1} snapsets rated at "
+               u"least twice out of {2}.</p>".format(
+                    agreement["fleiss_kappa"], agreement["nb_multi_rated"],
+                    agreement["nb_snapsets"]))
+        if len(agreement["raters"]) == 0:
+            self.w(u"</div>")
+            return
+
+        # Call JTableView for html generation of the tables
+        tables = (
+            (["UID", "Number of rates", "Number of peers", "Mean kappa"],
+             agreement["raters"], "Raters Cohen's kappa"),
+            (["UID", "Peer UID", "Common rates", "Kappa"],
+             agreement["pairs"], "Pairwise Cohen's kappa"),
+            (["SID", "Number of rates", "Disagreement"] +
+             agreement["answer_labels"], agreement["disagreements"],
+             "Most disagreed snapsets"))
+        for index, (labels, records, title) in enumerate(tables):
+            self.wview("jtable-clientside", None, "null", labels=labels,
+                       records=records, csv_export=False, index=index,
+                       elts_to_sort=[labels[0]], title=title)
+        self.w(u"</div>")
+
+    def wave_form(self, wave_names, wave_name):
+        """ Create the wave selection form.
+
+        Parameters
+        ----------
+        wave_names: list of str
+            the waves names.
+        wave_name: str
+            the selected wave name.
+        """
+        self.w(u'<form class="form-inline" action="{0}" method="get">'.format(
+            xml_escape(self._cw.build_url("view"))))
+        self.w(u'<input type="hidden" name="vid" value="agreement-view"/>')
+        self.w(u'<select class="form-control" name="wave">')
+        for name in wave_names:
+            self.w(u'<option value="{0}"{1}>{0}</option>'.format(
+                xml_escape(name),
+                u' selected="selected"' if name == wave_name else u""))
+        self.w(u'</select>')
+        self.w(u'<input class="btn btn-info" type="submit" value="Show"/>')
+        self.w(u'</form>')
@@ -31,41 +31,30 @@ class SubNavBar(HeaderComponent):
 
     def attributes(self):
 
-        # Sort waves by categories
-        rset = self._cw.execute("Any W, C Where W is Wave, W category C")
+        # Find unfinished waves: use the completion cache kept up to date
+        # by the 'zeijemol.update-wave-samplers' hook
+        completion = self._cw.vreg.wave_completion.completion(
+            self._cw, self._cw.session.login)
+        unfinished = completion[completion.nb_rated != completion.nb_snapsets]
         struct = {}
-        for index, (_, category) in enumerate(rset):
-            struct.setdefault(category, []).append(rset.get_entity(index, 0))
+        for wave_eid, wave_name, category in zip(
+                unfinished.eid, unfinished.name, unfinished.category):
+            struct.setdefault(category, []).append((int(wave_eid), wave_name))
 
         # Get the wave to be displayed
         left_menu = {}
-        for category, waves in struct.items():
-
-            # Find unfinished waves
-            wave_to_display = []
-            for wave_entity in waves:
-                wave_name = wave_entity.name
-                wave_rset = self._cw.execute(
-                    "Any S Where W is Wave, W name '{0}', W snapsets S, "
-                    "S scores SC, SC scored_by U, U login '{1}'".format(
-                        wave_name, self._cw.session.login))
-                snapsets_rset = self._cw.execute(
-                    "Any COUNT(S) Where W is Wave, W name '{0}', "
-                    "W snapsets S".format(wave_name))
-                if len(wave_rset) != snapsets_rset[0][0]:
-                    wave_to_display.append(wave_entity)
+        for category, wave_to_display in struct.items():
 
             # Display category only if one wave is not finished in this
             # category
             if len(wave_to_display) > 0:
 
                 # Generate a link for each wave to be rated
-                for wave_entity in wave_to_display:
+                for wave_eid, wave_name in wave_to_display:
                     # > buttons
-                    wave_name = wave_entity.name
                     dochref = self._cw.build_url(
                         "view", vid="zeijemol-documentation",
-                        wave_eid=wave_entity.eid)
+                        wave_eid=wave_eid)
                     title = ("Please help us rating data in '{0}' "
                              "wave ".format(wave_name))
                     title += ("<a href='{0}' target='_blank' data-toggle='tooltip' "
@@ -120,12 +109,27 @@ class RatingsButton(HeaderComponent):
                 "fa-trophy")
 
 
+class AgreementButton(HeaderComponent):
+    """ Build an agreement button displayed in the header.
+
+    Only the 'managers' have accessed to this functionality.
+    """
+    __regid__ = "agreement-snapview"
+    __select__ = authenticated_user() & match_user_groups("managers")
+    order = 3
+    context = u"header-right"
+
+    def attributes(self):
+        return (self._cw.build_url("view", vid="agreement-view"),
+                "Agreement", "fa-balance-scale")
+
+
 class LogOutButton(AuthenticatedUserStatus):
     """ Close the current session.
     """
     __regid__ = "logout"
     __select__ = authenticated_user()
-    order = 3
+    order = 4
 
     def attributes(self):
         return (self._cw.build_url("logout"), "Sign-out", "fa-sign-out")
@@ -144,6 +148,7 @@ def goto_url(self):
 
 def registration_callback(vreg):
     vreg.register(RatingsButton)
+    vreg.register(AgreementButton)
     vreg.register(SubNavBar)
     vreg.register(HomeButton)
     vreg.register(StatusButton)
@@ -6,15 +6,15 @@
 # for details.
 ##########################################################################
 
-# System import
-import hashlib
-import json
-
 # Cubicweb import
 from cubicweb.web import Redirect
 from cubicweb.web.controller import Controller
 from cubicweb.predicates import authenticated_user
 
+# Package import
+from cubes.zeijemol.buffer import INSERT_SCORE
+from cubes.zeijemol.buffer import score_row
+
 
 class RateController(Controller):
     """ Create a score entity from input form data.
@@ -24,52 +24,116 @@ class RateController(Controller):
 
     def publish(self, rset=None):
         """ Deal with the form.
+
+        In batch mode the form contains a comma separated list of snapset
+        eids in the 'eids' field and the answers of each snapset in the
+        'rate_<eid>' and 'extra_answers_<eid>' fields. All the scores are
+        committed in a single transaction.
+
+        When the write-behind buffer is enabled, the scores are only
+        journaled here and inserted later by the buffer flush task.
         """
-        # Give me another snap
-        if self._cw.form["rate"] != "Rate later":
-
-            # Get the extra answers if specified
-            if "extra_answers" in self._cw.form:
-                extra_answers = self._cw.form["extra_answers"]
-            else:
-                extra_answers = []
-
-            # Store my rate
-            login = unicode(self._cw.session.login)
-            identifier = login + self._cw.form["eid"]
-            m = hashlib.md5()
-            m.update(identifier)
-            identifier = unicode(m.hexdigest())
-
-            # Get the eid of the current user
-            user_eid = self._cw.execute(
-                "Any X Where X is CWUser, X login "
-                "'{0}'".format(login))[0][0]
-
-            # Save the score
-            score_eid = self._cw.create_entity(
-                "Score",
-                identifier=identifier,
-                uid=login,
-                score=unicode(self._cw.form["rate"]),
-                extra_scores=unicode(json.dumps(extra_answers)),
-                snapset=unicode(self._cw.form["eid"]),
-                scored_by=unicode(user_eid)).eid
-            self._cw.execute("SET S scores R  WHERE S eid '{0}', R eid "
-                             "'{1}'".format(self._cw.form["eid"], score_eid))
+        # Get the rated snapsets with the associated answers
+        if "eids" in self._cw.form:
+            ratings = []
+            for eid in self._cw.form["eids"].split(","):
+                ratings.append((
+                    eid,
+                    self._cw.form.get("rate_{0}".format(eid), "Rate later"),
+                    self._cw.form.get("extra_answers_{0}".format(eid), [])))
+        else:
+            ratings = [(self._cw.form["eid"], self._cw.form["rate"],
+                        self._cw.form.get("extra_answers", []))]
+
+        # Store the ratings
+        for eid, rate, extra_answers in ratings:
+            # > give me another snap
+            if rate != "Rate later":
+                if not isinstance(extra_answers, list):
+                    extra_answers = [extra_answers]
+                submit_score(self._cw, eid, rate, extra_answers)
+            # > release the snapset reserved for the user
+            self._cw.vreg.wave_samplers.release(
+                self._cw.session.login, int(eid))
 
         # Construct redirection URL
+        wave_eid = self._cw.vreg.wave_metadata.get(
+            self._cw, name=self._cw.form["wave_name"]).eid
         dochref = self._cw.build_url(
-            "view", vid="zeijemol-documentation",
-            wave_eid=self._cw.form["eid"])
+            "view", vid="zeijemol-documentation", wave_eid=wave_eid)
         title = ("Please help us rating data in '{0}' "
                  "wave ".format(self._cw.form["wave_name"]))
         title += ("<a href='{0}' target='_blank' data-toggle='tooltip' "
                   "title='Show info'>".format(dochref))
         title += "<i class='fa fa-info-circle text-primary sr-icons'></i>"
         title += "</a>"
+        params = {}
+        if "batch" in self._cw.form:
+            params["batch"] = self._cw.form["batch"]
         href = self._cw.build_url(
             "view", vid="gallery-view", wave=self._cw.form["wave_name"],
-            title=self._cw._(title))
+            title=self._cw._(title), **params)
 
         raise Redirect(href)
+
+
+def store_score(req, eid, rate, extra_answers):
+    """ Create a score entity.
+
+    Parameters
+    ----------
+    req: CubicWeb request
+        the current request.
+    eid: str
+        the rated snapset eid.
+    rate: str
+        the user score.
+    extra_answers: list of str
+        the user extra answers.
+    """
+    # Store my rate: use a single statement with the cached user eid
+    req.execute(INSERT_SCORE, score_row(
+        req.user.login, req.user.eid, eid, rate, extra_answers))
+
+
+def submit_score(req, eid, rate, extra_answers):
+    """ Queue a score in the write-behind buffer if enabled, otherwise create
+    the score entity in the current transaction.
+
+    Parameters
+    ----------
+    req: CubicWeb request
+        the current request.
+    eid: str
+        the rated snapset eid.
+    rate: str
+        the user score.
+    extra_answers: list of str
+        the user extra answers.
+    """
+    rating_buffer = getattr(req.vreg, "rating_buffer", None)
+    if rating_buffer is not None:
+        rating_buffer.append(score_row(
+            req.user.login, req.user.eid, eid, rate, extra_answers))
+    else:
+        store_score(req, eid, rate, extra_answers)
+
+
+def pending_scores(req):
+    """ The snapsets rated by the current user that are still in the
+    write-behind buffer.
+
+    Parameters
+    ----------
+    req: CubicWeb request
+        the current request.
+
+    Returns
+    -------
+    snapset_eids: list of int
+        the pending rated snapset eids.
+    """
+    rating_buffer = getattr(req.vreg, "rating_buffer", None)
+    if rating_buffer is None:
+        return []
+    return rating_buffer.pending(req.user.login)
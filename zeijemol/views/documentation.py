@@ -6,9 +6,6 @@
 # for details.
 ##########################################################################
 
-# System import
-import base64
-
 # Cubicweb import
 from cubicweb.view import View
 from cubicweb.web.views.baseviews import NullView
@@ -30,21 +27,18 @@ class DisplayDocumentation(NullView):
         """
         # Get the parameters
         wave_eid = wave_eid or self._cw.form.get("wave_eid", None)
-        wave_rset = self._cw.execute(
-            "Any W Where W eid '{0}'".format(wave_eid))
-        wave_entity = wave_rset.get_entity(0, 0)
+        wave_metadata = self._cw.vreg.wave_metadata.get(self._cw, wave_eid)
 
         # Display page content
         self.w(u"<div class='zeijemol-documentation'>")
-        self.w(wave_entity.description)
-        if wave_entity.filepath is not None:
-            with open(wave_entity.filepath, "rb") as image_file:
-                encoded_string = base64.b64encode(image_file.read())
+        self.w(wave_metadata.description)
+        if wave_metadata.filepath is not None:
+            src = self._cw.build_url(
+                "zeijemol-file", wave_eid=wave_metadata.eid)
             self.w(u'<div id="gallery-img">')
             self.w(
                 u'<embed class="gallery-pdf" alt="Embedded PDF" '
-                 'src="data:application/pdf;base64, '
-                 '{0}" />'.format(encoded_string))
+                 'src="{0}" />'.format(src))
             self.w(u'</div>')
         self.w(u"</div>")
 
@@ -0,0 +1,202 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import csv
+import time
+import tempfile
+from StringIO import StringIO
+
+# Cubicweb import
+from cubicweb import Unauthorized
+from cubicweb.web import DirectResponse
+from cubicweb.web.controller import Controller
+from cubicweb.etwist.http import HTTPResponse
+from cubicweb.predicates import authenticated_user
+
+# Twisted import
+from twisted.internet import reactor
+from twisted.internet.threads import blockingCallFromThread
+from twisted.python.threadable import isInIOThread
+
+# Zeijemol import
+from cubes.zeijemol.columnar import RatingsColumns
+from cubes.zeijemol.queries import RATINGS_LABELS
+from cubes.zeijemol.queries import iter_ratings
+from cubes.zeijemol.queries import iter_rating_rows
+from cubes.zeijemol.queries import ratings_filters
+from cubes.zeijemol.queries import ratings_restriction
+from cubes.zeijemol.queries import status_tables
+
+
+class CSVExportController(Controller):
+    """ Stream the Status and Ratings tables as CSV files.
+
+    The 'table' parameter selects the 'ratings' table, only available for
+    the managers and restricted by the Ratings view filters, or the 'status'
+    table of the wave given in the 'wave' parameter.
+    """
+    __regid__ = "csv-export"
+    __select__ = authenticated_user()
+
+    def publish(self, rset=None):
+        """ Stream the requested table.
+        """
+        table = self._cw.form.get("table", "ratings")
+        if table == "ratings":
+            if not self._cw.user.is_in_group("managers"):
+                raise Unauthorized("Only managers can export the ratings.")
+            labels = RATINGS_LABELS
+            filters = ratings_filters(self._cw.form)
+            # > check the filters before the response is started
+            ratings_restriction(filters)
+            records = iter_ratings(self._cw, filters=filters)
+            title = "Ratings"
+        elif table == "status":
+            wave_name = self._cw.form["wave"]
+            tables = status_tables(self._cw, wave_name=wave_name)
+            labels, records = (tables[0][1:] if len(tables) > 0
+                               else (["UID"], []))
+            title = "{0}_status".format(wave_name)
+        else:
+            raise ValueError("Unknown table '{0}'.".format(table))
+        filename = "_".join([title, time.strftime("%Y-%m-%d_%H:%M:%S")])
+        stream_response(self._cw, csv_chunks(labels, records),
+                        content_type="text/csv; charset=utf-8",
+                        filename="{0}.csv".format(filename))
+
+
+class NPZExportController(Controller):
+    """ Stream the ratings as a columnar NPZ file, only available for the
+    managers and restricted by the Ratings view filters.
+
+    The file is built in a single pass over the scores and contains the
+    arrays described in 'RatingsColumns.arrays'.
+    """
+    __regid__ = "npz-export"
+    __select__ = authenticated_user()
+
+    def publish(self, rset=None):
+        """ Stream the ratings columns.
+        """
+        if not self._cw.user.is_in_group("managers"):
+            raise Unauthorized("Only managers can export the ratings.")
+        columns = RatingsColumns()
+        for row in iter_rating_rows(
+                self._cw, chunk_size=10000,
+                filters=ratings_filters(self._cw.form)):
+            columns.add(*row[:-1])
+        with tempfile.TemporaryFile() as npz_file:
+            columns.save(npz_file)
+            npz_file.seek(0)
+            filename = "_".join(
+                ["Ratings", time.strftime("%Y-%m-%d_%H:%M:%S")])
+            stream_response(self._cw, file_chunks(npz_file),
+                            content_type="application/octet-stream",
+                            filename="{0}.npz".format(filename))
+
+
+def file_chunks(fileobj, chunk_size=65536, length=None):
+    """ Read a file by chunks, from the current position to the end of the
+    file or up to 'length' bytes.
+    """
+    remaining = length
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        chunk = fileobj.read(size)
+        if not chunk:
+            break
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
+def csv_chunks(labels, records, chunk_size=65536):
+    """ Format a table as CSV chunks.
+
+    Parameters
+    ----------
+    labels: list of str
+        the columns labels.
+    records: iterable of list
+        the table data.
+    chunk_size: int (optional, default 65536)
+        the minimum size of a chunk in bytes.
+
+    Returns
+    -------
+    chunks: generator of str
+        the UTF-8 encoded CSV chunks.
+    """
+    stream = StringIO()
+    writer = csv.writer(stream, delimiter=";")
+    writer.writerow([encode(cell) for cell in labels])
+    for record in records:
+        writer.writerow([encode(cell) for cell in record])
+        if stream.tell() >= chunk_size:
+            yield stream.getvalue()
+            stream.seek(0)
+            stream.truncate()
+    if stream.tell() > 0:
+        yield stream.getvalue()
+
+
+def encode(cell):
+    """ Encode a CSV cell in UTF-8.
+    """
+    if isinstance(cell, unicode):
+        return cell.encode("utf-8")
+    return cell
+
+
+def stream_response(req, chunks, content_type, filename=None, code=200):
+    """ Write a response directly to the twisted request chunk by chunk.
+
+    Without a content length header the response is sent with the chunked
+    transfer encoding, so that only one chunk is kept in memory. The other
+    front ends, without a twisted request, get a buffered response.
+
+    Parameters
+    ----------
+    req: CubicWeb request
+        the current request.
+    chunks: iterable of str
+        the response content.
+    content_type: str
+        the response content type.
+    filename: str (optional, default None)
+        if specified, the response is sent as an attachment with this name.
+    code: int (optional, default 200)
+        the response status code.
+    """
+    req.set_content_type(content_type)
+    if filename is not None:
+        req.set_header("content-disposition",
+                       "attachment; filename=\"{0}\"".format(filename))
+    twreq = getattr(req, "_twreq", None)
+    if twreq is None:
+        req.status_out = code
+        raise DirectResponse("".join(chunks))
+    call_in_reactor(twreq.setResponseCode, code)
+    for name, values in req.headers_out.getAllRawHeaders():
+        call_in_reactor(twreq.responseHeaders.setRawHeaders, name, values)
+    for chunk in chunks:
+        call_in_reactor(twreq.write, chunk)
+    # > finish the response: the headers and the content are already
+    #   written
+    raise DirectResponse(HTTPResponse(
+        twisted_request=twreq, code=code, headers=None, stream=""))
+
+
+def call_in_reactor(func, *args):
+    """ Call a twisted request method from the reactor thread and wait for
+    the result.
+    """
+    if isInIOThread():
+        return func(*args)
+    return blockingCallFromThread(reactor, func, *args)
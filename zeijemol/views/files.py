@@ -0,0 +1,188 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2017
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import os
+import tempfile
+import mimetypes
+
+# Cubicweb import
+from cubicweb.web import NotFound
+from cubicweb.web.controller import Controller
+from cubicweb.predicates import authenticated_user
+
+# Zeijemol import
+from cubes.zeijemol.images import IMAGE_DTYPES
+from cubes.zeijemol.images import PYRAMID_LEVELS
+from cubes.zeijemol.images import pyramid_level
+from cubes.zeijemol.ranges import parse_range
+from cubes.zeijemol.ranges import etag_matches
+from cubes.zeijemol.views.export import file_chunks
+from cubes.zeijemol.views.export import stream_response
+
+
+class FileController(Controller):
+    """ Serve the raw bytes of an 'ExternalFile' given by its 'sha1' or its
+    'eid' parameter, or of the documentation of the wave given by its
+    'wave_eid' parameter.
+
+    The SHA1 sum of a file is its entity tag: the URLs built from the SHA1
+    sums are content-addressed, thus cached by the browsers without
+    revalidation. Single byte ranges are supported.
+
+    The downscaled images of the 'level' parameter pyramid level are built
+    on their first request and cached on disk. The atlases are always
+    served at full resolution.
+    """
+    __regid__ = "zeijemol-file"
+    __select__ = authenticated_user()
+    # The cache policies of the content-addressed and of the other URLs
+    immutable_cache = "private, max-age=31536000, immutable"
+    revalidate_cache = "private, no-cache"
+
+    def publish(self, rset=None):
+        """ Stream the requested file or the requested byte range.
+        """
+        filepath, sha1hex, dtype, immutable, is_atlas = self.locate_file()
+        try:
+            level = int(self._cw.form.get("level", 1))
+        except ValueError:
+            raise NotFound()
+        if level not in PYRAMID_LEVELS:
+            raise NotFound()
+        # > the atlases are not downscaled: the pixels of neighbouring
+        #   tiles would be mixed
+        if (level != 1 and dtype in IMAGE_DTYPES and sha1hex is not None and
+                not is_atlas):
+            cache_dir = (self._cw.vreg.config["pyramid_cache_dir"] or
+                         os.path.join(tempfile.gettempdir(),
+                                      "zeijemol-pyramid"))
+            try:
+                filepath = pyramid_level(filepath, sha1hex, level, cache_dir)
+            except IOError:
+                raise NotFound()
+            sha1hex = "{0}-{1}".format(sha1hex, level)
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            raise NotFound()
+        size = stat.st_size
+        if sha1hex is not None:
+            etag = '"{0}"'.format(sha1hex)
+        else:
+            etag = '"{0}-{1}"'.format(int(stat.st_mtime), size)
+        content_type = (mimetypes.guess_type(filepath)[0] or
+                        "application/octet-stream")
+        req = self._cw
+        req.set_header("etag", etag)
+        req.set_header("cache-control", (self.immutable_cache if immutable
+                                         else self.revalidate_cache))
+        req.set_header("accept-ranges", "bytes")
+
+        # Check if the client copy is up to date
+        if etag_matches(req.get_header("if-none-match"), etag):
+            stream_response(req, [], content_type, code=304)
+
+        # Select the requested bytes: a range of a modified file is ignored
+        start, stop, code = 0, size, 200
+        if_range = req.get_header("if-range")
+        if not if_range or if_range == etag:
+            try:
+                byte_range = parse_range(req.get_header("range"), size)
+            except ValueError:
+                req.set_header("content-range", "bytes */{0}".format(size))
+                req.set_header("content-length", "0")
+                stream_response(req, [], content_type, code=416)
+            if byte_range is not None:
+                start, stop = byte_range
+                code = 206
+                req.set_header("content-range", "bytes {0}-{1}/{2}".format(
+                    start, stop - 1, size))
+        req.set_header("content-length", str(stop - start))
+        with open(filepath, "rb") as open_file:
+            open_file.seek(start)
+            stream_response(
+                req, file_chunks(open_file, length=stop - start),
+                content_type, code=code)
+
+    def locate_file(self):
+        """ Find the requested file.
+
+        Returns
+        -------
+        filepath: str
+            the file path.
+        sha1hex: str
+            the SHA1 sum of the file, None if not known.
+        dtype: str
+            the file type.
+        immutable: bool
+            True if the file is addressed by its SHA1 sum.
+        is_atlas: bool
+            True if the file is the atlas of a stack.
+        """
+        form = self._cw.form
+        if "sha1" in form:
+            rset = self._cw.execute(
+                "Any P, H, T, S LIMIT 1 Where F is ExternalFile, "
+                "F sha1hex %(h)s, F filepath P, F sha1hex H, F dtype T, "
+                "S? atlases F", {"h": form["sha1"]})
+            immutable = True
+        elif "eid" in form:
+            try:
+                file_eid = int(form["eid"])
+            except ValueError:
+                raise NotFound()
+            rset = self._cw.execute(
+                "Any P, H, T, S LIMIT 1 Where F is ExternalFile, "
+                "F eid %(e)s, F filepath P, F sha1hex H, F dtype T, "
+                "S? atlases F", {"e": file_eid})
+            immutable = False
+        elif "wave_eid" in form:
+            try:
+                metadata = self._cw.vreg.wave_metadata.get(
+                    self._cw, form["wave_eid"])
+            except ValueError:
+                raise NotFound()
+            if metadata.filepath is None:
+                raise NotFound()
+            return metadata.filepath, None, "PDF", False, False
+        else:
+            raise NotFound()
+        if rset.rowcount == 0:
+            raise NotFound()
+        filepath, sha1hex, dtype, snap_eid = rset[0]
+        return filepath, sha1hex, dtype, immutable, snap_eid is not None
+
+
+def file_url(req, file_eid, sha1hex=None, level=1):
+    """ Get the URL of an 'ExternalFile': content-addressed if its SHA1 sum
+    is known.
+
+    Parameters
+    ----------
+    req: CubicWeb request
+        the current request.
+    file_eid: int
+        the file eid.
+    sha1hex: str (optional, default None)
+        the SHA1 sum of the file.
+    level: int (optional, default 1)
+        the pyramid level of an image file.
+
+    Returns
+    -------
+    url: str
+        the file URL.
+    """
+    params = {}
+    if level != 1:
+        params["level"] = level
+    if sha1hex:
+        return req.build_url("zeijemol-file", sha1=sha1hex, **params)
+    return req.build_url("zeijemol-file", eid=file_eid, **params)
@@ -10,17 +10,21 @@
 from __future__ import division
 import os
 import json
-import numpy
-import base64
 import logging
-from numpy.random import choice
 
 # CW import
 from cgi import parse_qs
 from cubicweb.view import View
+from cubicweb.web.views.ajaxcontroller import ajaxfunc
 import cubes.zeijemol as zeijemol
 from cubicweb.predicates import authenticated_user
 
+# Zeijemol import
+from cubes.zeijemol.entities import prefetch_snaps
+from cubes.zeijemol.views.files import file_url
+from cubes.zeijemol.views.controllers import submit_score
+from cubes.zeijemol.views.controllers import pending_scores
+
 
 class Gallery(View):
     """ Custom view to score snap files.
@@ -46,9 +50,18 @@ class Gallery(View):
         #self._cw.add_js("triview/js/resize-iframe.js")
 
         # Get the wave extra answers
-        rset = self._cw.execute("Any E Where W is Wave, W name '{0}', "
-                                "W extra_answers E".format(wave_name))
-        extra_answers = json.loads(rset[0][0])
+        wave_metadata = self._cw.vreg.wave_metadata.get(
+            self._cw, name=wave_name)
+        wave_eid = wave_metadata.eid
+        extra_answers = wave_metadata.extra_answers
+
+        # Display a grid of snapsets with a single form if requested: only
+        # available for waves with 'FILE' viewers
+        batch_size = int(kwargs.get("batch", [1])[0])
+        if batch_size > 1 and wave_metadata.file_only:
+            self.call_batch(title, wave_name, wave_eid, extra_answers,
+                            batch_size)
+            return
 
         # Add javascript to auto adjust iframe heights for triplanar view
         js = '$(document).ready(function() {'
@@ -87,48 +100,26 @@ class Gallery(View):
         js += '});'
         self.w(u"<script>{0}</script>".format(unicode(js)))
 
-        # Select the snapset to be rated: use the internal connection in order
-        # to get the full rating distribution and then intersect this
+        # Select the snapset to be rated: use the wave sampler in order to
+        # get the full rating distribution and then intersect this
         # distribution with the user rates in order to uniformally
         # fill the database
-        # Note: need to access the selected snapset with the user rights
-        # because the internal session is closed after with ...:
-        with self._cw.session.repo.internal_cnx() as session:
-            rset = session.execute("Any S Where W is Wave, W name '{0}', "
-                                   "W snapsets S".format(wave_name))
-            # > find the user ratings and the all user ratings distribution
-            nb_scores = []
-            nb_user_scores = []
-            for index in range(rset.rowcount):
-                entity = rset.get_entity(index, 0)
-                scores = entity.scores
-                nb_scores.append(len(scores))
-                nb_user_scores.append(
-                    len([sc for sc in scores
-                        if sc.scored_by[0].login == self._cw.session.login]))
-            nb_scores = numpy.asarray(nb_scores).astype(numpy.single)
-            nb_user_scores = numpy.asarray(nb_user_scores)
-            # > check that the user has something to rate
-            if nb_user_scores.min() == 1:
-                error = "No more snap to rate, thanks."
-                self.w(u"<div id='some-doc-about-this-wave'><h1>{0}</h1>"
-                        "</div>".format(error))
-                return
-            # > compute a sampling distribution
-            # p(snapset|len(snapset_scores)=X) = 1/(X + 1) (before norm)
-            # p(snapset) = 1./(X * Nx) where Nx= number of snapsets with
-            # X scores (rated X times)
-            keys, counts = numpy.unique(nb_scores, return_counts=True)
-            item_per_score = dict(zip(keys, counts))
-            weights = [1. / ((x + 1) * item_per_score[x]) for x in nb_scores]
-            weights = numpy.asarray(weights).astype(numpy.single)
-            # > set a null probability for already rated snapsets
-            weights[numpy.where(nb_user_scores == 1)] = 0
-            # > normalize the distribution
-            weights = weights / sum(weights)
-            # > weighted pick
-            snapset_index = choice(range(len(weights)), p=weights)
-            snapset_eid = rset[snapset_index][0]
+        # Note: the samplers are built from the snapset score counters and
+        # kept up to date by the 'zeijemol.update-wave-samplers' hook. The
+        # selected snapset is leased to the user so that concurrent raters
+        # are not served the same snapset. The ratings still in the
+        # write-behind buffer are excluded.
+        login = self._cw.session.login
+        sampler = self._cw.vreg.wave_samplers.get(self._cw, wave_eid, login)
+        snapset_eid = sampler.draw(
+            login, exclude=pending_scores(self._cw),
+            lease_ttl=self._cw.vreg.config["snapset_lease_ttl"])
+        # > check that the user has something to rate
+        if snapset_eid is None:
+            error = "No more snap to rate, thanks."
+            self.w(u"<div id='some-doc-about-this-wave'><h1>{0}</h1>"
+                    "</div>".format(error))
+            return
         rset = self._cw.execute("Any S Where S eid '{0}'".format(snapset_eid))
         snapset_entity = rset.get_entity(0, 0)
 
@@ -137,22 +128,15 @@ class Gallery(View):
         self.w(u'<h1>{0}</h1>'.format(title))
 
         # Dispaly status
-        nb_of_snapsets = len(nb_scores)
-        nb_snapsets_to_rate = numpy.sum(1 - nb_user_scores)
-        progress = int((1 - nb_snapsets_to_rate / nb_of_snapsets) * 100)
-        self.w(u'<div class="progress">')
-        self.w(u'<div class="progress-bar" role="progressbar" '
-               'aria-valuenow="{0}" aria-valuemin="0" aria-valuemax='
-               '"100" style="width:{0}%">'.format(progress))
-        self.w(u'{0}%'.format(progress))
-        self.w(u'</div>')
-        self.w(u"</div>")
+        self.render_progress(wave_eid, login)
+        if wave_metadata.file_only:
+            self.render_mode_link(
+                wave_name, title, self._cw.vreg.config["gallery_batch_size"])
 
         # Display/send a form
         href = self._cw.build_url("rate-controller", eid=snapset_entity.eid,
                                   wave_name=wave_name)
-        wave_entity = snapset_entity.wave[0]
-        score_definitions = json.loads(wave_entity.score_definitions)
+        score_definitions = wave_metadata.score_definitions
         form_html = []
         form_html.append(u'<div id="gallery-form">')
         form_html.append(u'<form action="{0}" method="post">'.format(href))
@@ -179,14 +163,16 @@ class Gallery(View):
         form_html.append(u'</form>')
         form_html.append(u'</div>')
 
-        # Check that all the viewers are declared
+        # Check that all the viewers are declared: the snaps and their files
+        # are loaded at once
+        snaps = snapset_entity.prefetched_snaps()
         in_error = False
-        for snap_entity in snapset_entity.snaps:
+        for snap_entity in snaps:
             if snap_entity.viewer not in self.allowed_viewers:
                 error = ("Can't find the appropriate viewer. Please contact "
                          "the service administrator specifying the '{0}' "
                          "wave viewer '{1}' is not responding "
-                         "on '{2}'.".format(wave_entity.name,
+                         "on '{2}'.".format(wave_name,
                                             snap_entity.viewer,
                                             self._cw.base_url()))
                 logger = logging.getLogger("zeijemol.gallery")
@@ -197,60 +183,48 @@ class Gallery(View):
 
         # Display all the declared snaps for this snapset
         if not in_error:
-            # > render form
+            # > render form: the answers are sent with an ajax callback that
+            # returns the next snapset, the viewers being swapped in place
             self.w("\n".join(form_html))
-            ordered_snaps = sorted(snapset_entity.snaps, key=lambda e: e.order)
-            for i, snap_entity in enumerate(ordered_snaps):
+            gallery_data = {
+                "eid": snapset_entity.eid,
+                "wave_name": wave_name,
+                "ajaxcallback": self._cw.build_url(
+                    "ajax", fname="rate_and_next"),
+                "reload_url": self._cw.build_url(
+                    "view", vid="gallery-view", wave=wave_name, title=title)}
+            self.w(u"<script>var gallery_data = {0};</script>".format(
+                json.dumps(gallery_data)))
+            self._cw.add_js("zeijemol.gallery.js")
+            for i, snap_entity in enumerate(snaps):
                 # > get external files
                 filepaths = [e.filepath for e in snap_entity.files]
                 # > display the files
                 if snap_entity.viewer == "FILE":
-                    if len(filepaths) != 1:
-                        raise ValueError(
-                            "Fatal Error: check system integrity "
-                            "'{0}'.".format(snap_entity.identifier))
-                    dtype = snap_entity.files[0].dtype
-                    with open(filepaths[0], "rb") as image_file:
-                        encoded_string = base64.b64encode(image_file.read())
-                    self.w(u'<div id="gallery-img">')
-                    if dtype.lower() == "pdf":
-                        self.w(
-                            u'<embed class="gallery-pdf" alt="Embedded PDF" '
-                             'src="data:application/pdf;base64, '
-                             '{0}" />'.format(encoded_string))
-                    else:
-                        self.w(
-                            u'<img class="gallery-img" alt="Embedded Image" '
-                             'src="data:image/{0};base64, {1}" />'.format(
-                                   dtype.lower(), encoded_string))
-                    self.w(u'</div>')
+                    self.render_file(snap_entity)
                 # > display the files containing stack of images in a triplanar
                 # view
                 elif snap_entity.viewer == "TRIPLANAR-STACK":
-                    file_data = {}
-                    for e in snap_entity.files:
-                        file_data.setdefault(e.description, []).append(
-                            (e.order, e.filepath, e.dtype))
-                    data_type = None
-                    for key in file_data.keys():
-                        if data_type is None:
-                            data_type = file_data[key][0][2]
-                        file_data[key] = [
-                            elem[1] for elem in sorted(file_data[key],
-                                                       key=lambda x: x[0])]
+                    file_data, data_type = stack_file_data(snap_entity)
                     href = self._cw.build_url(vid="triplanar-stack-viewer")
                     self.w(u'<div id="gallery-triplanar" class="leftblock">')
                     iframe_name = "iframe_{}".format(i)
                     # Add form to post png filepaths, snap eid and data type
-                    self.w(u'<form class="triplanar_form" action="{0}" '
-                           u'method="post" target="{1}">'.format(
-                                href, iframe_name))
+                    self.w(u'<form class="triplanar_form gallery-snap" '
+                           u'data-viewer="{0}" action="{1}" method="post" '
+                           u'target="{2}">'.format(
+                                snap_entity.viewer, href, iframe_name))
                     self.w(u'<input type="hidden" name="file_data" '
                            u'value=\'{}\' />'.format(json.dumps(file_data)))
                     self.w(u'<input type="hidden" name="snap_eid" '
                            u'value="{}" />'.format(snap_entity.eid))
                     self.w(u'<input type="hidden" name="data_type" '
                            u'value="{}" />'.format(data_type))
+                    # >> forward the slices pyramid level hint
+                    if "level" in self._cw.form:
+                        self.w(u'<input type="hidden" name="level" '
+                               u'value="{}" />'.format(
+                                    int(self._cw.form["level"])))
                     self.w(u'<input type="submit" style="display:none;"/>')
                     self.w(u'</form>')
                     # Add iframe to display the triplanar viewer(s)
@@ -271,9 +245,10 @@ class Gallery(View):
                             u"Found '{0}' image(s) that must be checked.".format(
                                 len(filepaths))))
                     # Add form to post data
-                    self.w(u'<form class="triplanar_form" action="{0}" '
-                           u'method="post" target="{1}">'.format(
-                                href, iframe_name))
+                    self.w(u'<form class="triplanar_form gallery-snap" '
+                           u'data-viewer="{0}" action="{1}" method="post" '
+                           u'target="{2}">'.format(
+                                snap_entity.viewer, href, iframe_name))
                     self.w(u'<input type="submit" style="display:none;"/>')
                     self.w(u'</form>')
                     # Add iframe to display the triplanar viewer(s)
@@ -287,14 +262,19 @@ class Gallery(View):
                     print href
                 # > display the surfaces
                 elif snap_entity.viewer == "SURF":
-                    self.w(u'<div id="gallery-img">')
+                    self.w(u'<div id="gallery-img" class="gallery-snap" '
+                           u'data-viewer="SURF">')
                     json_stats = self._cw.vreg.config["json_population_stats"]
                     if not os.path.isfile(json_stats):
                         json_stats = os.path.join(
                             os.path.dirname(zeijemol.__file__), "data",
                             "qcsurf", "population_mean_sd_default.json")
+                    fileurls = dict(
+                        (e.filepath, file_url(self._cw, e.eid, e.sha1hex))
+                        for e in snap_entity.files)
                     self.wview("mesh-qcsurf", None, "null",
                                filepaths=filepaths,
+                               fileurls=fileurls,
                                header=[snapset_entity.name],
                                populationpath=json_stats)
                     self.w(u'</div>')
@@ -302,3 +282,240 @@ class Gallery(View):
             # Clear float
             self.w(u'</div>')
             self.w(u'<div id="floating-clear"/>')
+
+    def call_batch(self, title, wave_name, wave_eid, extra_answers,
+                   batch_size):
+        """ Create a rate form for a grid of snapsets.
+
+        All the snapsets are rated with a single form submission.
+
+        Parameters
+        ----------
+        title: str
+            the page title.
+        wave_name: str
+            the wave name.
+        wave_eid: int
+            the wave eid.
+        extra_answers: list of str
+            the closed possible extra answers of the wave.
+        batch_size: int
+            the number of snapsets to display.
+        """
+        # Select the snapsets to be rated
+        login = self._cw.session.login
+        sampler = self._cw.vreg.wave_samplers.get(self._cw, wave_eid, login)
+        snapset_eids = sampler.draw_batch(
+            login, batch_size, exclude=pending_scores(self._cw),
+            lease_ttl=self._cw.vreg.config["snapset_lease_ttl"])
+        if len(snapset_eids) == 0:
+            error = "No more snap to rate, thanks."
+            self.w(u"<div id='some-doc-about-this-wave'><h1>{0}</h1>"
+                    "</div>".format(error))
+            return
+
+        # Display title and status
+        self.w(u'<div class="zeijemol-gallery">')
+        self.w(u'<h1>{0}</h1>'.format(title))
+        self.render_progress(wave_eid, login)
+        self.render_mode_link(wave_name, title, 1)
+
+        # Display/send a form with one block per snapset: by default the
+        # snapsets are rated later
+        score_definitions = self._cw.vreg.wave_metadata.get(
+            self._cw, wave_eid).score_definitions
+        href = self._cw.build_url("rate-controller", wave_name=wave_name,
+                                  batch=batch_size)
+        self.w(u'<div id="gallery-form">')
+        self.w(u'<form action="{0}" method="post">'.format(href))
+        self.w(u'<input type="hidden" name="eids" value="{0}"/>'.format(
+            ",".join([str(eid) for eid in snapset_eids])))
+        snapset_names = dict(self._cw.execute(
+            "Any S, N Where S eid IN ({0}), S name N".format(
+                ",".join([str(eid) for eid in snapset_eids]))))
+        snapset_snaps = prefetch_snaps(self._cw, snapset_eids)
+        for snapset_eid in snapset_eids:
+            self.w(u'<div class="gallery-batch-item">')
+            self.w(u'<h4>{0}</h4>'.format(snapset_names[snapset_eid]))
+            for snap_entity in snapset_snaps[snapset_eid]:
+                self.render_file(snap_entity)
+            for definition in score_definitions + ["Rate later"]:
+                self.w(u'<label class="radio-inline">')
+                self.w(u'<input type="radio" name="rate_{0}" value="{1}" '
+                       '{2}/>{1}'.format(
+                            snapset_eid, definition,
+                            "checked" if definition == "Rate later" else ""))
+                self.w(u'</label>')
+            for extra in extra_answers:
+                self.w(u'<div class="checkbox">')
+                self.w(u'<label>')
+                self.w(u'<input class="checkbox" type="checkbox" '
+                        'name="extra_answers_{0}" value="{1}"/>'.format(
+                            snapset_eid, extra))
+                self.w(unicode(extra))
+                self.w(u'</label>')
+                self.w(u'</div>')
+            self.w(u'</div>')
+        self.w(u'<div id="floating-clear"/>')
+        self.w(u'<input class="btn btn-success triview-btn" type="submit" '
+                'name="rate" value="Submit ratings"/>')
+        self.w(u'</form>')
+        self.w(u'</div>')
+        self.w(u'</div>')
+
+    def render_progress(self, wave_eid, login):
+        """ Display the user progress on the wave.
+        """
+        progress = self._cw.vreg.wave_completion.progress(
+            self._cw, wave_eid, login)
+        self.w(u'<div class="progress">')
+        self.w(u'<div class="progress-bar" role="progressbar" '
+               'aria-valuenow="{0}" aria-valuemin="0" aria-valuemax='
+               '"100" style="width:{0}%">'.format(progress))
+        self.w(u'{0}%'.format(progress))
+        self.w(u'</div>')
+        self.w(u"</div>")
+
+    def render_mode_link(self, wave_name, title, batch_size):
+        """ Display a link to switch between the single and batch modes.
+        """
+        href = self._cw.build_url(
+            "view", vid="gallery-view", wave=wave_name, title=title,
+            batch=batch_size)
+        label = "Batch mode" if batch_size > 1 else "Single mode"
+        self.w(u'<p><a class="btn btn-default" href="{0}">{1}</a></p>'.format(
+            href, label))
+
+    def render_file(self, snap_entity):
+        """ Display the file of a 'FILE' viewer snap.
+        """
+        files = snap_entity.files
+        if len(files) != 1:
+            raise ValueError(
+                "Fatal Error: check system integrity "
+                "'{0}'.".format(snap_entity.identifier))
+        src = file_src(self._cw, files[0])
+        self.w(u'<div id="gallery-img" class="gallery-snap" '
+               'data-viewer="FILE">')
+        if files[0].dtype.lower() == "pdf":
+            self.w(
+                u'<embed class="gallery-pdf" alt="Embedded PDF" '
+                 'src="{0}" />'.format(src))
+        else:
+            self.w(
+                u'<img class="gallery-img" alt="Embedded Image" '
+                 'src="{0}" />'.format(src))
+        self.w(u'</div>')
+
+
+def file_src(req, file_entity):
+    """ Get the source of a 'FILE' viewer file: the URL of its raw bytes,
+    cached by the browser.
+    """
+    return file_url(req, file_entity.eid, file_entity.sha1hex)
+
+
+def stack_file_data(snap_entity):
+    """ Get the ordered image files of a 'TRIPLANAR-STACK' viewer snap.
+
+    Returns
+    -------
+    file_data: dict
+        the stack names as keys with a list of ordered image files as value.
+    data_type: str
+        the images extension.
+    """
+    file_data = {}
+    for e in snap_entity.files:
+        file_data.setdefault(e.description, []).append(
+            (e.order, e.filepath, e.dtype))
+    data_type = None
+    for key in file_data.keys():
+        if data_type is None:
+            data_type = file_data[key][0][2]
+        file_data[key] = [
+            elem[1] for elem in sorted(file_data[key], key=lambda x: x[0])]
+    return file_data, data_type
+
+
+def snapset_descriptor(snapset_entity):
+    """ Describe a snapset and its snaps so that the gallery viewers can be
+    updated in place.
+
+    Only the 'FILE' and 'TRIPLANAR-STACK' viewers can be swapped: the
+    other viewers are described by their type only.
+    """
+    snaps = []
+    for snap_entity in snapset_entity.prefetched_snaps():
+        snap = {
+            "eid": snap_entity.eid,
+            "name": snap_entity.name,
+            "viewer": snap_entity.viewer}
+        if snap_entity.viewer == "FILE":
+            snap["dtype"] = snap_entity.files[0].dtype
+            snap["src"] = file_src(
+                snapset_entity._cw, snap_entity.files[0])
+        elif snap_entity.viewer == "TRIPLANAR-STACK":
+            snap["file_data"], snap["data_type"] = stack_file_data(
+                snap_entity)
+        snaps.append(snap)
+    return {
+        "eid": snapset_entity.eid,
+        "name": snapset_entity.name,
+        "snaps": snaps}
+
+
+@ajaxfunc(output_type="json")
+def rate_and_next(self):
+    """ Ajax callback used to store a score and to get the next snapset to be
+    rated.
+
+    Parameters
+    ----------
+    eid: str
+        the rated snapset eid.
+    wave_name: str
+        the wave name.
+    rate: str
+        the user score or 'Rate later'.
+    extra_answers: list of str (optional)
+        the user extra answers.
+
+    Returns
+    -------
+    data: dict
+        the next snapset descriptor with the user progress in the 'progress'
+        key. The 'eid' key is None when the user has nothing left to rate.
+    """
+    # Store the score: commit now so that the sampler is updated, or queue
+    # it in the write-behind buffer
+    login = self._cw.session.login
+    snapset_eid = int(self._cw.form["eid"])
+    rate = self._cw.form["rate"]
+    exclude = []
+    if rate != "Rate later":
+        extra_answers = self._cw.form.get("extra_answers", [])
+        if not isinstance(extra_answers, list):
+            extra_answers = [extra_answers]
+        submit_score(self._cw, self._cw.form["eid"], rate, extra_answers)
+        self._cw.cnx.commit()
+    else:
+        exclude.append(snapset_eid)
+    exclude.extend(pending_scores(self._cw))
+
+    # Select the next snapset to be rated
+    samplers = self._cw.vreg.wave_samplers
+    samplers.release(login, snapset_eid)
+    wave_eid = self._cw.vreg.wave_metadata.get(
+        self._cw, name=self._cw.form["wave_name"]).eid
+    sampler = samplers.get(self._cw, wave_eid, login)
+    next_eid = sampler.draw(
+        login, exclude=exclude,
+        lease_ttl=self._cw.vreg.config["snapset_lease_ttl"])
+    if next_eid is None:
+        data = {"eid": None}
+    else:
+        data = snapset_descriptor(self._cw.entity_from_eid(next_eid))
+    data["progress"] = self._cw.vreg.wave_completion.progress(
+        self._cw, wave_eid, login)
+    return data
@@ -8,12 +8,10 @@
 
 # System import
 from __future__ import division
-import base64
 import json
 import os
 
 # Cubicweb import
-from cubicweb.web.views.ajaxcontroller import ajaxfunc
 from cubicweb.view import View
 
 
@@ -24,7 +22,7 @@ class QcSurf(View):
     div_id = "mesh-qcsurf"
     naat_url = "http://neuroanatomy.github.io/"
 
-    def call(self, filepaths, header, populationpath):
+    def call(self, filepaths, fileurls, header, populationpath):
         """ Create a mesh from a CTM compressed mesh file.
 
         This procedure expect to find the freesurfer files in the standard
@@ -40,6 +38,8 @@ class QcSurf(View):
             /fsdir/surf/<hemi>.pial -
             /fsdir/stats/<hemi>.aparc.stats
             Six files are expected.
+        fileurls: dict
+            the URLs of the files raw bytes by file path.
         header: list of str
             something to display in the viewer overlay.
         populationpath: str
@@ -50,7 +50,7 @@ class QcSurf(View):
             raise ValueError("Fatal Error: six files are expected "
                              "'{0}'.".format(header))
 
-        # Build the path to the freesurfer images
+        # Build the URLs of the freesurfer images
         fs_struct = {}
         for hemi in ["rh", "lh"]:
             fs_struct[hemi] = {}
@@ -67,17 +67,14 @@ class QcSurf(View):
                             "Fatal Error: one surface and one stat file "
                             "expected '{0}'.".format(header))
                 fs_struct[hemi][surf] = {
-                    "mesh": surffiles[0],
-                    "stats": statsfiles[0]
+                    "mesh": fileurls[surffiles[0]],
+                    "stats": fileurls[statsfiles[0]]
                 }
 
         # Load the population statistic
         with open(populationpath, "r") as open_file:
             population_stats = json.load(open_file)
 
-        # Construct the data accessor url
-        ajaxcallback = self._cw.build_url("ajax", fname="get_ctm_rawdata")
-
         # Add tool tip
         header += ["Press 'c' to change the texture."]       
 
@@ -89,7 +86,6 @@ class QcSurf(View):
         self.w(u'var jsctmworker="{0}";'.format(jsctmworker))
         self.w(u'var pop_stats={0};'.format(json.dumps(population_stats)))
         self.w(u'var populationpath="{0}";'.format(populationpath))
-        self.w(u'var ajaxcallback="{0}";'.format(ajaxcallback))
         self.w(u'var fs_struct={0};'.format(json.dumps(fs_struct)))
         self.w(u'var hemi="rh";')
         self.w(u'var surf="white";')
@@ -132,38 +128,3 @@ class QcSurf(View):
         self.w(u'get_new_data();')
         self.w(u'animate();')
         self.w(u'</script>')
-
-
-@ajaxfunc(output_type="json")
-def get_ctm_rawdata(self):
-    """ Get CTM raw data.
-
-    Parameters
-    ----------
-    ctmfile: str
-        the ctm file path.
-    statsfile: str
-        the stats file path.
-
-    Returns
-    -------
-    data: dict
-        the raw data are associated to the 'encoded_mesh' key, and the stats
-        to the 'statlines' key.
-    """
-    # Get parameters
-    ctmfile = self._cw.form["ctmfile"]
-    statsfile = self._cw.form["statsfile"]
-
-    # Encode the mesh binary buffer that will be decoded in the CTMLoader.
-    with open(ctmfile, "rb") as open_file:
-        encoded_mesh = base64.b64encode(open_file.read())
-
-    # Load the stats file
-    with open(statsfile) as open_file:
-        statlines = open_file.readlines()
-
-    # Format the ajax data
-    data = {"encoded_mesh": encoded_mesh, "statlines": statlines}
-
-    return data
@@ -19,6 +19,9 @@ from cubicweb.view import View
 from cubicweb.predicates import authenticated_user
 from cubicweb.predicates import match_user_groups
 
+# Package import
+from cubes.zeijemol.cache import progress
+
 
 class ZEIJEMOLNotRaterIndexView(IndexView):
     """ Class that defines the index view.
@@ -53,32 +56,16 @@ class ZEIJEMOLRaterIndexView(IndexView):
         """ Create the loggedin 'index' page of our site.
         """
         # Get information to display a summary table with one progress bar
-        # for each wave
-        rset = self._cw.execute(
-            "Any S, W, N, C Where S is SnapSet, S wave W, W name N, "
-            "W category C")
-        struct = {}
-        for index, row in enumerate(rset):
-            wave_name = row[2]
-            category = row[3]
-            struct.setdefault(category, {}).setdefault(wave_name, []).append(
-                rset.get_entity(index, 0))
+        # for each wave: use the completion cache kept up to date by the
+        # 'zeijemol.update-wave-samplers' hook
+        completion = self._cw.vreg.wave_completion.completion(
+            self._cw, self._cw.session.login)
+        completion = completion[completion.nb_snapsets > 0]
         waves_progress = {}
-        for category, wave_struct in struct.items():
-            for wave_name, snapset in wave_struct.items():
-                nb_of_snapset= len(snapset)
-                nb_rates = 0
-                for entity in snapset:
-                    scores = [
-                        e for e in entity.scores
-                        if e.scored_by[0].login == self._cw.session.login]
-                    if len(scores) == 1:
-                        nb_rates += 1
-                    elif len(scores) > 1:
-                        raise Exception(
-                            "We expect one score per user for one snap.")
-                waves_progress.setdefault(category, []).append(
-                    (wave_name, int(nb_rates / nb_of_snapset * 100)))
+        for wave_name, category, wave_progress in zip(
+                completion.name, completion.category, progress(completion)):
+            waves_progress.setdefault(category, []).append(
+                (wave_name, int(wave_progress)))
 
         # Format template
         template = self._cw.vreg.template_env.get_template("startup.logged.jinja2")
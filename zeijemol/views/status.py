@@ -10,15 +10,41 @@
 from __future__ import division
 import os
 import json
-import time
-from StringIO import StringIO
-import csv
+import hashlib
+import datetime
 
 # CW import
+from cubicweb import Unauthorized
 from cubicweb.view import View
+from cubicweb.web.views.ajaxcontroller import ajaxfunc
+from cubicweb.web.httpcache import EtagHTTPCacheManager
+from logilab.mtconverter import xml_escape
 from cubicweb.predicates import match_user_groups
 from cubicweb.predicates import authenticated_user
 
+# Zeijemol import
+from cubes.zeijemol.queries import RATINGS_LABELS
+from cubes.zeijemol.queries import RATINGS_PAGE_MAX_LENGTH
+from cubes.zeijemol.queries import ratings_page
+from cubes.zeijemol.queries import ratings_filters
+from cubes.zeijemol.queries import score_summary
+from cubes.zeijemol.queries import status_tables
+
+
+class RatingsHTTPCacheManager(EtagHTTPCacheManager):
+    """ Validate the status pages with an etag derived from the scores of
+    each wave, the waves metadata and the user.
+
+    The browser revalidates the page on each request and gets a
+    '304 Not Modified' answer when nothing changed.
+    """
+    def etag(self):
+        return "{0}/{1}".format(self.view.__regid__, ratings_validator(self.req))
+
+    def last_modified(self):
+        ratings_validator(self.req)
+        return self.req.data["zeijemol-last-modified"]
+
 
 class Status(View):
     """ Custom view to display rate status.
@@ -29,63 +55,107 @@ class Status(View):
     __regid__ = "status-view"
     title = "Status"
     __select__ = authenticated_user()
+    http_cache_manager = RatingsHTTPCacheManager
 
     def call(self, **kwargs):
         """ Create the status table.
+
+        For the managers, the tables are then updated in place with the
+        rating counters deltas long-polled from the status feed.
         """
-        # Get all the rated snaps ordered by wave name and by raters
+        # Construct all table: one for each wave, the tables are cached
+        # until the scores change
         self.w(u"<div class='zeijemol-status'>")
-        rset = self._cw.execute(
-            "Any WN, SC, UN Where W is Wave, W name WN, W snapsets S, "
-            "S scores R, R score SC, R scored_by U, "
-            "U login UN")
-        if rset.rowcount == 0:
+        tables = self._cw.vreg.status_payloads.get(
+            "status/{0}".format(ratings_validator(self._cw)),
+            lambda: status_tables(self._cw))
+        if len(tables) == 0:
             self.w(u"<h1>No score in the database yet.</h1>")
-        snapsets_struct = {}
-        for wave_name, score, rater in rset:
-            snapsets_struct.setdefault(wave_name, {}).setdefault(
-                rater, []).append(score)
-
-        # Get the waves possible scores, ie. table headers
-        rset = self._cw.execute(
-            "Any WN, SC Where W is Wave, W name WN, W score_definitions SC")
-        waves_struct = {}
-        for wave_name, score_definition in rset:
-            waves_struct[wave_name] = json.loads(score_definition)
-
-        # Construct all table: one for each wave
-        for index, wave_name in enumerate(snapsets_struct):
-
-            # Get wave data and labels
-            labels = ["UID", "Number of rates"] + waves_struct[
-                wave_name]
-            records = []
-            wave_struct = snapsets_struct[wave_name]
-
-            # Get the number of snaps associated to the current wave
-            rset = self._cw.execute("Any COUNT(S) Where W is Wave, W name "
-                                    "'{0}', W snapsets S".format(wave_name))
-            nb_of_snapsets = rset[0][0]
-
-            # Fill the record
-            for rater, scores in wave_struct.items():
-                nb_rates = len(scores)
-                rater_record = [
-                    rater,
-                    "{0}/{1}".format(nb_rates, nb_of_snapsets)]
-                for score_definition in waves_struct[wave_name]:
-                    number_score_definitions = scores.count(score_definition)
-                    rater_record.append("{0}/{1}".format(
-                        number_score_definitions, nb_rates))
-                records.append(rater_record)
+        live = (self._cw.user.is_in_group("managers") and
+                self._cw.vreg.config["status_feed_timeout"] > 0)
+        for index, (wave_name, labels, records) in enumerate(tables):
 
             # Call JTableView for html generation of the table
             self.wview("jtable-clientside", None, "null", labels=labels,
                        records=records, csv_export=True, index=index,
                        elts_to_sort=["UID"],
-                       title="{0} status".format(wave_name))
+                       title="{0} status".format(wave_name),
+                       csv_url=self._cw.build_url(
+                           "csv-export", table="status", wave=wave_name),
+                       live_key=wave_name if live else None)
         self.w(u"</div>")
 
+        # Start the live updates from the feed state the tables match
+        if live:
+            epoch, seq = self._cw.data["zeijemol-feed-state"]
+            status_feed_data = {
+                "ajaxcallback": self._cw.build_url(
+                    "ajax", fname="status_feed"),
+                "epoch": epoch,
+                "seq": seq}
+            self.w(u"<script>var status_feed_data = {0};</script>".format(
+                json.dumps(status_feed_data)))
+            self._cw.add_js("zeijemol.status.js")
+
+
+@ajaxfunc(output_type="json")
+def status_feed(self):
+    """ Ajax callback long-polling the rating counters deltas committed
+    after the 'seq' sequence number of the 'epoch' status feed.
+
+    Returns
+    -------
+    data: dict
+        the feed 'epoch', the 'seq' sequence number of the last delta and
+        the 'deltas', None if the page must be reloaded.
+    """
+    if not self._cw.user.is_in_group("managers"):
+        raise Unauthorized("Only managers can follow the status feed.")
+    feed = self._cw.vreg.status_feed
+    seq, deltas = feed.since(
+        self._cw.form.get("epoch"), int(self._cw.form.get("seq", 0)),
+        timeout=self._cw.vreg.config["status_feed_timeout"])
+    return {"epoch": feed.epoch, "seq": seq, "deltas": deltas}
+
+
+def ratings_validator(req):
+    """ Compute a validator of the scores visible by the current user.
+
+    The validator changes whenever a score is added to, removed from or
+    modified in a wave, the rating counters deltas are published in the
+    status feed, the waves metadata or snapsets change, or the user changes.
+    It is computed once per request with the status feed state and the
+    last score modification date, the epoch if there is no score.
+
+    Parameters
+    ----------
+    req: CubicWeb request
+        the current request.
+
+    Returns
+    -------
+    validator: str
+        the validator.
+    """
+    if "zeijemol-ratings-validator" not in req.data:
+        feed = req.vreg.status_feed
+        req.data["zeijemol-feed-state"] = (feed.epoch, feed.seq)
+        completion = req.vreg.wave_completion.completion(req, req.user.login)
+        summary = score_summary(req)
+        req.data["zeijemol-last-modified"] = max(
+            [last_date for _, _, _, last_date in summary] or
+            [datetime.datetime(1970, 1, 1)])
+        summary = [(wave_eid, nb_scores, last_eid, last_date.isoformat())
+                   for wave_eid, nb_scores, last_eid, last_date in summary]
+        state = [req.user.login, sorted(req.user.groups),
+                 req.data["zeijemol-feed-state"],
+                 req.vreg.wave_metadata.version, summary,
+                 sorted(zip(completion.eid.tolist(),
+                            completion.nb_snapsets.tolist()))]
+        req.data["zeijemol-ratings-validator"] = hashlib.md5(
+            json.dumps(state)).hexdigest()
+    return req.data["zeijemol-ratings-validator"]
+
 
 class Ratings(View):
     """ Custom view to display rate status per subject.
@@ -96,55 +166,120 @@ class Ratings(View):
     __regid__ = "ratings-view"
     title = "Admin status"
     __select__ = authenticated_user() & match_user_groups("managers")
+    http_cache_manager = RatingsHTTPCacheManager
 
     def call(self, **kwargs):
         """ Create the rates table.
+
+        The 'wave', 'rater', 'answer', 'from_date' and 'to_date' request
+        parameters restrict the table to a slice of the ratings. Only the
+        first page of the table is rendered, the next pages are fetched with
+        the 'ratings_table' ajax callback.
         """
-        # Get all the rated snaps ordered by wave name and by raters
+        # Get the first page of the filtered rated snaps ordered by raters
         self.w(u"<div class='zeijemol-status'>")
-        rset = self._cw.execute(
-            "Any WN, SN, D, SC, ESC, UN Where W is Wave, W name WN, "
-            "W snapsets S, S name SN, S scores R, R creation_date D, "
-            "R score SC, R extra_scores ESC, R scored_by U, U login UN")
-        if rset.rowcount == 0:
-            self.w(u"<h1>No score in the database yet.</h1>")
+        filters = ratings_filters(self._cw.form)
+        self.filters_form(filters)
+        try:
+            nb_records, nb_filtered, records = (
+                self._cw.vreg.status_payloads.get(
+                    "ratings/{0}/{1}".format(
+                        ratings_validator(self._cw),
+                        json.dumps(sorted(filters.items()))),
+                    lambda: ratings_page(self._cw, filters=filters)))
+        except ValueError as error:
+            self.w(u"<h1>{0}</h1>".format(xml_escape(unicode(error))))
+            self.w(u"</div>")
+            return
+        if nb_records == 0:
+            self.w(u"<h1>No score matching the filters.</h1>" if filters
+                   else u"<h1>No score in the database yet.</h1>")
+            self.w(u"</div>")
             return
-        snapsets_struct = {}
-        for wave_name, sid, timestamp, score, extra_score, rater in rset:
-            snapsets_struct.setdefault(wave_name, {}).setdefault(
-                rater, []).append((timestamp, score, extra_score, sid))
-
-        # Get the waves possible scores, ie. table headers
-        rset = self._cw.execute(
-            "Any WN, SC Where W is Wave, W name WN, W score_definitions SC")
-        waves_struct = {}
-        for wave_name, score_definition in rset:
-            waves_struct[wave_name] = json.loads(score_definition)
-
-        # Construct all table
-        labels = ["UID", "TIMESTAMP", "WAVE NAME", "SID", "ANSWER",
-                  "EXTRA ANSWERS"]
-        records = []
-        for index, wave_name in enumerate(snapsets_struct):
-
-            # Fill the record
-            wave_struct = snapsets_struct[wave_name]
-            for rater, scores_struct in wave_struct.items():
-                for timestamp, answers, extra_answers, sid in scores_struct:
-                    extra_answers = json.loads(extra_answers)
-                    if not isinstance(extra_answers, list):
-                        extra_answers = [extra_answers]
-                    extra_answers = ",".join(extra_answers)
-                    records.append([rater, timestamp.isoformat(), wave_name,
-                                    sid, answers, extra_answers])
 
         # Call JTableView for html generation of the table
-        self.wview("jtable-clientside", None, "null", labels=labels,
-                   records=records, csv_export=True, index=index,
-                   elts_to_sort=["UID"],
-                   title="Ratings".format(wave_name))
+        self.wview("jtable-clientside", None, "null", labels=RATINGS_LABELS,
+                   records=records, csv_export=True, index=0,
+                   elts_to_sort=["UID"], title="Ratings",
+                   ajax_fname="ratings_table", ajax_params=filters,
+                   nb_records=nb_records, nb_filtered=nb_filtered,
+                   csv_url=self._cw.build_url(
+                       "csv-export", table="ratings", **filters))
+        self.w(u'<p><a class="btn btn-default" role="button" href="{0}">'
+               u'NPZ Export &#187;</a></p>'.format(xml_escape(
+                    self._cw.build_url("npz-export", **filters))))
         self.w(u"</div>")
 
+    def filters_form(self, filters):
+        """ Create the form filtering the ratings by wave, rater, answer and
+        creation date range.
+
+        Parameters
+        ----------
+        filters: dict
+            the current filters.
+        """
+        waves = self._cw.vreg.wave_metadata.all(self._cw)
+        self.w(u'<form class="form-inline" action="{0}" method="get">'.format(
+            xml_escape(self._cw.build_url("view"))))
+        self.w(u'<input type="hidden" name="vid" value="ratings-view"/>')
+        self.w(u'<select class="form-control" name="wave">')
+        self.w(u'<option value="">All waves</option>')
+        for wave_name in sorted(metadata.name for metadata in waves):
+            self.w(u'<option value="{0}"{1}>{0}</option>'.format(
+                xml_escape(wave_name),
+                u' selected="selected"' if filters.get("wave") == wave_name
+                else u""))
+        self.w(u'</select>')
+        for name, input_type, placeholder in (
+                ("rater", "text", "Rater login"),
+                ("answer", "text", "Answer"),
+                ("from_date", "date", "From (YYYY-MM-DD)"),
+                ("to_date", "date", "To (YYYY-MM-DD)")):
+            self.w(u'<input class="form-control" type="{0}" name="{1}" '
+                   u'placeholder="{2}" title="{2}" value="{3}"/>'.format(
+                        input_type, name, placeholder,
+                        xml_escape(filters.get(name, u""))))
+        self.w(u'<input class="btn btn-info" type="submit" value="Filter"/>')
+        self.w(u'<a class="btn btn-default" href="{0}">Reset</a>'.format(
+            xml_escape(self._cw.build_url("view", vid="ratings-view"))))
+        self.w(u'</form>')
+
+
+@ajaxfunc(output_type="json")
+def ratings_table(self):
+    """ Ajax callback implementing the DataTables server-side processing of
+    the Ratings table, restricted by the Ratings view filters.
+
+    Returns
+    -------
+    data: dict
+        the DataTables 'draw', 'recordsTotal', 'recordsFiltered' and 'data'
+        keys.
+    """
+    if not self._cw.user.is_in_group("managers"):
+        raise Unauthorized("Only managers can see the ratings.")
+    form = self._cw.form
+    # > the whole table is never served at once
+    try:
+        start = max(int(form.get("start", 0)), 0)
+        length = min(max(int(form.get("length", 10)), 1),
+                     RATINGS_PAGE_MAX_LENGTH)
+    except ValueError:
+        start, length = 0, 10
+    nb_records, nb_filtered, records = ratings_page(
+        self._cw,
+        start=start,
+        length=length,
+        search=form.get("search[value]", "").strip(),
+        sort_dir=form.get("order[0][dir]", "asc"),
+        filters=ratings_filters(form))
+    return {
+        "draw": int(form.get("draw", 0)),
+        "recordsTotal": nb_records,
+        "recordsFiltered": nb_filtered,
+        "data": records}
+
 
 class JTableView(View):
     """ Create a table view with DataTables.
@@ -161,12 +296,16 @@ class JTableView(View):
              jquery_js="http://code.jquery.com/jquery-1.11.3.min.js",
              jquery_url="https://code.jquery.com/ui/1.11.3",
              fixedcolumns_url="https://cdn.datatables.net/fixedcolumns/3.2.0",
-             filteringdelay_url="https://cdn.datatables.net/plug-ins/1.10.10"):
+             filteringdelay_url="https://cdn.datatables.net/plug-ins/1.10.10",
+             ajax_fname=None, ajax_params=None, nb_records=None,
+             nb_filtered=None, csv_url=None, live_key=None):
         """ Method that will create a table with client-side processing only.
          It is useful for huge datasets (million of entries).
 
         An Ajax call is emulated within the JavaScript so this function is
-        client side only.
+        client side only, unless an ajax callback is specified: in this case
+        the records only contain the first page of the table and the
+        paging, sorting and search are processed server side.
 
         Parameters
         ----------
@@ -177,16 +316,33 @@ class JTableView(View):
         title: string
             the title of the table.
         csv_export: bool (optional)
-            if True an export button will be available.
+            if True and a CSV export URL is specified an export button will
+            be available.
         elts_to_sort: list (optional, default [])
             labels of the columns to be sorted
         index: int (optional, default 0)
             increment this parameter to insert multiple tables in the same
             page.
+        ajax_fname: str (optional, default None)
+            the name of an ajax callback implementing the DataTables
+            server-side processing protocol.
+        ajax_params: dict (optional, default None)
+            extra parameters sent to the ajax callback.
+        nb_records: int (optional, default None)
+            the total number of records, only used with an ajax callback.
+        nb_filtered: int (optional, default None)
+            the number of filtered records, only used with an ajax callback.
+        csv_url: str (optional, default None)
+            the URL of the table CSV export.
+        live_key: str (optional, default None)
+            if specified with a client side table, the table data are
+            exposed in the 'zeijemol_tables' javascript object with this key
+            so that they can be updated in place.
         """
         # Set default element to sort
         if elts_to_sort is None:
             elts_to_sort = []
+        csv_export = csv_export and csv_url is not None
 
         # Add css resources
         self._cw.add_css(
@@ -232,78 +388,97 @@ class JTableView(View):
         html = "<script type='text/javascript'> "
         html += "$(document).ready(function() {"
 
-        # > dumps the answers rset into javascript
-        html += "var all_data = {0};".format(json.dumps(records))
-        html += "var nbrecordstotal = {0};".format(len(records))
-        # > create a cache for search patterns filtering
-        html += "var filtered_indices = ['', undefined];"
-        # > set the default sorting direction
-        html += "var sort_dir = 'asc';"
-
-        # > create the table
-        html += "var table = $('#the_table_{0}').dataTable( {{ ".format(index)
-        html += "serverSide: true,"
-
-        # > set the ajax callback to fill dynamically the table
-        html += "ajax: function ( data, callback, settings ) {"
-        # > get the table sorting direction
-        html += "var current_sort_dir = data.order[0].dir.toLowerCase();"
-        html += "if ( current_sort_dir != sort_dir) {"
-        html += "all_data = all_data.reverse();"
-        html += "sort_dir = current_sort_dir;"
-        html += "}"
-        # > create the records array for the page beeing displayed
-        html += "var out = [];"
-        # > get the ID search field
-        html += "var search_pattern = data.search.value.toLowerCase().trim();"
-        html += "var nbrecordsfiltered = nbrecordstotal;"
-        # > if the search field is not empty
-        html += "if (search_pattern != '') {"
-        # check the filtered indicies cache
-        html += "if (filtered_indices[0] != search_pattern) {"
-        html += "filtered_indices[0] = search_pattern;"
-        html += "filtered_indices[1] = [];"
-        # fill the filtered indicies cache
-        html += "for ( var i=0; i<nbrecordstotal ; i++ ) {"
-        html += ("if (all_data[i][0].toLowerCase()"
-                 ".indexOf(search_pattern) >= 0) {")
-        html += "filtered_indices[1].push(i);"
-        # close the 'if some occurence of the search pattern is found' loop
-        html += "}"
-        # close the for loop
-        html += "}"
-        # > close the filtered indices cache verification
-        html += "}"
-        html += "nbrecordsfiltered = filtered_indices[1].length;"
-        # fill the records array based on the filtered indicies
-        html += ("for (var i=data.start, ien=Math.min(data.start+data.length, "
-                 "nbrecordsfiltered) ; i<ien ; i++) {")
-        html += "out.push( all_data[ filtered_indices[1][i] ] );"
-        html += "}"
-        # > close the 'if the search field is not empty' condition
-        html += "}"
-        # > if the search field is empty
-        html += "else {"
-        # fill the records array without filtering
-        html += ("for ( var i=data.start, ien=Math.min(data.start+data.length,"
-                 " nbrecordstotal) ; i<ien ; i++ ) {")
-        html += "out.push( all_data[i] );"
-        # > close the for loop
-        html += "}"
-        # > close the 'else if the search field is empty' condition
-        html += "}"
-        # register the ajax callback
-        html += "setTimeout( function () {"
-        html += "callback( {"
-        html += "draw: data.draw,"
-        html += "data: out,"
-        html += "recordsTotal: nbrecordstotal,"
-        html += "recordsFiltered: nbrecordsfiltered"
-        html += "} );"
-        # > close the ajax callback registration
-        html += "}, 50 );"
-        # > close the ajax callback
-        html += "},"
+        # > set the server side processing callback: the first page is
+        # rendered in the table body
+        if ajax_fname is not None:
+            ajax_url = self._cw.build_url(
+                "ajax", fname=ajax_fname, **(ajax_params or {}))
+            html += "var table = $('#the_table_{0}').dataTable( {{ ".format(
+                index)
+            html += "serverSide: true,"
+            html += "ajax: {{url: '{0}', type: 'POST'}},".format(ajax_url)
+            html += "deferLoading: [{0}, {1}],".format(
+                nb_filtered, nb_records)
+            html += "order: [[0, 'asc']],"
+        else:
+            # > dumps the answers rset into javascript
+            html += "var all_data = {0};".format(json.dumps(records))
+            html += "var nbrecordstotal = {0};".format(len(records))
+            # > create a cache for search patterns filtering
+            html += "var filtered_indices = ['', undefined];"
+            # > set the default sorting direction
+            html += "var sort_dir = 'asc';"
+
+            # > create the table
+            html += "var table = $('#the_table_{0}').dataTable( {{ ".format(index)
+            html += "serverSide: true,"
+
+            # > set the ajax callback to fill dynamically the table
+            html += "ajax: function ( data, callback, settings ) {"
+            # > the data may be updated in place: reset the records count
+            # and the filtered indices cache
+            html += "if (all_data.length != nbrecordstotal) {"
+            html += "nbrecordstotal = all_data.length;"
+            html += "filtered_indices[0] = '';"
+            html += "}"
+            # > get the table sorting direction
+            html += "var current_sort_dir = data.order[0].dir.toLowerCase();"
+            html += "if ( current_sort_dir != sort_dir) {"
+            html += "all_data = all_data.reverse();"
+            html += "sort_dir = current_sort_dir;"
+            html += "}"
+            # > create the records array for the page beeing displayed
+            html += "var out = [];"
+            # > get the ID search field
+            html += "var search_pattern = data.search.value.toLowerCase().trim();"
+            html += "var nbrecordsfiltered = nbrecordstotal;"
+            # > if the search field is not empty
+            html += "if (search_pattern != '') {"
+            # check the filtered indicies cache
+            html += "if (filtered_indices[0] != search_pattern) {"
+            html += "filtered_indices[0] = search_pattern;"
+            html += "filtered_indices[1] = [];"
+            # fill the filtered indicies cache
+            html += "for ( var i=0; i<nbrecordstotal ; i++ ) {"
+            html += ("if (all_data[i][0].toLowerCase()"
+                     ".indexOf(search_pattern) >= 0) {")
+            html += "filtered_indices[1].push(i);"
+            # close the 'if some occurence of the search pattern is found' loop
+            html += "}"
+            # close the for loop
+            html += "}"
+            # > close the filtered indices cache verification
+            html += "}"
+            html += "nbrecordsfiltered = filtered_indices[1].length;"
+            # fill the records array based on the filtered indicies
+            html += ("for (var i=data.start, ien=Math.min(data.start+data.length, "
+                     "nbrecordsfiltered) ; i<ien ; i++) {")
+            html += "out.push( all_data[ filtered_indices[1][i] ] );"
+            html += "}"
+            # > close the 'if the search field is not empty' condition
+            html += "}"
+            # > if the search field is empty
+            html += "else {"
+            # fill the records array without filtering
+            html += ("for ( var i=data.start, ien=Math.min(data.start+data.length,"
+                     " nbrecordstotal) ; i<ien ; i++ ) {")
+            html += "out.push( all_data[i] );"
+            # > close the for loop
+            html += "}"
+            # > close the 'else if the search field is empty' condition
+            html += "}"
+            # register the ajax callback
+            html += "setTimeout( function () {"
+            html += "callback( {"
+            html += "draw: data.draw,"
+            html += "data: out,"
+            html += "recordsTotal: nbrecordstotal,"
+            html += "recordsFiltered: nbrecordsfiltered"
+            html += "} );"
+            # > close the ajax callback registration
+            html += "}, 50 );"
+            # > close the ajax callback
+            html += "},"
 
         # > set table display options
         html += "'scrollCollapse': true,"
@@ -335,50 +510,27 @@ class JTableView(View):
         html += ");"
         html += "table.fnSetFilteringDelay(1000);"
 
+        # > expose the table data to be updated in place
+        if live_key is not None and ajax_fname is None:
+            html += "window.zeijemol_tables = window.zeijemol_tables || {};"
+            html += ("zeijemol_tables[{0}] = {{labels: {1}, data: all_data, "
+                     "table: table}};".format(json.dumps(live_key),
+                                              json.dumps(labels)))
+
         if csv_export:
 
-            # > create a new csv download button
+            # > create a new csv download button: the csv file is streamed
+            # by the export controller
             csv_button_html = (u'<p><a class="btn btn-default" role="button" '
-                               u'id="csv_button">CSV Export &#187;</a></p>')
-            html += u"$('div.toolbar').html('{0}');".format(csv_button_html)
+                               u'href="{0}">CSV Export &#187;</a></p>'.format(
+                                    xml_escape(csv_url)))
+            html += u"$('#the_table_{0}_wrapper div.toolbar').html('{1}');".format(
+                index, csv_button_html)
 
             # > center the search-bar
             html += ("$('#the_table_filter').css({'float': 'none', "
                      "'text-align': 'center'});")
 
-            # > set csv file name
-            timestamp = time.strftime("%Y-%m-%d_%H:%M:%S")
-            filename = "_".join([title, timestamp])
-
-            # > assign ajax callback to csv button : start function click
-            html += "$('#csv_button').click(function() {"
-
-            # > create in-memory csv file using python csv module
-            f = StringIO()
-            writer = csv.writer(f, delimiter=';')
-            # write the headers
-            writer.writerow(labels)
-            # write all the rows
-            writer.writerows(records)
-            # get the csv result as string
-            result = f.getvalue()
-
-            # > csv file javascript insertion with html compatibility
-            # (line break character)
-            html += "var result = '{0}';".format(
-                    result.replace("\r\n", "\\r\\n"))
-            # > create a web-browser download object
-            html += "var a = window.document.createElement('a');"
-            html += ("a.href = window.URL.createObjectURL(new Blob([result], "
-                     "{type: 'text/csv'}));")
-            html += "a.download = '{0}.csv';".format(filename)
-            html += "document.body.appendChild(a);"
-            html += "a.click();"
-            html += "document.body.removeChild(a);"
-
-            # > end fct click
-            html += "});"
-
         # > close document section
         html += "} );"
 
@@ -391,7 +543,14 @@ class JTableView(View):
         # > display the table in the body
         html += "<table id='the_table_{0}' class='cell-border display'>".format(index)
         html += "<thead></thead>"
-        html += "<tbody></tbody>"
+        html += "<tbody>"
+        if ajax_fname is not None:
+            for record in records:
+                html += "<tr>"
+                for cell in record:
+                    html += u"<td>{0}</td>".format(xml_escape(unicode(cell)))
+                html += "</tr>"
+        html += "</tbody>"
         html += "</table>"
 
         # Creat the corrsponding html page
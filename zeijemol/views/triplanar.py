@@ -13,7 +13,6 @@ import json
 import os
 import nibabel
 import numpy
-from PIL import Image
 
 # CW import
 from cubicweb import _
@@ -21,6 +20,10 @@ from cubicweb.view import View
 from cubicweb.web.views.ajaxcontroller import ajaxfunc
 from cubicweb.predicates import authenticated_user
 
+# Zeijemol import
+from cubes.zeijemol.images import PYRAMID_LEVELS
+from cubes.zeijemol.views.files import file_url
+
 
 ###############################################################################
 # Display a stack of images as a triplanar view
@@ -59,6 +62,11 @@ class TriplanarStackViewer(View):
             a list of ordered image files as value.
         data_type: str (mandatory)
             the image to display extension.
+        level: int (optional)
+            the pyramid level of the slices loaded in the background: 1, 2
+            or 4, by default chosen by the client from its connection and
+            the canvas sizes. The displayed slice is always upgraded to the
+            full resolution.
         """
         # Define parameters
         snap_eid = self._cw.form["snap_eid"]
@@ -66,6 +74,7 @@ class TriplanarStackViewer(View):
         data_type = self._cw.form["data_type"]
         error = self.error_message.format(snap_eid)
         brightness = 100
+        atlases = stack_atlases(self._cw, snap_eid)
 
         # Add JS and CSS resources for the sliders and triview
         self.w(u'<script type="text/javascript" '
@@ -80,10 +89,22 @@ class TriplanarStackViewer(View):
             href = self._cw.data_url(path)
             self.w(u'<link type="text/css" rel="stylesheet" href="{0}">'.format(href))
 
-        # Check inputs
+        # Check inputs: the stacks packed in atlases are checked at import,
+        # the other stacks from the images size stored at import
         orientations = ["sagittal", "coronal", "axial"]
         shapes = {}
         nb_slices = {}
+        if atlases is not None:
+            file_data = {}
+            for orient, atlas in atlases.items():
+                shapes[orient] = tuple(atlas["tile"])
+                nb_slices[orient] = atlas["nb_slices"] - 1
+        else:
+            sizes = dict(
+                (filepath, (width, height))
+                for filepath, width, height in self._cw.execute(
+                    "Any P, W, H Where S eid %(s)s, S files F, F filepath P, "
+                    "F width W, F height H", {"s": snap_eid}))
         for orient in file_data:
             # > check orientation
             if orient not in orientations:
@@ -96,16 +117,17 @@ class TriplanarStackViewer(View):
             stack_size = None
             nb_slices[orient] = len(file_data[orient]) - 1
             for path in file_data[orient]:
-                with Image.open(path) as open_image:
-                    if stack_size is None:
-                        stack_size = open_image.size
-                        shapes[orient] = stack_size
-                    elif stack_size != open_image.size:
-                        self.w(u"<h1>{0}</h1>".format(error))
-                        self.w(u"<script>")
-                        self.w(u"disableTriViewBtn();")
-                        self.w(u"</script>")
-                        return
+                size = sizes.get(path, (None, None))
+                if None in size or (stack_size is not None and
+                                    size != stack_size):
+                    self.w(u"<h1>{0}</h1>".format(error))
+                    self.w(u"<script>")
+                    self.w(u"disableTriViewBtn();")
+                    self.w(u"</script>")
+                    return
+                if stack_size is None:
+                    stack_size = size
+                    shapes[orient] = stack_size
 
         # Add an hidden loading image
         html = "<div id='loading-msg' style='display: none;' align='center'>"
@@ -145,17 +167,36 @@ class TriplanarStackViewer(View):
         html += "</div>"
 
         # Construct the data accessor url
-        ajaxcallback = self._cw.build_url("ajax", fname="get_b64_images")
+        ajaxcallback = self._cw.build_url("ajax", fname="get_slice_range")
+
+        # The pyramid level hint, by default chosen by the client
+        level = self._cw.form.get("level")
+        if level is not None:
+            level = int(level)
+            if level not in PYRAMID_LEVELS:
+                raise ValueError("Unknown pyramid level '{0}'.".format(level))
 
         # Create javascript global variables
         triview_data = {
             "dtype": data_type.lower(),
             "file_data": file_data,
+            "snap_eid": snap_eid,
             "ajaxcallback": ajaxcallback,
-            "orientations": file_data.keys(),
+            "orientations": shapes.keys(),
             "brightness": 100,
             "shapes": shapes,
-            "nb_slices": nb_slices}
+            "nb_slices": nb_slices,
+            "levels": PYRAMID_LEVELS,
+            "level": level}
+        # > the atlases are only served at full resolution: a downscaled
+        #   atlas mixes the pixels of neighbouring tiles
+        if atlases is not None:
+            triview_data["atlases"] = dict(
+                (orient, {"tile": atlas["tile"], "columns": atlas["columns"],
+                          "nb_slices": atlas["nb_slices"],
+                          "src": file_url(self._cw, atlas["eid"],
+                                          atlas["sha1hex"])})
+                for orient, atlas in atlases.items())
         html += "<script>"
         html += "var triview_data = {0};".format(json.dumps(triview_data))
         html += "</script>"
@@ -173,19 +214,59 @@ class TriplanarStackViewer(View):
 
 
 @ajaxfunc(output_type="json")
-def get_b64_images(self):
-    """ Ajax callback used to load images in the 'file_data' form in base64.
+def get_slice_range(self):
+    """ Ajax callback used to get the URLs of the slices of the 'orient'
+    stack of the 'snap_eid' snap from the 'start' index to the 'stop' index
+    (excluded), downscaled to the 'level' pyramid level.
+
+    The viewer first loads the middle slices so that the snap can be rated
+    before the whole stacks are loaded.
+    """
+    start = max(int(self._cw.form["start"]), 0)
+    stop = int(self._cw.form["stop"])
+    level = int(self._cw.form.get("level", 1))
+    rset = self._cw.execute(
+        "Any F, H, O ORDERBY O LIMIT {0} OFFSET {1} Where S eid %(s)s, "
+        "S files F, F description %(o)s, F sha1hex H, F order O".format(
+            max(stop - start, 0), start),
+        {"s": self._cw.form["snap_eid"], "o": self._cw.form["orient"]})
+    urls = [file_url(self._cw, file_eid, sha1hex, level)
+            for file_eid, sha1hex, _ in rset]
+    return {"start": start, "urls": urls}
+
+
+def stack_atlases(cnx, snap_eid):
+    """ Get the atlases of a 'TRIPLANAR-STACK' snap.
+
+    Parameters
+    ----------
+    cnx: Connection or request
+        used to execute the queries.
+    snap_eid: int
+        the snap eid.
+
+    Returns
+    -------
+    atlases: dict or None
+        the orientations as keys and the atlas index completed with the
+        atlas file 'eid', 'filepath' and 'sha1hex' as values, None if the
+        snap stacks are not packed.
     """
-    file_data = json.loads(self._cw.form["file_data"])
-    output = {}
-    for orient, fpaths in file_data.items():
-        encoded_images = []
-        for path in fpaths:
-            with open(path, "rb") as open_image:
-                encoded_image = base64.b64encode(open_image.read())
-                encoded_images.append(encoded_image)
-        output[orient] = encoded_images
-    return output
+    rset = cnx.execute("Any A Where S eid %(s)s, S atlas_index A",
+                       {"s": snap_eid})
+    if rset.rowcount != 1 or rset[0][0] is None:
+        return None
+    atlases = json.loads(rset[0][0])
+    rset = cnx.execute(
+        "Any F, P, D, H Where S eid %(s)s, S atlases F, F filepath P, "
+        "F description D, F sha1hex H", {"s": snap_eid})
+    for file_eid, filepath, orient, sha1hex in rset:
+        if orient in atlases:
+            atlases[orient].update({
+                "eid": file_eid, "filepath": filepath, "sha1hex": sha1hex})
+    if any("filepath" not in atlas for atlas in atlases.values()):
+        return None
+    return atlases
 
 
 ###############################################################################